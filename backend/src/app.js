@@ -20,6 +20,9 @@ const path = require('path');
 const app = express();
 
 app.use(cors());
+// spooled metrics replays are larger than the default 100kb (the agent caps
+// them at 512 KiB of JSON); parsed here first, the global parser skips them
+app.use('/api/agent/metrics/replay', express.json({ limit: '2mb' }));
 app.use(express.json());
 app.use(morgan('combined'));
 app.use(fileUpload());
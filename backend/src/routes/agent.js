@@ -2,6 +2,8 @@ const express = require("express");
 const { pool } = require("../db");
 const path = require("path");
 const fs = require("fs");
+const { EventEmitter } = require("events");
+const { recordAgentTelemetry } = require("../utils/metrics");
 const router = express.Router();
 require("dotenv").config();
 
@@ -51,11 +53,18 @@ host=${host.ip_address}
 username=${host.username}
 pem_path=/opt/oneagent/key.pem
 interval=30
+long_poll=25
 EOF
 
 curl -s -o /opt/oneagent/agent.py ${backend}/static/agent/agent.py
 curl -s -o /opt/oneagent/discovery.py ${backend}/static/agent/discovery.py
 curl -s -o /opt/oneagent/utils.py ${backend}/static/agent/utils.py
+curl -s -o /opt/oneagent/procfs.py ${backend}/static/agent/procfs.py
+curl -s -o /opt/oneagent/matcher.py ${backend}/static/agent/matcher.py
+curl -s -o /opt/oneagent/sampler.py ${backend}/static/agent/sampler.py
+curl -s -o /opt/oneagent/spool.py ${backend}/static/agent/spool.py
+curl -s -o /opt/oneagent/telemetry.py ${backend}/static/agent/telemetry.py
+curl -s -o /opt/oneagent/profiler.py ${backend}/static/agent/profiler.py
 chmod +x /opt/oneagent/agent.py
 
 cat <<EOF > /etc/systemd/system/oneagent.service
@@ -90,11 +99,16 @@ echo "Agent installed successfully."
 /* =========================================================================
    2) GET COMMAND FOR AGENT
    Stored in `servers.pending_command`
+
+   Long-poll: with ?wait=N (seconds, max 55) and nothing pending, the
+   request is held until /send-command queues a command for this server
+   (same process) or N seconds pass, then answers like the plain GET.
    ========================================================================= */
-router.get("/command", async (req, res) => {
-  const { server_id } = req.query;
-  if (!server_id) return res.status(400).send("server_id required");
+const LONG_POLL_MAX_SEC = 55;
+const commandWaiters = new EventEmitter();
+commandWaiters.setMaxListeners(0);
 
+async function readCommand(server_id) {
   const q = await pool.query(
     `SELECT pending_command, last_command_at 
      FROM servers WHERE server_id=$1`,
@@ -102,12 +116,48 @@ router.get("/command", async (req, res) => {
   );
 
   if (!q.rows.length || !q.rows[0].pending_command)
-    return res.json({ command: null });
+    return { command: null };
 
-  return res.json({
+  return {
     command: q.rows[0].pending_command,
     id: server_id, // used only to ack complete
-  });
+  };
+}
+
+router.get("/command", async (req, res) => {
+  const { server_id } = req.query;
+  if (!server_id) return res.status(400).send("server_id required");
+
+  try {
+    const current = await readCommand(server_id);
+    const wait = Math.min(parseInt(req.query.wait, 10) || 0, LONG_POLL_MAX_SEC);
+    if (current.command || wait <= 0) return res.json(current);
+
+    const key = String(server_id);
+    let timer = null;
+    const cleanup = () => {
+      clearTimeout(timer);
+      commandWaiters.removeListener(key, finish);
+      res.removeListener("close", cleanup);
+    };
+    async function finish() {
+      cleanup();
+      if (res.writableEnded) return;
+      try {
+        res.json(await readCommand(server_id));
+      } catch (err) {
+        console.error("command long-poll failed:", err);
+        res.status(500).json({ error: "failed to read command" });
+      }
+    }
+
+    timer = setTimeout(finish, wait * 1000);
+    commandWaiters.once(key, finish);
+    res.on("close", cleanup);
+  } catch (err) {
+    console.error("get command failed:", err);
+    res.status(500).json({ error: "failed to read command" });
+  }
 });
 
 /* =========================================================================
@@ -145,96 +195,274 @@ router.get("/service-patterns", async (req, res) => {
 /* =========================================================================
    5) SERVICE DISCOVERY PROCESSING
    inserts/updates into services + inserts into service_metrics
+
+   v1: { server_id, services: [full service dicts] }
+   v2: { v: 2, server_id, seq, base_seq, full, upsert, removed, metrics }
+       (gzip body, inflated by express.json) — only changed services are
+       upserted and all metrics go in one INSERT. A delta whose base_seq is
+       not servers.discovery_seq gets 409 { seq } and the agent resends a
+       full snapshot. A full snapshot replaces the server's state: services
+       it does not list are marked stopped.
    ========================================================================= */
+async function upsertService(client, server_id, svc) {
+  const { name, technology, command_pattern, pid, user, ports, cwd, status } = svc;
+
+  // CREATE or UPDATE base service entry
+  const existing = await client.query(
+    `SELECT service_id FROM services WHERE server_id=$1 AND name=$2 LIMIT 1`,
+    [server_id, name]
+  );
+
+  if (existing.rows.length) {
+    const service_id = existing.rows[0].service_id;
+    await client.query(
+      `UPDATE services SET
+        technology=$1,
+        command_pattern=$2,
+        pid=$3,
+        user=$4,
+        ports=$5,
+        cwd=$6,
+        status=$7,
+        updated_at=NOW()
+       WHERE service_id=$8`,
+      [technology, command_pattern, pid, user, ports, cwd, status, service_id]
+    );
+    return service_id;
+  }
+
+  const ins = await client.query(
+    `INSERT INTO services(server_id,name,technology,command_pattern,pid,user,ports,cwd,status)
+     VALUES($1,$2,$3,$4,$5,$6,$7,$8,$9)
+     RETURNING service_id`,
+    [server_id, name, technology, command_pattern, pid, user, ports, cwd, status]
+  );
+  return ins.rows[0].service_id;
+}
+
+// m = [name, cpu, mem, status, rollup?]
+// rollup = [samples, cpu_min, cpu_max, cpu_avg, cpu_p95, mem_min, mem_max, mem_avg, mem_p95]
+// collected_at: epoch seconds from the agent (null = now)
+async function insertMetrics(client, server_id, metrics, collected_at) {
+  if (!metrics.length) return;
+  const rollup = (m, i) => (Array.isArray(m[4]) ? m[4][i] : null);
+  await client.query(
+    `INSERT INTO service_metrics(server_id,service_id,cpu_usage,memory_usage,status,
+                                 samples,cpu_min,cpu_max,cpu_p95,mem_min,mem_max,mem_p95,
+                                 collected_at)
+     SELECT $1, s.service_id, m.cpu, m.mem, m.status,
+            m.samples, m.cpu_min, m.cpu_max, m.cpu_p95, m.mem_min, m.mem_max, m.mem_p95,
+            COALESCE(to_timestamp($13::float8), NOW())
+     FROM unnest($2::text[], $3::float8[], $4::float8[], $5::text[],
+                 $6::int[], $7::float8[], $8::float8[], $9::float8[],
+                 $10::float8[], $11::float8[], $12::float8[])
+          AS m(name, cpu, mem, status,
+               samples, cpu_min, cpu_max, cpu_p95, mem_min, mem_max, mem_p95)
+     JOIN (SELECT DISTINCT ON (name) name, service_id
+           FROM services WHERE server_id=$1
+           ORDER BY name, service_id) s ON s.name = m.name`,
+    [
+      server_id,
+      metrics.map((m) => m[0]),
+      metrics.map((m) => m[1]),
+      metrics.map((m) => m[2]),
+      metrics.map((m) => m[3]),
+      metrics.map((m) => rollup(m, 0)),
+      metrics.map((m) => rollup(m, 1)),
+      metrics.map((m) => rollup(m, 2)),
+      metrics.map((m) => rollup(m, 4)),
+      metrics.map((m) => rollup(m, 5)),
+      metrics.map((m) => rollup(m, 6)),
+      metrics.map((m) => rollup(m, 8)),
+      collected_at ?? null,
+    ]
+  );
+}
+
+async function saveDiscoveryDelta(client, body, res) {
+  const { server_id, seq, base_seq, full } = body;
+  const upsert = body.upsert || [];
+  const removed = body.removed || [];
+  const metrics = body.metrics || [];
+
+  await client.query("BEGIN");
+  const cur = await client.query(
+    `SELECT discovery_seq FROM servers WHERE server_id=$1 FOR UPDATE`,
+    [server_id]
+  );
+  if (!cur.rows.length) {
+    await client.query("ROLLBACK");
+    return res.status(404).json({ error: "unknown server" });
+  }
+
+  const current = cur.rows[0].discovery_seq;
+  if (!full && String(base_seq) !== String(current)) {
+    await client.query("ROLLBACK");
+    return res.status(409).json({ error: "seq_mismatch", seq: current });
+  }
+
+  for (const svc of upsert) {
+    await upsertService(client, server_id, svc);
+  }
+
+  let stopped = removed.length;
+  if (full) {
+    const gone = await client.query(
+      `UPDATE services SET status='stopped', pid=NULL, updated_at=NOW()
+       WHERE server_id=$1 AND status IS DISTINCT FROM 'stopped'
+         AND NOT (name = ANY($2::text[]))`,
+      [server_id, upsert.map((svc) => svc.name)]
+    );
+    stopped = gone.rowCount;
+  } else if (removed.length) {
+    await client.query(
+      `UPDATE services SET status='stopped', pid=NULL, updated_at=NOW()
+       WHERE server_id=$1 AND name = ANY($2::text[])`,
+      [server_id, removed]
+    );
+  }
+
+  // metrics snapshot: one row per reported service, one statement
+  await insertMetrics(client, server_id, metrics, body.collected_at);
+
+  await client.query(
+    `UPDATE servers SET discovery_seq=$1 WHERE server_id=$2`,
+    [seq, server_id]
+  );
+  await client.query("COMMIT");
+
+  return res.json({
+    status: "ok",
+    seq,
+    upserted: upsert.length,
+    removed: stopped,
+    saved: metrics.length,
+  });
+}
+
 router.post("/discovery", async (req, res) => {
   const client = await pool.connect();
   try {
+    if (req.body.v === 2) {
+      if (!req.body.server_id || req.body.seq === undefined)
+        return res.status(400).send("server_id + seq required");
+      return await saveDiscoveryDelta(client, req.body, res);
+    }
+
     const { server_id, services } = req.body;
     if (!server_id || !services)
       return res.status(400).send("server_id + services required");
 
     for (const svc of services) {
-      const {
-        name,
-        technology,
-        command_pattern,
-        pid,
-        user,
-        ports,
-        cwd,
-        status,
-        cpu_usage,
-        memory_usage,
-      } = svc;
-
-      // CREATE or UPDATE base service entry
-      const existing = await client.query(
-        `SELECT service_id FROM services WHERE server_id=$1 AND name=$2 LIMIT 1`,
-        [server_id, name]
-      );
-
-      let service_id;
-      if (existing.rows.length) {
-        service_id = existing.rows[0].service_id;
-        await client.query(
-          `UPDATE services SET
-            technology=$1,
-            command_pattern=$2,
-            pid=$3,
-            user=$4,
-            ports=$5,
-            cwd=$6,
-            status=$7,
-            updated_at=NOW()
-           WHERE service_id=$8`,
-          [
-            technology,
-            command_pattern,
-            pid,
-            user,
-            ports,
-            cwd,
-            status,
-            service_id,
-          ]
-        );
-      } else {
-        const ins = await client.query(
-          `INSERT INTO services(server_id,name,technology,command_pattern,pid,user,ports,cwd,status)
-           VALUES($1,$2,$3,$4,$5,$6,$7,$8,$9)
-           RETURNING service_id`,
-          [
-            server_id,
-            name,
-            technology,
-            command_pattern,
-            pid,
-            user,
-            ports,
-            cwd,
-            status,
-          ]
-        );
-        service_id = ins.rows[0].service_id;
-      }
+      const service_id = await upsertService(client, server_id, svc);
 
       // save metrics snapshot
       await client.query(
         `INSERT INTO service_metrics(server_id,service_id,cpu_usage,memory_usage,status)
          VALUES($1,$2,$3,$4,$5)`,
-        [server_id, service_id, cpu_usage, memory_usage, status]
+        [server_id, service_id, svc.cpu_usage, svc.memory_usage, svc.status]
       );
     }
 
     res.json({ status: "ok", saved: services.length });
   } catch (err) {
     console.error("discovery saving failed:", err);
+    await client.query("ROLLBACK").catch(() => {});
     res.status(500).json({ error: "failed to save services + metrics" });
   } finally {
     client.release();
   }
 });
 
+/* =========================================================================
+   6) REPLAY OF SPOOLED METRICS
+   { server_id, batches: [{ collected_at, metrics }] } — uploads the agent
+   could not deliver, kept on disk and sent oldest first once we are back.
+   Rows keep their original collected_at. The body is parsed with a 2mb
+   limit (app.js); the agent sends at most 512 KiB of JSON per request.
+   ========================================================================= */
+router.post("/metrics/replay", async (req, res) => {
+  const { server_id, batches } = req.body;
+  if (!server_id || !Array.isArray(batches))
+    return res.status(400).send("server_id + batches required");
+
+  const client = await pool.connect();
+  try {
+    await client.query("BEGIN");
+    let saved = 0;
+    for (const batch of batches) {
+      const metrics = batch.metrics || [];
+      await insertMetrics(client, server_id, metrics, batch.collected_at);
+      saved += metrics.length;
+    }
+    await client.query("COMMIT");
+    res.json({ status: "ok", batches: batches.length, saved });
+  } catch (err) {
+    console.error("metrics replay failed:", err);
+    await client.query("ROLLBACK").catch(() => {});
+    res.status(500).json({ error: "failed to save replayed metrics" });
+  } finally {
+    client.release();
+  }
+});
+
+/* =========================================================================
+   7) AGENT SELF-TELEMETRY
+   { server_id, families: [{ name, type, help, samples: [[name, labels, value]] }] }
+   pushed every telemetry_push seconds; re-exposed on /metrics with a
+   server_id label (see utils/metrics.js).
+   ========================================================================= */
+router.post("/telemetry", (req, res) => {
+  const { server_id, families } = req.body;
+  if (!server_id || !Array.isArray(families))
+    return res.status(400).send("server_id + families required");
+
+  res.json({ status: "ok", ...recordAgentTelemetry(server_id, families) });
+});
+
+/* =========================================================================
+   8) AGENT PROFILES
+   Started with the "profile" / "profile:<seconds>" command (or
+   profile_seconds in config.ini) and uploaded on the agent's next cycle:
+   { server_id, name, format: "collapsed", data }.
+   Stored as uploads/profiles/server_<id>/<name>; the collapsed stacks load
+   directly in speedscope or flamegraph.pl.
+   ========================================================================= */
+const PROFILE_DIR = path.join(__dirname, "../../uploads/profiles");
+const PROFILE_NAME = /^[\w.-]+\.folded$/;
+
+router.post("/profile", async (req, res) => {
+  const { server_id, name, data } = req.body;
+  if (!server_id || !PROFILE_NAME.test(name || "") || typeof data !== "string")
+    return res.status(400).send("server_id + name (*.folded) + data required");
+
+  try {
+    const dir = path.join(PROFILE_DIR, `server_${parseInt(server_id, 10)}`);
+    await fs.promises.mkdir(dir, { recursive: true });
+    await fs.promises.writeFile(path.join(dir, name), data);
+    res.json({ status: "ok", name, bytes: Buffer.byteLength(data) });
+  } catch (err) {
+    console.error("profile upload failed:", err);
+    res.status(500).json({ error: "failed to store profile" });
+  }
+});
+
+router.get("/profiles", async (req, res) => {
+  const { server_id, name } = req.query;
+  if (!server_id) return res.status(400).send("server_id required");
+  const dir = path.join(PROFILE_DIR, `server_${parseInt(server_id, 10)}`);
+
+  if (name) {
+    if (!PROFILE_NAME.test(name)) return res.status(400).send("bad name");
+    return res.sendFile(path.join(dir, name), (err) => {
+      if (err && !res.headersSent) res.status(404).send("profile not found");
+    });
+  }
+
+  const names = await fs.promises.readdir(dir).catch(() => []);
+  res.json(names.filter((n) => PROFILE_NAME.test(n)).sort().reverse());
+});
+
 /* =========================================================================
    SEND COMMAND TO AGENT FROM UI
    This populates servers.pending_command -> agent picks it up
@@ -254,6 +482,8 @@ router.post("/send-command", async (req, res) => {
        WHERE server_id=$2`,
       [command, server_id]
     );
+    // wake a long-polling agent right away
+    commandWaiters.emit(String(server_id));
 
     return res.json({ success: true, message: `Command '${command}' sent` });
   } catch (err) {
@@ -10,29 +10,141 @@ async function runModel(payload) {
 
 const { spawn } = require('child_process');
 const path = require('path');
+const readline = require('readline');
 
-function runModelLocal(args = []) {
-  return new Promise((resolve, reject) => {
-    const py = spawn('python', [path.join(__dirname, '../../python-service/model_stub.py'), ...args]);
+const MODEL_STUB = path.join(__dirname, '../../../python-service/model_stub.py');
+const LOCAL_WORKERS = parseInt(process.env.MODEL_LOCAL_WORKERS || '2', 10);
+const LOCAL_MAX_REQUESTS = parseInt(process.env.MODEL_LOCAL_MAX_REQUESTS || '1000', 10);
+const LOCAL_HEARTBEAT_SEC = 5;
+const LOCAL_TIMEOUT_MS = 120000;
 
-    let out = '';
-    let err = '';
+/**
+ * Warm `model_stub.py --worker` processes speaking NDJSON over stdio.
+ * Requests are tagged with an id and pipelined to the worker with the fewest
+ * pending requests. A worker that asks to be recycled gets no new requests,
+ * is replaced at once and has its stdin closed when its last answer is in;
+ * one that exits or misses three heartbeats is replaced and its pending
+ * requests rejected.
+ */
+class ModelWorkerPool {
+  constructor(size = LOCAL_WORKERS) {
+    this.size = size;
+    this.workers = new Set();
+    this.nextId = 1;
+    this.healthTimer = null;
+  }
 
-    py.stdout.on('data', (d) => out += d.toString());
-    py.stderr.on('data', (d) => err += d.toString());
+  spawnWorker() {
+    const proc = spawn('python', [
+      MODEL_STUB, '--worker',
+      '--max-requests', String(LOCAL_MAX_REQUESTS),
+      '--heartbeat', String(LOCAL_HEARTBEAT_SEC)
+    ]);
+    const worker = { proc, pending: new Map(), draining: false, lastSeen: Date.now() };
+    this.workers.add(worker);
 
-    py.on('close', (code) => {
-      if (code !== 0) {
-        return reject(new Error(`python exited ${code}: ${err}`));
-      }
-      try {
-        const parsed = JSON.parse(out);
-        resolve(parsed);
-      } catch (e) {
-        resolve(out);
+    readline.createInterface({ input: proc.stdout }).on('line', (line) => this.onMessage(worker, line));
+    proc.stderr.on('data', (d) => logger.warn(`model worker ${proc.pid}: ${d.toString().trim()}`));
+    proc.stdin.on('error', () => {});
+    proc.on('exit', (code) => this.onExit(worker, code));
+    proc.on('error', (err) => this.onExit(worker, err.message));
+    return worker;
+  }
+
+  onMessage(worker, line) {
+    worker.lastSeen = Date.now();
+    let msg;
+    try {
+      msg = JSON.parse(line);
+    } catch (e) {
+      logger.warn(`model worker ${worker.proc.pid} wrote non-JSON: ${line}`);
+      return;
+    }
+
+    if (msg.type === 'recycle') {
+      this.retire(worker);
+      return;
+    }
+    if (msg.id === undefined || msg.id === null || !worker.pending.has(msg.id)) return;
+
+    const { resolve, reject, timer } = worker.pending.get(msg.id);
+    worker.pending.delete(msg.id);
+    clearTimeout(timer);
+    if (msg.ok === false) reject(new Error(msg.error));
+    else resolve(msg.type === 'pong' ? msg : { ok: true, result: msg.result });
+
+    if (worker.draining && worker.pending.size === 0) worker.proc.stdin.end();
+  }
+
+  retire(worker) {
+    if (worker.draining) return;
+    worker.draining = true;
+    this.workers.delete(worker);
+    this.ensureWorkers();
+    if (worker.pending.size === 0) worker.proc.stdin.end();
+  }
+
+  onExit(worker, code) {
+    if (worker.exited) return;
+    worker.exited = true;
+    this.workers.delete(worker);
+    for (const { reject, timer } of worker.pending.values()) {
+      clearTimeout(timer);
+      reject(new Error(`model worker exited (${code})`));
+    }
+    worker.pending.clear();
+    if (!worker.draining) {
+      // back off a little so a worker that cannot start does not spin
+      logger.warn(`model worker ${worker.proc.pid} exited (${code}), respawning`);
+      setTimeout(() => this.ensureWorkers(), 1000).unref();
+    }
+  }
+
+  checkHealth() {
+    const limit = LOCAL_HEARTBEAT_SEC * 3 * 1000;
+    for (const worker of this.workers) {
+      if (Date.now() - worker.lastSeen > limit) {
+        logger.warn(`model worker ${worker.proc.pid} missed heartbeats, killing`);
+        worker.proc.kill('SIGKILL');
       }
+    }
+  }
+
+  ensureWorkers() {
+    if (!this.healthTimer) {
+      this.healthTimer = setInterval(() => this.checkHealth(), LOCAL_HEARTBEAT_SEC * 1000);
+      this.healthTimer.unref();
+    }
+    while (this.workers.size < this.size) this.spawnWorker();
+  }
+
+  request(message, timeoutMs = LOCAL_TIMEOUT_MS) {
+    this.ensureWorkers();
+    let worker = null;
+    for (const w of this.workers) {
+      if (!worker || w.pending.size < worker.pending.size) worker = w;
+    }
+
+    const id = this.nextId++;
+    return new Promise((resolve, reject) => {
+      const timer = setTimeout(() => {
+        worker.pending.delete(id);
+        reject(new Error(`model worker timed out after ${timeoutMs}ms`));
+      }, timeoutMs);
+      worker.pending.set(id, { resolve, reject, timer });
+      worker.proc.stdin.write(JSON.stringify({ id, ...message }) + '\n');
     });
-  });
+  }
+}
+
+const localPool = new ModelWorkerPool();
+
+function runModelLocal(args = []) {
+  return localPool.request({ type: 'run', input: args.length ? { args } : {} });
+}
+
+function pingModelLocal() {
+  return localPool.request({ type: 'ping' }, LOCAL_HEARTBEAT_SEC * 1000);
 }
 
-module.exports = { runModel, runModelLocal };
+module.exports = { runModel, runModelLocal, pingModelLocal };
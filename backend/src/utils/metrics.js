@@ -8,7 +8,70 @@ const requestCounter = new client.Counter({
   help: 'Total number of requests'
 });
 
+/* -------------------------------------------------------------------------
+   Agent self-telemetry pushed to POST /api/agent/telemetry.
+   Every pushed sample (counters, gauges, histogram _bucket/_sum/_count) is
+   re-exposed as a gauge with an extra server_id label; an agent that stops
+   pushing drops out after AGENT_TELEMETRY_TTL_MS.
+   ------------------------------------------------------------------------- */
+const AGENT_METRIC_NAME = /^(oneagent|log_monitor)_[a-zA-Z0-9_]*$/;
+const AGENT_TELEMETRY_TTL_MS = 10 * 60 * 1000;
+
+const agentGauges = new Map(); // sample name -> { gauge, labelNames }
+const agentSeries = new Map(); // server_id -> { at, series: [[gauge, labels]] }
+
+function agentGauge(name, help, labelNames) {
+  let entry = agentGauges.get(name);
+  if (!entry) {
+    entry = {
+      gauge: new client.Gauge({ name, help: help || name, labelNames }),
+      labelNames: labelNames.join(',')
+    };
+    agentGauges.set(name, entry);
+  }
+  return entry.labelNames === labelNames.join(',') ? entry.gauge : null;
+}
+
+function forgetAgent(server_id) {
+  const previous = agentSeries.get(server_id);
+  if (!previous) return;
+  for (const [gauge, labels] of previous.series) gauge.remove(labels);
+  agentSeries.delete(server_id);
+}
+
+function recordAgentTelemetry(server_id, families) {
+  server_id = String(server_id);
+  forgetAgent(server_id);
+
+  const series = [];
+  let skipped = 0;
+  for (const family of families) {
+    for (const [name, sampleLabels, value] of family.samples || []) {
+      const labels = { ...(sampleLabels || {}), server_id };
+      const gauge = AGENT_METRIC_NAME.test(name) && typeof value === 'number'
+        ? agentGauge(name, family.help, Object.keys(labels).sort())
+        : null;
+      if (!gauge) {
+        skipped += 1;
+        continue;
+      }
+      gauge.set(labels, value);
+      series.push([gauge, labels]);
+    }
+  }
+  agentSeries.set(server_id, { at: Date.now(), series });
+  return { saved: series.length, skipped };
+}
+
+setInterval(() => {
+  const cutoff = Date.now() - AGENT_TELEMETRY_TTL_MS;
+  for (const [server_id, entry] of agentSeries) {
+    if (entry.at < cutoff) forgetAgent(server_id);
+  }
+}, 60 * 1000).unref();
+
 module.exports = {
   client,
-  requestCounter
+  requestCounter,
+  recordAgentTelemetry
 };
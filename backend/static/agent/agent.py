@@ -1,43 +1,83 @@
 # agent.py
+import gzip
+import json
+import os
+import random
+import threading
 import time
+from urllib.parse import urlsplit
 import requests
+from requests.adapters import HTTPAdapter
 from utils import load_config, setup_logger
-from discovery import discover_services
+from discovery import ERRORS, PHASE_SECONDS, discover_services
+from profiler import StackSampler, mark_uploaded, parse_command, pending_profiles
+from sampler import MetricSampler
+from spool import Spool
+from telemetry import REGISTRY, SIZE_BUCKETS, serve
 
 logger = setup_logger("oneagent")
 
+HTTP_SECONDS = REGISTRY.histogram(
+    "oneagent_http_request_seconds", "Backend call latency until the response headers",
+    ("endpoint", "status")
+)
+UPLOAD_BYTES = REGISTRY.histogram(
+    "oneagent_upload_bytes", "Compressed request body sizes", ("endpoint",), buckets=SIZE_BUCKETS
+)
 
-def get_command(backend: str, server_id: str):
-    """GET /api/agent/command"""
+
+def _observe_http(resp, *args, **kwargs):
+    HTTP_SECONDS.observe(resp.elapsed.total_seconds(),
+                         endpoint=urlsplit(resp.url).path, status=f"{resp.status_code // 100}xx")
+
+
+# one keep-alive connection pool to the backend for every call
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+session.hooks["response"].append(_observe_http)
+
+
+def get_command(backend: str, server_id: str, wait: int = 0):
+    """
+    GET /api/agent/command
+    wait > 0 long-polls: the backend holds the request up to `wait` seconds
+    and answers as soon as a command is queued for this server.
+    """
     try:
-        resp = requests.get(
+        resp = session.get(
             f"{backend}/api/agent/command",
-            params={"server_id": server_id},
-            timeout=10
+            params={"server_id": server_id, "wait": wait},
+            timeout=wait + 10
         )
         resp.raise_for_status()
         return resp.json()
     except Exception as e:
         logger.error(f"Failed to fetch command: {e}")
+        ERRORS.inc(where="get_command")
         return {"command": None}
 
 
 def mark_command_complete(backend: str, command_id: int):
     """POST /api/agent/command/complete"""
     try:
-        requests.post(
+        resp = session.post(
             f"{backend}/api/agent/command/complete",
             json={"id": command_id},
             timeout=10
         )
+        resp.raise_for_status()
+        return True
     except Exception as e:
         logger.error(f"Failed to mark command complete: {e}")
+        ERRORS.inc(where="command_complete")
+        return False
 
 
 def fetch_service_patterns(backend: str, server_id: str):
     """GET /api/agent/service-patterns"""
     try:
-        resp = requests.get(
+        resp = session.get(
             f"{backend}/api/agent/service-patterns",
             params={"server_id": server_id},
             timeout=10
@@ -46,25 +86,259 @@ def fetch_service_patterns(backend: str, server_id: str):
         return resp.json()
     except Exception as e:
         logger.error(f"Failed to fetch service patterns: {e}")
+        ERRORS.inc(where="service_patterns")
         return []
 
 
-def send_discovery_results(backend: str, server_id: str, services):
+# service fields stored by the backend; a change in any of them is re-sent
+IDENTITY_FIELDS = ("technology", "command_pattern", "pid", "user", "ports", "cwd", "status")
+
+
+class DiscoveryUploader:
     """
-    POST /api/agent/discovery
-    MUST contain : service identity + cpu/memory metrics
+    Delta discovery uploads (POST /api/agent/discovery, protocol v2).
+
+    Keeps the last snapshot the backend acknowledged and its sequence number.
+    Each cycle sends, gzip-compressed:
+      upsert  - services (identity fields only) added or changed since then
+      removed - names no longer reported
+      metrics - [name, cpu, mem, status, rollup] per discovered service,
+                rollup = [samples, cpu min/max/avg/p95, mem min/max/avg/p95]
+                from the 1 s sampler (null before its first interval)
+    with base_seq = the acknowledged seq. The backend answers 409 when its
+    seq differs (restart, lost ack, another writer); the agent then sends a
+    full snapshot (every service in upsert) and continues from there.
+
+    When the upload fails, its metrics are appended to `spool` (with their
+    collection time) for SpoolReplayer to deliver later.
     """
-    payload = {"server_id": server_id, "services": services}
 
-    try:
-        requests.post(
-            f"{backend}/api/agent/discovery",
-            json=payload,
+    def __init__(self, backend: str, server_id: str, spool: Spool = None):
+        self.backend = backend
+        self.server_id = server_id
+        self.spool = spool
+        self.acked = None       # {name: identity dict} last acknowledged
+        self.seq = 0
+
+    @staticmethod
+    def _snapshot(services):
+        # several processes may match one name: the backend keeps the last
+        return {s["name"]: {f: s.get(f) for f in IDENTITY_FIELDS} for s in services}
+
+    @staticmethod
+    def _metrics(services):
+        # services the sampler lost (pid gone) keep their identity but send no metrics
+        return [
+            [s["name"], s.get("cpu_usage"), s.get("memory_usage"), s.get("status"), s.get("rollup")]
+            for s in services if s.get("sampled", True)
+        ]
+
+    def _payload(self, snapshot, metrics, collected_at, full):
+        if full:
+            upsert, removed = snapshot, []
+        else:
+            upsert = {n: i for n, i in snapshot.items() if self.acked.get(n) != i}
+            removed = [n for n in self.acked if n not in snapshot]
+        return {
+            "v": 2,
+            "server_id": self.server_id,
+            "seq": self.seq + 1,
+            "base_seq": None if full else self.seq,
+            "full": full,
+            "collected_at": collected_at,
+            "upsert": [{"name": n, **i} for n, i in upsert.items()],
+            "removed": removed,
+            "metrics": metrics
+        }
+
+    def _post(self, payload):
+        body = gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        UPLOAD_BYTES.observe(len(body), endpoint="/api/agent/discovery")
+        return session.post(
+            f"{self.backend}/api/agent/discovery",
+            data=body,
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
             timeout=20
+        ), len(body)
+
+    def send(self, services):
+        with PHASE_SECONDS.time(phase="upload", scanner=""):
+            return self._send(services)
+
+    def _send(self, services):
+        snapshot = self._snapshot(services)
+        metrics = self._metrics(services)
+        collected_at = time.time()
+        full = self.acked is None
+        try:
+            for _ in range(2):
+                payload = self._payload(snapshot, metrics, collected_at, full)
+                resp, size = self._post(payload)
+                if resp.status_code == 409 and not full:
+                    logger.warning(f"Discovery seq mismatch (sent base {self.seq}, "
+                                   f"backend has {resp.json().get('seq')}), sending full snapshot")
+                    full = True
+                    continue
+                resp.raise_for_status()
+                self.acked = snapshot
+                self.seq = payload["seq"]
+                logger.info(f"Discovery sent → {len(services)} services, {len(payload['upsert'])} changed, "
+                            f"{len(payload['removed'])} removed, {size} bytes{' (full)' if full else ''}")
+                return True
+        except Exception as e:
+            logger.error(f"Failed to send discovery results: {e}")
+            ERRORS.inc(where="discovery_upload")
+            if self.spool is not None and metrics:
+                self.spool.append({"collected_at": collected_at, "metrics": metrics})
+                logger.info(f"Spooled {len(metrics)} metrics for replay")
+        return False
+
+
+class SpoolReplayer:
+    """
+    Drains the spool to POST /api/agent/metrics/replay on a background
+    thread, oldest first: up to `batch_records` spooled uploads and
+    `max_body_bytes` of uncompressed JSON per request (the backend's parser
+    limit for the route is checked after gzip is inflated), and at most one
+    request per `min_interval` seconds. While the backend is
+    down it backs off exponentially with jitter (up to `max_backoff`), so a
+    fleet of agents coming back after an outage does not retry in lockstep.
+    """
+
+    def __init__(self, backend: str, server_id: str, spool: Spool, batch_records: int = 200,
+                 max_body_bytes: int = 512 << 10, min_interval: float = 1.0, idle: float = 5.0,
+                 max_backoff: float = 300.0):
+        self.backend = backend
+        self.server_id = server_id
+        self.spool = spool
+        self.batch_records = batch_records
+        self.max_body_bytes = max_body_bytes
+        self.min_interval = min_interval
+        self.idle = idle
+        self.max_backoff = max_backoff
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+            self._thread.start()
+
+    def _post(self, records):
+        body = gzip.compress(json.dumps(
+            {"server_id": self.server_id, "batches": records}, separators=(",", ":")
+        ).encode("utf-8"))
+        UPLOAD_BYTES.observe(len(body), endpoint="/api/agent/metrics/replay")
+        resp = session.post(
+            f"{self.backend}/api/agent/metrics/replay",
+            data=body,
+            headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+            timeout=30
         )
-        logger.info(f"Discovery sent → {len(services)} services")
-    except Exception as e:
-        logger.error(f"Failed to send discovery results: {e}")
+        resp.raise_for_status()
+
+    def _run(self):
+        backoff = self.min_interval
+        while True:
+            try:
+                if not self.spool.pending():
+                    time.sleep(self.idle)
+                    continue
+                records, position = self.spool.peek(self.batch_records, self.max_body_bytes)
+                if records:
+                    self._post(records)
+                    logger.info(f"Replayed {len(records)} spooled uploads")
+                self.spool.ack(position)
+                backoff = self.min_interval
+                time.sleep(self.min_interval)
+            except Exception as e:
+                ERRORS.inc(where="spool_replay")
+                delay = backoff * random.uniform(0.5, 1.5)
+                logger.warning(f"Spool replay failed ({e}), retrying in {delay:.0f}s")
+                time.sleep(delay)
+                backoff = min(backoff * 2, self.max_backoff)
+
+
+def upload_profiles(backend: str, server_id: str, directory: str):
+    """
+    POST /api/agent/profile for every finished profile not uploaded yet
+    (collapsed stacks, gzip); uploaded files are kept, renamed, for a while.
+    """
+    for path in pending_profiles(directory):
+        try:
+            with open(path) as f:
+                data = f.read()
+            body = gzip.compress(json.dumps({
+                "server_id": server_id,
+                "name": os.path.basename(path),
+                "format": "collapsed",
+                "data": data
+            }).encode("utf-8"))
+            UPLOAD_BYTES.observe(len(body), endpoint="/api/agent/profile")
+            session.post(
+                f"{backend}/api/agent/profile",
+                data=body,
+                headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+                timeout=30
+            ).raise_for_status()
+            mark_uploaded(path)
+            logger.info(f"Profile uploaded → {os.path.basename(path)}")
+        except Exception as e:
+            logger.error(f"Failed to upload profile {path}: {e}")
+            ERRORS.inc(where="profile_upload")
+            return
+
+
+class TelemetryPusher:
+    """
+    Posts the agent's own metrics (telemetry.REGISTRY snapshot) to
+    POST /api/agent/telemetry every `period` seconds; the backend exposes
+    them on its /metrics with a server_id label.
+    """
+
+    def __init__(self, backend: str, server_id: str, period: float):
+        self.backend = backend
+        self.server_id = server_id
+        self.period = period
+
+    def start(self):
+        threading.Thread(target=self._run, name="telemetry-push", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.period)
+            try:
+                body = gzip.compress(json.dumps(
+                    {"server_id": self.server_id, "families": REGISTRY.snapshot()},
+                    separators=(",", ":")
+                ).encode("utf-8"))
+                session.post(
+                    f"{self.backend}/api/agent/telemetry",
+                    data=body,
+                    headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+                    timeout=10
+                ).raise_for_status()
+            except Exception as e:
+                logger.warning(f"Telemetry push failed: {e}")
+
+
+def apply_rollups(services, sampler: MetricSampler, fresh: bool = False):
+    """
+    Copy of services with cpu/mem replaced by the sampled interval averages
+    and the full rollup attached, for the pids the sampler has data for.
+    The others (process exited or replaced since discovery) are marked
+    sampled=False so no metrics are sent for them, unless `fresh`: right
+    after a discovery its own cpu/mem are current.
+    """
+    rollups = sampler.rollup()
+    result = []
+    for svc in services:
+        rollup = rollups.get((svc["name"], svc.get("pid")))
+        if rollup is not None:
+            svc = {**svc, "cpu_usage": rollup[3], "memory_usage": rollup[7], "rollup": rollup}
+        elif not fresh:
+            svc = {**svc, "cpu_usage": None, "memory_usage": None, "sampled": False}
+        result.append(svc)
+    return result
 
 
 def main():
@@ -72,28 +346,87 @@ def main():
     server_id = cfg["server_id"]
     backend = cfg["backend"]
     interval = cfg["interval"]
+    scanner = cfg["scanner"]
+    long_poll = cfg["long_poll"]
 
     logger.info(f"OneAgent started for server={server_id} backend={backend}")
+    # uploads that fail are kept on disk and replayed once the backend is back
+    spool = Spool(cfg["spool_dir"], max_bytes=cfg["spool_max_mb"] << 20)
+    uploader = DiscoveryUploader(backend, server_id, spool)
+    SpoolReplayer(backend, server_id, spool).start()
+    REGISTRY.gauge("oneagent_spool_bytes", "Bytes waiting in the upload spool",
+                   fn=lambda: spool.stats()["bytes"])
+
+    # self-telemetry is opt-in: a localhost scrape endpoint and/or a push
+    if cfg["telemetry_port"]:
+        serve(cfg["telemetry_port"])
+        logger.info(f"Telemetry on http://127.0.0.1:{cfg['telemetry_port']}/metrics")
+    if cfg["telemetry_push"]:
+        TelemetryPusher(backend, server_id, cfg["telemetry_push"]).start()
+
+    # on-demand stack profiles: config.ini profile_seconds at start, or the
+    # "profile[:seconds]" command; written to profile_dir, uploaded next cycle
+    profile_dir = cfg["profile_dir"]
+    profiler = StackSampler()
+
+    def start_profile(seconds):
+        if profiler.start(seconds, on_done=lambda p: logger.info(
+                f"Profile written → {p.write(profile_dir)} ({p.samples} samples)")):
+            logger.info(f"Profiling for {profiler.seconds:.0f}s")
+        else:
+            logger.warning("Profile already running")
+
+    if cfg["profile_seconds"]:
+        start_profile(cfg["profile_seconds"])
+
+    # per-second cpu/mem of the discovered pids, uploaded as rollups every interval
+    sampler = MetricSampler(capacity=max(interval * 2, 60))
+    sampler.start()
+    services = []
+    next_upload = time.monotonic() + interval
 
     while True:
         try:
-            cmd = get_command(backend, server_id)
+            if time.monotonic() >= next_upload:
+                if services:
+                    uploader.send(apply_rollups(services, sampler))
+                upload_profiles(backend, server_id, profile_dir)
+                next_upload = time.monotonic() + interval
+
+            started = time.monotonic()
+            wait = min(long_poll, max(1, int(next_upload - started))) if long_poll > 0 else 0
+            cmd = get_command(backend, server_id, wait)
+            waited = time.monotonic() - started
 
             if cmd and cmd.get("command") == "discover_now":
                 logger.info("Executing discovery…")
 
                 patterns = fetch_service_patterns(backend, server_id)
-                services = discover_services(server_id, patterns)
+                services = discover_services(server_id, patterns, scanner)
+                sampler.set_targets(services)
 
                 # send (services + metrics snapshot)
-                send_discovery_results(backend, server_id, services)
+                uploader.send(apply_rollups(services, sampler, fresh=True))
+                next_upload = time.monotonic() + interval
+
+                if mark_command_complete(backend, cmd.get("id")):
+                    continue
+
+            elif cmd and parse_command(cmd.get("command")) is not None:
+                start_profile(parse_command(cmd.get("command")))
+                if mark_command_complete(backend, cmd.get("id")):
+                    continue
 
-                mark_command_complete(backend, cmd.get("id"))
+            elif waited >= 1:
+                # the long-poll already waited; an immediate empty answer
+                # (old backend, long_poll = 0, error) uses the fixed interval
+                continue
 
             time.sleep(interval)
 
         except Exception as err:
             logger.error(f"Main loop crashed: {err}")
+            ERRORS.inc(where="main_loop")
             time.sleep(interval)
 
 
@@ -1,19 +1,98 @@
 # discovery.py
 import subprocess
 import re
+import time
 from typing import List, Dict
 from utils import make_fingerprint
+import procfs
+from matcher import GATED_TECHNOLOGIES, cached_index
+from telemetry import REGISTRY
+
+PHASE_SECONDS = REGISTRY.histogram(
+    "oneagent_discovery_phase_seconds",
+    "Time spent per discovery cycle in each phase (scan, match, ports, cwd)",
+    ("phase", "scanner")
+)
+CYCLE_SECONDS = REGISTRY.histogram(
+    "oneagent_discovery_seconds", "Duration of discover_services", ("scanner",)
+)
+FORKS = REGISTRY.counter("oneagent_forks_total", "Subprocesses started by the agent", ("command",))
+ERRORS = REGISTRY.counter("oneagent_errors_total", "Errors by where they happened", ("where",))
+PROCESSES = REGISTRY.gauge("oneagent_processes", "Processes seen by the last discovery scan")
+SERVICES = REGISTRY.gauge("oneagent_services", "Services reported by the last discovery", ("status",))
 
 
 def _run_cmd(cmd: str) -> str:
+    FORKS.inc(command=cmd.split(None, 2)[1] if cmd.startswith("sudo ") else cmd.split(None, 1)[0])
     try:
         out = subprocess.check_output(cmd, shell=True, stderr=subprocess.DEVNULL)
         return out.decode("utf-8", errors="ignore")
     except Exception:
+        ERRORS.inc(where="subprocess")
         return ""
 
 
-def discover_services(server_id: str, service_patterns: List[Dict]) -> List[Dict]:
+def _ps_processes() -> List[Dict]:
+    """
+    Subprocess fallback: one `ps` fork for the whole process table.
+    """
+    ps = _run_cmd("ps -eo pid,user,comm,%cpu,%mem,args --no-heading")
+    procs = []
+    for line in ps.strip().splitlines():
+        parts = re.split(r"\s+", line.strip(), maxsplit=5)
+        if len(parts) < 6:
+            continue
+
+        pid, user, comm, cpu, mem, command = parts
+        procs.append({
+            "pid": int(pid),
+            "user": user,
+            "comm": comm,
+            "cpu": float(cpu),
+            "mem": float(mem),
+            "command": command
+        })
+    return procs
+
+
+def _lsof_ports(pid: int) -> List[str]:
+    ports = []
+    lsof = _run_cmd(f"sudo lsof -Pan -p {pid} -iTCP -sTCP:LISTEN")
+    for l in lsof.splitlines()[1:]:
+        c = l.split()
+        if len(c) >= 9 and ":" in c[8]:
+            ports.append(c[8].split(":")[-1])
+    return ports
+
+
+def _pwdx(pid: int):
+    pwd = _run_cmd(f"pwdx {pid}")
+    return pwd.split(":",1)[1].strip() if ":" in pwd else None
+
+
+def _build_entries(server_id: str, service_patterns: List[Dict]):
+    """
+    (required needles, normalized pattern) pairs for the PatternIndex:
+    the service name, plus the technology keyword for java/python/node.
+    """
+    entries = []
+    for pat in service_patterns:
+        fp = pat.get("command_pattern") or make_fingerprint(server_id, pat["name"], pat["technology"])
+        tech = (pat["technology"] or "").lower()
+
+        needles = [pat["name"].lower()]
+        if tech in GATED_TECHNOLOGIES:
+            needles.append(tech)
+
+        entries.append((needles, {
+            "name": pat["name"],
+            "technology": tech,
+            "command_pattern": fp
+        }))
+    return entries
+
+
+def discover_services(server_id: str, service_patterns: List[Dict], scanner: str = "proc") -> List[Dict]:
     """
     REQUIRED RETURN FORMAT FOR BACKEND:
 
@@ -31,59 +110,64 @@ def discover_services(server_id: str, service_patterns: List[Dict]) -> List[Dict
         "cpu_usage": 23.6,
         "memory_usage": 512
     }
+
+    scanner="proc" walks /proc once without forking (Linux); anything else,
+    or a host without /proc, falls back to ps/lsof/pwdx subprocesses.
     """
 
     services = []
     seen = set()
+    started = time.perf_counter()
 
     # ========= PROCESS LIST =========
-    ps = _run_cmd("ps -eo pid,user,comm,%cpu,%mem,args --no-heading")
-    if not ps:
+    use_proc = scanner == "proc" and procfs.available()
+    label = "proc" if use_proc else "ps"
+    if use_proc:
+        processes = [{"pid": pid, "command": cmd} for pid, cmd in procfs.iter_processes()]
+        listening = procfs.listening_ports()
+    else:
+        processes = _ps_processes()
+    PHASE_SECONDS.observe(time.perf_counter() - started, phase="scan", scanner=label)
+    PROCESSES.set(len(processes))
+
+    if not processes:
+        ERRORS.inc(where="process_scan")
         return services
 
-    lines = ps.strip().splitlines()
-
-    # normalize DB patterns
-    normalized = []
-    for pat in service_patterns:
-        fp = pat.get("command_pattern") or make_fingerprint(server_id, pat["name"], pat["technology"])
-
-        normalized.append({
-            "name": pat["name"],
-            "technology": (pat["technology"] or "").lower(),
-            "command_pattern": fp
-        })
+    # normalized DB patterns, compiled once per pattern list
+    index = cached_index((server_id, service_patterns), lambda: _build_entries(server_id, service_patterns))
+    normalized = [p for _, p in index.entries]
 
     # ========= MATCH RUNNING SERVICES =========
-    for line in lines:
-        parts = re.split(r"\s+", line, maxsplit=5)
-        if len(parts) < 6:
-            continue
-
-        pid, user, comm, cpu, mem, command = parts
-        cmd_low = command.lower()
-
-        for p in normalized:
+    # per-pid port / cwd lookups are summed over the cycle, the rest is matching
+    ports_time = cwd_time = 0.0
+    match_start = time.perf_counter()
+    for proc in processes:
+        pid = proc["pid"]
+        command = proc["command"]
+
+        for p in index.match(command.lower()):
             name = p["name"]
             tech = p["technology"]
 
-            if name.lower() not in cmd_low:
-                continue
-            if tech == "java" and "java" not in cmd_low: continue
-            if tech == "python" and "python" not in cmd_low: continue
-            if tech == "node" and "node" not in cmd_low: continue
-
-            # ------------ PORTS ------------
-            ports = []
-            lsof = _run_cmd(f"sudo lsof -Pan -p {pid} -iTCP -sTCP:LISTEN")
-            for l in lsof.splitlines()[1:]:
-                c = l.split()
-                if len(c) >= 9 and ":" in c[8]:
-                    ports.append(c[8].split(":")[-1])
-
-            # ------------ WORKING DIR ------------
-            pwd = _run_cmd(f"pwdx {pid}")
-            cwd = pwd.split(":",1)[1].strip() if ":" in pwd else None
+            if use_proc:
+                # user/cpu/mem are only read for matched pids
+                if "user" not in proc:
+                    info = procfs.process_info(pid)
+                    if info is None:
+                        break  # exited since the scan
+                    proc.update(info)
+                t0 = time.perf_counter()
+                ports = procfs.pid_ports(pid, listening)
+                t1 = time.perf_counter()
+                cwd = procfs.cwd(pid)
+            else:
+                t0 = time.perf_counter()
+                ports = _lsof_ports(pid)
+                t1 = time.perf_counter()
+                cwd = _pwdx(pid)
+            ports_time += t1 - t0
+            cwd_time += time.perf_counter() - t1
 
             # ------------ FINAL STRUCTURE ------------
             svc = {
@@ -91,19 +175,24 @@ def discover_services(server_id: str, service_patterns: List[Dict]) -> List[Dict
                 "server_id": server_id,
                 "name": name,
                 "technology": tech,
-                "pid": int(pid),
-                "user": user,
+                "pid": pid,
+                "user": proc["user"],
                 "command": command,
                 "ports": ports,
                 "cwd": cwd,
                 "status": "running",
-                "cpu_usage": float(cpu),
-                "memory_usage": float(mem)
+                "cpu_usage": proc["cpu"],
+                "memory_usage": proc["mem"]
             }
 
             services.append(svc)
             seen.add(p["command_pattern"])
 
+    match_time = time.perf_counter() - match_start - ports_time - cwd_time
+    PHASE_SECONDS.observe(match_time, phase="match", scanner=label)
+    PHASE_SECONDS.observe(ports_time, phase="ports", scanner=label)
+    PHASE_SECONDS.observe(cwd_time, phase="cwd", scanner=label)
+
     # ========= ADD STOPPED SERVICES =========
     for p in normalized:
         if p["command_pattern"] not in seen:
@@ -122,4 +211,8 @@ def discover_services(server_id: str, service_patterns: List[Dict]) -> List[Dict
                 "memory_usage": 0
             })
 
+    running = sum(1 for s in services if s["status"] == "running")
+    SERVICES.set(running, status="running")
+    SERVICES.set(len(services) - running, status="stopped")
+    CYCLE_SECONDS.observe(time.perf_counter() - started, scanner=label)
     return services
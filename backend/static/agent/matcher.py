@@ -0,0 +1,115 @@
+# matcher.py
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+# technologies whose keyword must also appear in the command line
+GATED_TECHNOLOGIES = ("java", "node", "python")
+
+Entry = Tuple[Sequence[str], Any]
+
+
+def _node_pattern(node: Dict) -> str:
+    terminal = "" in node
+    branches = [re.escape(ch) + _node_pattern(child) for ch, child in sorted(node.items()) if ch]
+    if not branches:
+        return ""
+
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    # greedy optional: prefer the longest needle starting at this position
+    return "(?:" + body + ")?" if terminal else body
+
+
+def _trie_regex(needles: Iterable[str]) -> str:
+    trie: Dict = {}
+    for needle in needles:
+        node = trie
+        for ch in needle:
+            node = node.setdefault(ch, {})
+        node[""] = True
+    return _node_pattern(trie)
+
+
+class PatternIndex:
+    """
+    Multi-needle substring index compiled once from service patterns.
+
+    Every needle (service name / command pattern and technology keyword) is
+    folded into one trie-shaped regex wrapped in a lookahead, so a single
+    finditer pass over a lower-cased command line reports the longest needle
+    starting at each position; shorter needles sharing that start are its
+    prefixes and are added from a precomputed table.
+
+    entries: [(required_needles, payload), ...] - a payload matches when all of
+    its (lower-case) needles occur in the command line. match() returns
+    payloads in entry order.
+    """
+
+    def __init__(self, entries: List[Entry]):
+        self.entries = [(tuple(req), payload) for req, payload in entries]
+        self._always: List[int] = []
+        self._by_needle: Dict[str, List[int]] = {}
+
+        needles = set()
+        for i, (req, _) in enumerate(self.entries):
+            words = [w for w in req if w]
+            if not words:
+                self._always.append(i)
+                continue
+            needles.update(words)
+            # index each entry under its rarest-looking (longest) needle
+            self._by_needle.setdefault(max(words, key=len), []).append(i)
+
+        self._prefixes = {
+            n: [n[:k] for k in range(1, len(n) + 1) if n[:k] in needles]
+            for n in needles
+        }
+        self._regex = re.compile("(?=(" + _trie_regex(needles) + "))") if needles else None
+
+    def found(self, cmd_low: str) -> set:
+        """All needles occurring in cmd_low, in one pass."""
+        hits = set()
+        if self._regex is None:
+            return hits
+        for m in self._regex.finditer(cmd_low):
+            longest = m.group(1)
+            if longest not in hits:
+                hits.update(self._prefixes[longest])
+        return hits
+
+    def match(self, cmd_low: str) -> List[Any]:
+        hits = self.found(cmd_low)
+        matched = list(self._always)
+        for needle in hits:
+            for i in self._by_needle.get(needle, ()):
+                if all(w in hits for w in self.entries[i][0] if w):
+                    matched.append(i)
+        return [self.entries[i][1] for i in sorted(matched)]
+
+
+_cache: "OrderedDict[str, PatternIndex]" = OrderedDict()
+_cache_lock = threading.Lock()
+CACHE_SIZE = 256
+
+
+def cached_index(key: Any, build: Callable[[], List[Entry]]) -> PatternIndex:
+    """
+    Return the PatternIndex for `key` (e.g. the backend's pattern list),
+    building it only when that key has not been seen recently.
+    """
+    digest = hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    with _cache_lock:
+        index = _cache.get(digest)
+        if index is not None:
+            _cache.move_to_end(digest)
+            return index
+
+    index = PatternIndex(build())
+    with _cache_lock:
+        _cache[digest] = index
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return index
@@ -0,0 +1,180 @@
+# procfs.py
+import os
+import pwd
+from typing import Dict, Iterator, List, Optional, Tuple
+
+PROC = "/proc"
+TCP_LISTEN = "0A"
+NET_TABLES = ("tcp", "tcp6")
+
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_KB = (os.sysconf("SC_PAGE_SIZE") // 1024) if hasattr(os, "sysconf") else 4
+
+_users: Dict[int, str] = {}
+
+
+def available() -> bool:
+    """
+    True when /proc exposes everything the native scanner needs (Linux).
+    """
+    return os.path.isdir(f"{PROC}/self/fd") and os.path.exists(f"{PROC}/net/tcp")
+
+
+def _read(path: str) -> str:
+    try:
+        with open(path, "rb") as f:
+            return f.read().decode("utf-8", errors="ignore")
+    except OSError:
+        return ""
+
+
+def _username(uid: int) -> str:
+    name = _users.get(uid)
+    if name is None:
+        try:
+            name = pwd.getpwuid(uid).pw_name
+        except KeyError:
+            name = str(uid)
+        _users[uid] = name
+    return name
+
+
+def _uptime() -> float:
+    raw = _read(f"{PROC}/uptime").split()
+    return float(raw[0]) if raw else 0.0
+
+
+def mem_total_kb() -> int:
+    for line in _read(f"{PROC}/meminfo").splitlines():
+        if line.startswith("MemTotal:"):
+            return int(line.split()[1])
+    return 0
+
+
+def pids() -> List[int]:
+    try:
+        return [int(d) for d in os.listdir(PROC) if d.isdigit()]
+    except OSError:
+        return []
+
+
+def iter_processes() -> Iterator[Tuple[int, str]]:
+    """
+    Yield (pid, command) for every process, like `ps -eo pid,args`.
+    Kernel threads (empty cmdline) are reported as "[comm]" the way ps does.
+    """
+    for pid in pids():
+        raw = _read(f"{PROC}/{pid}/cmdline")
+        if raw:
+            command = raw.rstrip("\x00").replace("\x00", " ")
+        else:
+            comm = _read(f"{PROC}/{pid}/comm").strip()
+            if not comm:
+                continue
+            command = f"[{comm}]"
+        yield pid, command
+
+
+def read_stat(pid: int) -> Optional[Tuple[str, int, int, int]]:
+    """
+    Parse /proc/<pid>/stat -> (comm, utime+stime ticks, starttime ticks, rss pages).
+    """
+    raw = _read(f"{PROC}/{pid}/stat")
+    rparen = raw.rfind(")")
+    if rparen < 0:
+        return None
+
+    comm = raw[raw.find("(") + 1:rparen]
+    # fields after "(comm)" start at field 3 (state)
+    rest = raw[rparen + 2:].split()
+    try:
+        return comm, int(rest[11]) + int(rest[12]), int(rest[19]), int(rest[21])
+    except (IndexError, ValueError):
+        return None
+
+
+def read_statm(pid: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse /proc/<pid>/statm -> (total program size pages, resident pages).
+    """
+    raw = _read(f"{PROC}/{pid}/statm").split()
+    try:
+        return int(raw[0]), int(raw[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def process_info(pid: int) -> Optional[Dict]:
+    """
+    user / comm / %cpu / %mem for one pid, computed the same way as ps:
+    %cpu is cpu time over lifetime, %mem is rss over MemTotal.
+    """
+    stat = read_stat(pid)
+    if stat is None:
+        return None
+    comm, cpu_ticks, start_ticks, rss_pages = stat
+
+    try:
+        uid = os.stat(f"{PROC}/{pid}").st_uid
+    except OSError:
+        return None
+
+    elapsed = _uptime() - start_ticks / CLK_TCK
+    cpu = (cpu_ticks / CLK_TCK) / elapsed * 100 if elapsed > 0 else 0.0
+
+    mem_total = mem_total_kb()
+    mem = (rss_pages * PAGE_KB) / mem_total * 100 if mem_total else 0.0
+
+    return {
+        "user": _username(uid),
+        "comm": comm,
+        "cpu": round(cpu, 1),
+        "mem": round(mem, 1)
+    }
+
+
+def listening_ports() -> Dict[int, str]:
+    """
+    socket inode -> listening port, from a single read of /proc/net/tcp{,6}.
+    """
+    ports = {}
+    for table in NET_TABLES:
+        for line in _read(f"{PROC}/net/{table}").splitlines()[1:]:
+            cols = line.split()
+            if len(cols) < 10 or cols[3] != TCP_LISTEN:
+                continue
+            inode = int(cols[9])
+            if inode:
+                ports[inode] = str(int(cols[1].rsplit(":", 1)[1], 16))
+    return ports
+
+
+def pid_ports(pid: int, listening: Dict[int, str]) -> List[str]:
+    """
+    Listening ports owned by pid, resolved through its socket fds.
+    """
+    fd_dir = f"{PROC}/{pid}/fd"
+    ports = []
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        return ports
+
+    for fd in fds:
+        try:
+            target = os.readlink(f"{fd_dir}/{fd}")
+        except OSError:
+            continue
+        if not target.startswith("socket:["):
+            continue
+        port = listening.get(int(target[8:-1]))
+        if port and port not in ports:
+            ports.append(port)
+    return ports
+
+
+def cwd(pid: int) -> Optional[str]:
+    try:
+        return os.readlink(f"{PROC}/{pid}/cwd")
+    except OSError:
+        return None
@@ -0,0 +1,143 @@
+# sampler.py
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import procfs
+from utils import setup_logger
+
+logger = setup_logger("oneagent")
+
+
+class RingBuffer:
+    """
+    Fixed-size float ring backed by array('d'): memory is allocated once and
+    the oldest sample is overwritten when full.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = array("d", bytes(8 * capacity))
+        self._head = 0
+        self.count = 0
+
+    def append(self, value: float):
+        self._data[self._head] = value
+        self._head = (self._head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def values(self) -> List[float]:
+        """Samples, oldest first."""
+        if self.count < self.capacity:
+            return self._data[:self.count].tolist()
+        return (self._data[self._head:] + self._data[:self._head]).tolist()
+
+    def clear(self):
+        self._head = 0
+        self.count = 0
+
+    def summary(self) -> Optional[Tuple[float, float, float, float]]:
+        """(min, max, avg, p95) of the buffered samples, None when empty."""
+        if not self.count:
+            return None
+        ordered = sorted(self._data[:self.count] if self.count < self.capacity else self._data)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        return (
+            round(ordered[0], 2),
+            round(ordered[-1], 2),
+            round(sum(ordered) / len(ordered), 2),
+            round(p95, 2)
+        )
+
+
+class MetricSampler:
+    """
+    Samples the CPU and memory of the discovered service pids every `period`
+    seconds from /proc/<pid>/stat and /proc/<pid>/statm, on a background
+    thread.
+
+    CPU is the real usage between two samples (tick delta over wall time, in
+    % of one core, like top), not the lifetime average ps reports; memory is
+    resident size over MemTotal. Each (name, pid) target keeps one RingBuffer
+    for cpu and one for mem of `capacity` samples, so the footprint is fixed.
+    rollup() returns min/max/avg/p95 since the last rollup and starts a new
+    interval.
+    """
+
+    def __init__(self, period: float = 1.0, capacity: int = 300):
+        self.period = period
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._targets: Dict[Tuple[str, int], Dict] = {}
+        self._mem_total = procfs.mem_total_kb()
+        self._thread = None
+
+    def set_targets(self, services: List[Dict]):
+        """Track the running services of the latest discovery."""
+        wanted = {(s["name"], s["pid"]) for s in services if s.get("pid")}
+        with self._lock:
+            for key in list(self._targets):
+                if key not in wanted:
+                    del self._targets[key]
+            for key in wanted:
+                if key not in self._targets:
+                    self._targets[key] = {
+                        "start": None,
+                        "ticks": None,
+                        "at": None,
+                        "cpu": RingBuffer(self.capacity),
+                        "mem": RingBuffer(self.capacity)
+                    }
+
+    def start(self):
+        if self._thread is None and procfs.available():
+            self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            began = time.monotonic()
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Sampler failed: {e}")
+            time.sleep(max(0.0, self.period - (time.monotonic() - began)))
+
+    def sample(self):
+        now = time.monotonic()
+        with self._lock:
+            for (name, pid), t in self._targets.items():
+                stat = procfs.read_stat(pid)
+                statm = procfs.read_statm(pid)
+                if stat is None or statm is None:
+                    continue
+                _, ticks, start, _ = stat
+
+                # a new starttime means the pid was reused: restart the delta
+                if t["start"] == start and t["ticks"] is not None:
+                    elapsed = now - t["at"]
+                    if elapsed > 0:
+                        cpu = (ticks - t["ticks"]) / procfs.CLK_TCK / elapsed * 100
+                        t["cpu"].append(max(cpu, 0.0))
+                        mem = statm[1] * procfs.PAGE_KB / self._mem_total * 100 if self._mem_total else 0.0
+                        t["mem"].append(mem)
+                t["start"], t["ticks"], t["at"] = start, ticks, now
+
+    def rollup(self) -> Dict[Tuple[str, int], List]:
+        """
+        (name, pid) -> [samples, cpu_min, cpu_max, cpu_avg, cpu_p95,
+                        mem_min, mem_max, mem_avg, mem_p95]
+        for targets with at least one sample since the previous call.
+        """
+        rollups = {}
+        with self._lock:
+            for key, t in self._targets.items():
+                cpu, mem = t["cpu"].summary(), t["mem"].summary()
+                if cpu is None or mem is None:
+                    continue
+                rollups[key] = [t["cpu"].count, *cpu, *mem]
+                t["cpu"].clear()
+                t["mem"].clear()
+        return rollups
@@ -0,0 +1,202 @@
+# spool.py
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import List, Optional, Tuple
+
+HEADER = struct.Struct(">II")        # payload length, crc32 of payload
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor.json"
+
+
+class Spool:
+    """
+    Append-only on-disk queue of JSON records that survives restarts.
+
+    Records are zlib-compressed JSON, framed as [length][crc32][payload], in
+    numbered segment files of about `segment_bytes`. A cursor file remembers
+    how far the consumer has acknowledged; fully read segments are deleted.
+    When the spool grows past `max_bytes` the oldest segments are evicted
+    first, unread or not, so disk use stays bounded during long outages.
+
+    A record cut short by a crash at the end of the last segment is dropped
+    on open; a corrupt record elsewhere skips the rest of its segment.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 << 20,
+                 segment_bytes: int = 8 << 20, fsync: bool = True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+
+        self.appended = 0
+        self.evicted_segments = 0
+        self.evicted_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+        if not self._segments:
+            self._segments = [1]
+            open(self._path(1), "ab").close()
+        self._repair_tail()
+
+        self._cursor = self._load_cursor()
+
+    # ---------------- files ----------------
+    def _path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:012d}{SEGMENT_SUFFIX}")
+
+    def _size(self, segment: int) -> int:
+        try:
+            return os.path.getsize(self._path(segment))
+        except OSError:
+            return 0
+
+    def _repair_tail(self):
+        last = self._segments[-1]
+        valid = 0
+        with open(self._path(last), "rb") as f:
+            for _, end in self._scan(f, 0):
+                valid = end
+        if valid < self._size(last):
+            with open(self._path(last), "r+b") as f:
+                f.truncate(valid)
+
+    @staticmethod
+    def _scan(f, offset: int):
+        """Yield (payload, end offset) of the intact records from offset on."""
+        f.seek(offset)
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return
+            length, crc = HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                return
+            offset += HEADER.size + length
+            yield payload, offset
+
+    def _load_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                data = json.load(f)
+            cursor = (int(data["segment"]), int(data["offset"]))
+        except (OSError, ValueError, KeyError):
+            cursor = (self._segments[0], 0)
+        if cursor[0] < self._segments[0]:
+            cursor = (self._segments[0], 0)
+        return cursor
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"segment": self._cursor[0], "offset": self._cursor[1]}, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _delete_before(self, segment: int):
+        while self._segments[0] < segment:
+            try:
+                os.remove(self._path(self._segments.pop(0)))
+            except OSError:
+                pass
+
+    # ---------------- producer ----------------
+    def append(self, record) -> None:
+        payload = zlib.compress(json.dumps(record, separators=(",", ":"), default=str).encode("utf-8"))
+        frame = HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            last = self._segments[-1]
+            if self._size(last) >= self.segment_bytes:
+                last += 1
+                self._segments.append(last)
+            with open(self._path(last), "ab") as f:
+                f.write(frame)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.appended += 1
+            self._evict()
+
+    def _evict(self):
+        total = sum(self._size(s) for s in self._segments)
+        while total > self.max_bytes and len(self._segments) > 1:
+            oldest = self._segments[0]
+            size = self._size(oldest)
+            self._delete_before(oldest + 1)
+            total -= size
+            self.evicted_segments += 1
+            self.evicted_bytes += size
+            if self._cursor[0] <= oldest:
+                self._cursor = (self._segments[0], 0)
+                self._save_cursor()
+
+    # ---------------- consumer ----------------
+    def peek(self, max_records: int = 100,
+             max_bytes: Optional[int] = None) -> Tuple[List, Optional[Tuple[int, int]]]:
+        """
+        Oldest unacknowledged records (at most max_records, and at most
+        max_bytes of uncompressed JSON, though always at least one record)
+        and the position to pass to ack() once they have been handled.
+        """
+        records = []
+        size = 0
+        with self._lock:
+            segment, offset = self._cursor
+            position = None
+            for seg in [s for s in self._segments if s >= segment]:
+                start = offset if seg == segment else 0
+                try:
+                    with open(self._path(seg), "rb") as f:
+                        for payload, end in self._scan(f, start):
+                            try:
+                                data = zlib.decompress(payload)
+                                if max_bytes is not None and records and size + len(data) > max_bytes:
+                                    return records, position
+                                records.append(json.loads(data))
+                                size += len(data)
+                            except (zlib.error, ValueError):
+                                pass
+                            position = (seg, end)
+                            if len(records) >= max_records:
+                                return records, position
+                except OSError:
+                    continue
+                if seg != self._segments[-1]:
+                    # read to its end (or up to a corrupt record): move on
+                    position = (seg + 1, 0)
+            return records, position
+
+    def ack(self, position: Optional[Tuple[int, int]]) -> None:
+        if position is None:
+            return
+        with self._lock:
+            self._cursor = position
+            self._save_cursor()
+            self._delete_before(position[0])
+
+    def pending(self) -> bool:
+        with self._lock:
+            last = self._segments[-1]
+            return self._cursor[0] < last or self._cursor[1] < self._size(last)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "bytes": sum(self._size(s) for s in self._segments),
+                "appended": self.appended,
+                "evicted_segments": self.evicted_segments,
+                "evicted_bytes": self.evicted_bytes
+            }
@@ -29,7 +29,15 @@ def load_config(path: str = CONFIG_PATH) -> dict:
       "host": section.get("host", ""),
       "username": section.get("username", ""),
       "pem_path": section.get("pem_path", ""),
-      "interval": int(section.get("interval", "60"))
+      "interval": int(section.get("interval", "60")),
+      "scanner": section.get("scanner", "proc"),
+      "long_poll": int(section.get("long_poll", "25")),
+      "spool_dir": section.get("spool_dir", "/opt/oneagent/spool"),
+      "spool_max_mb": int(section.get("spool_max_mb", "64")),
+      "telemetry_port": int(section.get("telemetry_port", "0")),
+      "telemetry_push": int(section.get("telemetry_push", "0")),
+      "profile_seconds": int(section.get("profile_seconds", "0")),
+      "profile_dir": section.get("profile_dir", "/opt/oneagent/profiles")
   }
 
 
@@ -0,0 +1,30 @@
+-- 002_log_templates.sql
+-- Deduplicated log storage: each distinct message shape is stored once in
+-- log_template and every line becomes a compact log_event row holding only
+-- the template id, the variable parts and the event time.
+
+CREATE TABLE IF NOT EXISTS log_template (
+    template_id BIGINT PRIMARY KEY,
+    service_id INT NOT NULL,
+    template TEXT NOT NULL,
+    occurrences BIGINT NOT NULL DEFAULT 0,
+    first_seen TIMESTAMP NOT NULL,
+    last_seen TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_log_template_service
+    ON log_template (service_id, occurrences DESC);
+
+CREATE TABLE IF NOT EXISTS log_event (
+    service_id INT NOT NULL,
+    template_id BIGINT NOT NULL,
+    log_level VARCHAR(10) NOT NULL,
+    params JSONB NOT NULL DEFAULT '[]',
+    timestamp TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_log_event_service_time
+    ON log_event (service_id, timestamp);
+
+CREATE INDEX IF NOT EXISTS idx_log_event_template_time
+    ON log_event (template_id, timestamp);
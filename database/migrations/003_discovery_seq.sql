@@ -0,0 +1,5 @@
+-- 003_discovery_seq.sql
+-- Last discovery snapshot sequence acknowledged per server; delta uploads
+-- from the agent must be based on it (see POST /api/agent/discovery).
+
+ALTER TABLE servers ADD COLUMN IF NOT EXISTS discovery_seq BIGINT;
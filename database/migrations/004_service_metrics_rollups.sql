@@ -0,0 +1,12 @@
+-- 004_service_metrics_rollups.sql
+-- Per-interval rollups of the agent's 1 s cpu/mem samples. cpu_usage and
+-- memory_usage hold the interval averages when these are set.
+
+ALTER TABLE service_metrics
+    ADD COLUMN IF NOT EXISTS samples INT,
+    ADD COLUMN IF NOT EXISTS cpu_min REAL,
+    ADD COLUMN IF NOT EXISTS cpu_max REAL,
+    ADD COLUMN IF NOT EXISTS cpu_p95 REAL,
+    ADD COLUMN IF NOT EXISTS mem_min REAL,
+    ADD COLUMN IF NOT EXISTS mem_max REAL,
+    ADD COLUMN IF NOT EXISTS mem_p95 REAL;
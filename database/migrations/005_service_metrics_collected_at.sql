@@ -0,0 +1,9 @@
+-- 005_service_metrics_collected_at.sql
+-- When the agent took the sample. Differs from insert time for uploads that
+-- were spooled on the agent during an outage and replayed later.
+
+ALTER TABLE service_metrics
+    ADD COLUMN IF NOT EXISTS collected_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+CREATE INDEX IF NOT EXISTS idx_service_metrics_service_time
+    ON service_metrics (service_id, collected_at);
@@ -0,0 +1,77 @@
+-- 006_service_metrics_partitions_rollups.sql
+-- Raw service_metrics becomes a table partitioned by day on collected_at,
+-- so retention drops whole partitions instead of running DELETEs. Dashboards
+-- read the 1 minute / 1 hour / 1 day rollups instead of scanning raw rows.
+-- python-service/metrics_rollup.py creates the upcoming partitions, drops
+-- expired ones and folds new raw rows into the rollups.
+
+-- id of the inserting transaction, for the rollup job's high-water mark
+-- (collected_at can be hours old for replayed uploads, and no timestamp
+-- says when a row became visible). Existing rows get the migration's id
+-- and are folded by the first run.
+ALTER TABLE service_metrics
+    ADD COLUMN IF NOT EXISTS ingest_txid BIGINT NOT NULL DEFAULT txid_current();
+
+-- swap the plain table for a partitioned one; the existing rows stay where
+-- they are, attached as the partition for everything up to today
+DO $$
+DECLARE
+    -- next midnight UTC: the rollup job creates daily UTC partitions from there
+    cutoff TIMESTAMPTZ := (date_trunc('day', NOW() AT TIME ZONE 'UTC') + INTERVAL '1 day') AT TIME ZONE 'UTC';
+BEGIN
+    IF (SELECT relkind FROM pg_class
+        WHERE oid = to_regclass('service_metrics')) = 'p' THEN
+        RETURN;
+    END IF;
+
+    ALTER TABLE service_metrics RENAME TO service_metrics_legacy;
+    ALTER INDEX IF EXISTS idx_service_metrics_service_time
+        RENAME TO idx_service_metrics_legacy_service_time;
+
+    CREATE TABLE service_metrics (LIKE service_metrics_legacy INCLUDING DEFAULTS)
+        PARTITION BY RANGE (collected_at);
+
+    CREATE INDEX idx_service_metrics_service_time
+        ON service_metrics (service_id, collected_at);
+    CREATE INDEX idx_service_metrics_ingest_txid
+        ON service_metrics (ingest_txid);
+
+    EXECUTE format(
+        'ALTER TABLE service_metrics ATTACH PARTITION service_metrics_legacy
+         FOR VALUES FROM (MINVALUE) TO (%L)', cutoff);
+
+    -- rows outside every daily partition (clock skew, very late replays)
+    CREATE TABLE service_metrics_default PARTITION OF service_metrics DEFAULT;
+END $$;
+
+-- rollups: mergeable aggregates per service and bucket start
+CREATE TABLE IF NOT EXISTS service_metrics_1m (
+    service_id INT NOT NULL,
+    bucket TIMESTAMPTZ NOT NULL,
+    count BIGINT NOT NULL,
+    cpu_min REAL,
+    cpu_max REAL,
+    cpu_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    cpu_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    mem_min REAL,
+    mem_max REAL,
+    mem_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    mem_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+    cpu_avg DOUBLE PRECISION GENERATED ALWAYS AS (cpu_sum / NULLIF(count, 0)) STORED,
+    mem_avg DOUBLE PRECISION GENERATED ALWAYS AS (mem_sum / NULLIF(count, 0)) STORED,
+    PRIMARY KEY (service_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS service_metrics_1h (LIKE service_metrics_1m INCLUDING ALL);
+CREATE TABLE IF NOT EXISTS service_metrics_1d (LIKE service_metrics_1m INCLUDING ALL);
+
+CREATE INDEX IF NOT EXISTS idx_service_metrics_1m_bucket ON service_metrics_1m (bucket);
+CREATE INDEX IF NOT EXISTS idx_service_metrics_1h_bucket ON service_metrics_1h (bucket);
+CREATE INDEX IF NOT EXISTS idx_service_metrics_1d_bucket ON service_metrics_1d (bucket);
+
+-- ingest_txid below which raw rows have been folded
+CREATE TABLE IF NOT EXISTS metrics_rollup_state (
+    name TEXT PRIMARY KEY,
+    high_water BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
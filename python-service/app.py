@@ -1,8 +1,54 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+from contextlib import asynccontextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import os
 import time
 
-app = FastAPI()
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from batcher import MicroBatcher, QueueFull
+from model import run_batch
+from result_cache import ResultCache, payload_key
+
+# -------------------------------------------------------
+# Worker pool / batching config (env overrides)
+# -------------------------------------------------------
+MODEL_EXECUTOR = os.getenv("MODEL_EXECUTOR", "thread")          # thread | process
+MODEL_WORKERS = int(os.getenv("MODEL_WORKERS", os.cpu_count() or 4))
+MODEL_MAX_BATCH = int(os.getenv("MODEL_MAX_BATCH", 32))
+MODEL_MAX_WAIT_MS = float(os.getenv("MODEL_MAX_WAIT_MS", 10))
+MODEL_MAX_QUEUE = int(os.getenv("MODEL_MAX_QUEUE", 1024))
+MODEL_TIMEOUT_SEC = float(os.getenv("MODEL_TIMEOUT_SEC", 60))
+CACHE_TTL_SEC = float(os.getenv("CACHE_TTL_SEC", 30))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 10000))
+CACHE_MAX_MB = float(os.getenv("CACHE_MAX_MB", 64))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    pool_class = ProcessPoolExecutor if MODEL_EXECUTOR == "process" else ThreadPoolExecutor
+    executor = pool_class(max_workers=MODEL_WORKERS)
+    app.state.batcher = MicroBatcher(
+        run_batch, executor, MODEL_WORKERS,
+        max_batch=MODEL_MAX_BATCH,
+        max_wait=MODEL_MAX_WAIT_MS / 1000,
+        max_queue=MODEL_MAX_QUEUE
+    )
+    app.state.cache = ResultCache(
+        ttl=CACHE_TTL_SEC,
+        max_entries=CACHE_MAX_ENTRIES,
+        max_bytes=int(CACHE_MAX_MB * (1 << 20))
+    )
+    await app.state.batcher.start()
+    try:
+        yield
+    finally:
+        await app.state.batcher.stop()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(lifespan=lifespan)
 
 class ModelPayload(BaseModel):
     input: dict
@@ -10,7 +56,20 @@ class ModelPayload(BaseModel):
 @app.post('/run-model')
 async def run_model(payload: ModelPayload):
     start = time.time()
-    # simulate work
-    time.sleep(1)
-    result = {"echo": payload.input, "processed_at": time.time()}
-    return {"ok": True, "result": result, "duration_sec": time.time() - start}
+    key = payload_key(payload.input)
+    try:
+        (result, timing), cache = await asyncio.wait_for(
+            app.state.cache.get_or_compute(key, lambda: app.state.batcher.submit(payload.input)),
+            MODEL_TIMEOUT_SEC
+        )
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail=f"model did not answer within {MODEL_TIMEOUT_SEC}s")
+    if cache == "hit":
+        timing = {"queue_ms": 0.0, "run_ms": 0.0, "batch_size": 0}
+    return {"ok": True, "result": result, "duration_sec": time.time() - start, "timing": timing, "cache": cache}
+
+@app.get('/stats')
+async def stats():
+    return {"batcher": app.state.batcher.stats(), "cache": app.state.cache.stats()}
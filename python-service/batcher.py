@@ -0,0 +1,124 @@
+import asyncio
+import time
+
+
+class QueueFull(Exception):
+    pass
+
+
+# -------------------------------------------------------
+# Micro-batching scheduler in front of a worker pool
+# -------------------------------------------------------
+class MicroBatcher:
+    """
+    Groups concurrent submit() calls into one fn(list_of_items) call.
+
+    A batch is dispatched when it holds `max_batch` items or `max_wait`
+    seconds after its first item arrived; while all `workers` are busy the
+    next batch keeps filling up, so batches grow under load instead of
+    queueing single calls. fn runs in `executor` (thread or process pool),
+    never on the event loop. When `max_queue` items are already waiting,
+    submit() raises QueueFull straight away.
+
+    submit() returns (result, timing) where timing has queue_ms, run_ms and
+    batch_size for that request.
+    """
+
+    def __init__(self, fn, executor, workers, max_batch=32, max_wait=0.01, max_queue=1024):
+        self.fn = fn
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+
+        self._queue = None
+        self._slots = None
+        self._workers = workers
+        self._task = None
+        self._running = set()
+
+        self.submitted = 0
+        self.rejected = 0
+        self.batches = 0
+        self.items = 0
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self._workers)
+        self._task = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def submit(self, item):
+        if self._queue.qsize() >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(f"{self._queue.qsize()} requests already queued")
+        self.submitted += 1
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future, time.perf_counter()))
+        return await future
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "running_batches": len(self._running),
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0
+        }
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # wait for a free worker, then top the batch up with what arrived meanwhile
+            await self._slots.acquire()
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            task = asyncio.create_task(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            results = await loop.run_in_executor(self.executor, self.fn, [item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"model returned {len(results)} results for {len(batch)} inputs")
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        run_ms = (time.perf_counter() - start) * 1000
+        self.batches += 1
+        self.items += len(batch)
+        for (_, future, queued_at), result in zip(batch, results):
+            if not future.done():
+                future.set_result((result, {
+                    "queue_ms": round((start - queued_at) * 1000, 2),
+                    "run_ms": round(run_ms, 2),
+                    "batch_size": len(batch)
+                }))
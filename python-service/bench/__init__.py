@@ -0,0 +1,16 @@
+"""
+Micro-benchmarks for the discovery, log parsing and ingest hot paths.
+
+    python -m bench                 # run everything, compare to baselines.json
+    python -m bench log_parsing     # one suite
+    python -m bench --save          # record the current numbers as baseline
+    python -m bench --quick         # smaller inputs, compared to the quick baselines
+
+Full and --quick runs use different inputs, so each has its own baselines
+(save them with the same flags). A benchmark below tolerance is
+re-measured (--recheck) before it counts as a regression.
+
+Inputs come from deterministic generators (bench.generators); the DB and
+SSH sides are in-process stand-ins (bench.fakes), so the numbers measure
+our code only.
+"""
@@ -0,0 +1,156 @@
+import io
+import socket
+
+
+# -------------------------------------------------------
+# In-process stand-ins for psycopg2 and paramiko objects
+# (enough of their API for the code under benchmark)
+# -------------------------------------------------------
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        self.conn.statements += 1
+        if params is not None:
+            self.conn.rows += 1
+
+    def executemany(self, sql, seq):
+        for params in seq:
+            self.execute(sql, params)
+
+    def copy_expert(self, sql, buf):
+        data = buf.read()
+        self.conn.statements += 1
+        self.conn.rows += data.count("\n")
+        self.conn.bytes += len(data)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Counts statements, rows and COPY bytes; commits are free."""
+
+    def __init__(self):
+        self.closed = 0
+        self.statements = 0
+        self.rows = 0
+        self.bytes = 0
+        self.commits = 0
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeChannel:
+    """
+    A paramiko channel whose remote side already wrote `data`: recv() hands
+    it out in chunks of at most `chunk` bytes, then b"" (exited).
+    """
+
+    def __init__(self, data, chunk=32768):
+        self._view = memoryview(data)
+        self._pos = 0
+        self.chunk = chunk
+        self.closed = False
+
+    def recv(self, size):
+        end = min(self._pos + min(size, self.chunk), len(self._view))
+        data = self._view[self._pos:end].tobytes()
+        self._pos = end
+        return data
+
+    def recv_ready(self):
+        return self._pos < len(self._view)
+
+    def exit_status_ready(self):
+        return not self.recv_ready()
+
+    def recv_exit_status(self):
+        return 0
+
+    def settimeout(self, timeout):
+        pass
+
+    def fileno(self):
+        raise socket.error("FakeChannel has no file descriptor")
+
+    def close(self):
+        self.closed = True
+
+
+class _Stdin:
+    class channel:
+        @staticmethod
+        def shutdown_write():
+            pass
+
+    def write(self, data):
+        pass
+
+
+class _Stream:
+    def __init__(self, data):
+        self._buf = io.BytesIO(data)
+
+    def read(self, *args):
+        return self._buf.read(*args)
+
+
+class FakeShell:
+    """
+    Answers shell commands from canned output: `responses` maps a command
+    prefix to bytes (or a callable taking the command). Unknown commands
+    print nothing. Counts calls like forks/exec round trips.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.calls = 0
+
+    def output(self, cmd):
+        self.calls += 1
+        for prefix, out in self.responses.items():
+            if cmd.startswith(prefix):
+                return out(cmd) if callable(out) else out
+        return b""
+
+    # discovery._run_cmd signature
+    def run(self, cmd):
+        return self.output(cmd).decode("utf-8", errors="ignore")
+
+
+class FakeSSH(FakeShell):
+    """paramiko.SSHClient.exec_command over a FakeShell."""
+
+    def exec_command(self, cmd, timeout=None):
+        return _Stdin(), _Stream(self.output(cmd)), _Stream(b"")
+
+    def close(self):
+        pass
+
+
+class FakePool:
+    """ssh_pool.SSHPool handing out one FakeSSH for every host."""
+
+    def __init__(self, ssh):
+        self.ssh = ssh
+
+    def get(self, host, username, pem_path, port=None):
+        return self.ssh
+
+    def invalidate(self, host, username, pem_path, port=None):
+        pass
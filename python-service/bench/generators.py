@@ -0,0 +1,173 @@
+import json
+import random
+from datetime import datetime, timedelta
+
+SEED = 1234
+
+USERS = ("root", "ubuntu", "www-data", "postgres", "app", "systemd+")
+SYSTEM_COMMANDS = (
+    "/sbin/init splash",
+    "/usr/lib/systemd/systemd-journald",
+    "/usr/sbin/sshd -D",
+    "/usr/sbin/cron -f",
+    "nginx: worker process",
+    "postgres: 14/main: checkpointer",
+    "/usr/bin/dockerd -H fd:// --containerd=/run/containerd/containerd.sock",
+    "bash",
+    "-bash",
+    "sleep 3600",
+)
+TECHNOLOGIES = ("java", "node", "python", "go", "dotnet")
+WORDS = ("order", "payment", "cart", "user", "auth", "search", "report", "ledger",
+         "invoice", "gateway", "notify", "stock", "price", "ship", "audit", "media")
+
+
+# -------------------------------------------------------
+# Services and their command lines
+# -------------------------------------------------------
+def service_names(n, seed=SEED):
+    rng = random.Random(seed)
+    names = []
+    for i in range(n):
+        names.append(f"{rng.choice(WORDS)}-{rng.choice(WORDS)}-svc{i}")
+    return names
+
+
+def service_command(name, technology, rng):
+    if technology == "java":
+        return (f"/usr/lib/jvm/java-17/bin/java -Xms512m -Xmx{rng.choice((1, 2, 4))}g "
+                f"-Dspring.profiles.active=prod -jar /opt/{name}/{name}.jar --server.port={rng.randint(8000, 9999)}")
+    if technology == "node":
+        return f"node /opt/{name}/dist/server.js --name {name}"
+    if technology == "python":
+        return f"/opt/{name}/venv/bin/python -m gunicorn {name.replace('-', '_')}.wsgi:app -w 4"
+    if technology == "go":
+        return f"/opt/{name}/bin/{name} -config /etc/{name}.yaml"
+    return f"dotnet /opt/{name}/{name}.dll"
+
+
+def agent_patterns(n, seed=SEED):
+    """OneAgent /api/agent/service-patterns rows: {name, technology, command_pattern}."""
+    rng = random.Random(seed)
+    return [
+        {"name": name, "technology": rng.choice(TECHNOLOGIES), "command_pattern": None}
+        for name in service_names(n, seed)
+    ]
+
+
+def v2_patterns(n, seed=SEED):
+    """discover_services_v2 pattern rows: {service_id, technology, command_pattern}."""
+    rng = random.Random(seed)
+    return [
+        {"service_id": i + 1, "technology": rng.choice(TECHNOLOGIES).capitalize(), "command_pattern": name}
+        for i, name in enumerate(service_names(n, seed))
+    ]
+
+
+# -------------------------------------------------------
+# `ps -eo pid,user,comm,%cpu,%mem,args --no-heading`
+# -------------------------------------------------------
+def processes(n, patterns=(), running=0.8, seed=SEED):
+    """
+    n process dicts {pid, user, comm, cpu, mem, command}: one per pattern for
+    `running` of the patterns (name / command_pattern in the command line),
+    the rest system noise.
+    """
+    rng = random.Random(seed)
+    procs = []
+    for p in patterns:
+        if len(procs) >= n or rng.random() >= running:
+            continue
+        name = p.get("name") or p["command_pattern"]
+        command = service_command(name, p["technology"].lower(), rng)
+        procs.append((command.split()[0].rsplit("/", 1)[-1][:15], command))
+    while len(procs) < n:
+        command = rng.choice(SYSTEM_COMMANDS)
+        if rng.random() < 0.3:
+            command = f"[kworker/{rng.randint(0, 63)}:{rng.randint(0, 9)}-events]"
+        procs.append((command.split()[0].rsplit("/", 1)[-1][:15], command))
+    rng.shuffle(procs)
+
+    return [
+        {
+            "pid": 100 + i,
+            "user": rng.choice(USERS),
+            "comm": comm,
+            "cpu": round(rng.random() * 30, 1),
+            "mem": round(rng.random() * 10, 1),
+            "command": command
+        }
+        for i, (comm, command) in enumerate(procs)
+    ]
+
+
+def ps_output(procs):
+    return "".join(
+        f"{p['pid']:>7} {p['user']:<8} {p['comm']:<15} {p['cpu']:>4} {p['mem']:>4} {p['command']}\n"
+        for p in procs
+    )
+
+
+def collector_output(procs, filters):
+    """The JSON document remote_collector.batch_collect gets back."""
+    candidates = {}
+    sockets = []
+    for p in procs:
+        if not any(f in p["command"].lower() for f in filters):
+            continue
+        port = str(8000 + p["pid"] % 2000)
+        sockets.append({"pid": p["pid"], "port": port})
+        candidates[str(p["pid"])] = {"cwd": "/opt/app", "cpu": p["cpu"], "mem": p["mem"], "ports": [port]}
+    return json.dumps({"collected_at": 1700000000.0, "processes": procs,
+                       "sockets": sockets, "candidates": candidates})
+
+
+# -------------------------------------------------------
+# Log streams
+# -------------------------------------------------------
+LEVEL_WEIGHTS = (("INFO", 80), ("DEBUG", 10), ("WARN", 7), ("ERROR", 3))
+LOG_FORMATS = ("logback", "python", "json", "syslog", "nginx_access", "plain")
+
+
+def _level(rng):
+    r = rng.randrange(100)
+    for level, weight in LEVEL_WEIGHTS:
+        if r < weight:
+            return level
+        r -= weight
+    return "INFO"
+
+
+def log_lines(n, fmt="logback", seed=SEED):
+    rng = random.Random(seed)
+    start = datetime(2024, 5, 1, 10, 0, 0)
+    lines = []
+    for i in range(n):
+        ts = start + timedelta(milliseconds=i * 7)
+        level = _level(rng)
+        word = rng.choice(WORDS)
+        msg = f"{word} request {rng.randint(1, 99999)} took {rng.randint(1, 900)}ms user={rng.randint(1, 5000)}"
+        if fmt == "logback":
+            line = (f"{ts:%Y-%m-%d %H:%M:%S}.{ts.microsecond // 1000:03d} [http-nio-8080-exec-{i % 16}] "
+                    f"{level:<5} com.acme.{word}.Service - {msg}")
+        elif fmt == "python":
+            line = f"{ts:%Y-%m-%d %H:%M:%S},{ts.microsecond // 1000:03d} - {word}.worker - " \
+                   f"{'WARNING' if level == 'WARN' else level} - {msg}"
+        elif fmt == "json":
+            line = json.dumps({"@timestamp": ts.isoformat() + "Z", "level": level,
+                               "logger": word, "message": msg}, separators=(",", ":"))
+        elif fmt == "syslog":
+            line = f"{ts:%b} {ts.day:>2} {ts:%H:%M:%S} web-1 {word}d[{1000 + i % 50}]: {level.lower()}: {msg}"
+        elif fmt == "nginx_access":
+            status = 500 if level == "ERROR" else 404 if level == "WARN" else 200
+            line = (f'10.0.{i % 255}.{rng.randint(1, 254)} - - [{ts:%d/%b/%Y:%H:%M:%S} +0000] '
+                    f'"GET /api/v1/{word}/{rng.randint(1, 999)} HTTP/1.1" {status} {rng.randint(100, 9000)} '
+                    f'"-" "curl/8.0"')
+        else:
+            line = f"{level} {msg}"
+        lines.append(line)
+    return lines
+
+
+def log_bytes(lines):
+    return ("\n".join(lines) + "\n").encode("utf-8")
@@ -0,0 +1,81 @@
+import gc
+import statistics
+import time
+import tracemalloc
+
+
+# -------------------------------------------------------
+# Timing / memory measurement
+# -------------------------------------------------------
+def _sample(fn, loops):
+    """Seconds per call over `loops` back-to-back calls, GC off (like timeit)."""
+    gc.collect()
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        return (time.perf_counter() - start) / loops
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def measure(fn, items=1, repeat=5, warmup=1, memory=True, min_sample=0.2):
+    """
+    Run fn() `warmup` times, then take `repeat` samples of at least
+    `min_sample` seconds each (fast calls are looped); `items` is how much
+    work one call does (lines, rows, processes). Returns
+
+        {"ms": best ms per call, "median_ms", "per_s": items/s at the best
+         sample, "peak_kb": tracemalloc peak of one extra traced call}
+
+    The best sample is the figure compared against baselines: it is the
+    least disturbed by other load on the machine, and samples of a few
+    hundred ms keep timer and scheduler noise small against it.
+    """
+    start = time.perf_counter()
+    for _ in range(warmup):
+        fn()
+    per_call = (time.perf_counter() - start) / warmup if warmup else 0.0
+    loops = max(1, int(min_sample / per_call) + 1) if per_call > 0 else 1
+
+    times = [_sample(fn, loops) for _ in range(repeat)]
+
+    best = min(times)
+    result = {
+        "ms": round(best * 1000, 3),
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "per_s": round(items / best, 1) if best > 0 else 0.0
+    }
+
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result["peak_kb"] = round(peak / 1024, 1)
+    return result
+
+
+# -------------------------------------------------------
+# Baseline comparison
+# -------------------------------------------------------
+def compare(results, baselines, tolerance=0.3):
+    """
+    (name, current per_s, baseline per_s, ratio, ok) per benchmark that has
+    a baseline; a benchmark regresses when its throughput drops below
+    (1 - tolerance) of the baseline.
+    """
+    rows = []
+    for name, result in results.items():
+        base = baselines.get(name)
+        if not base or not base.get("per_s"):
+            continue
+        ratio = result["per_s"] / base["per_s"]
+        rows.append((name, result["per_s"], base["per_s"], ratio, ratio >= 1 - tolerance))
+    return rows
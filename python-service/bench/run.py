@@ -0,0 +1,269 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+from bench import generators as gen
+from bench.fakes import FakeChannel, FakeConnection, FakePool, FakeShell, FakeSSH
+from bench.harness import compare, measure
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+AGENT_DIR = os.path.normpath(os.path.join(HERE, "..", "..", "backend", "static", "agent"))
+BASELINES_PATH = os.path.join(HERE, "baselines.json")
+
+# (processes, service patterns)
+DISCOVERY_SIZES = [(1000, 10), (10000, 500), (50000, 5000)]
+QUICK_DISCOVERY_SIZES = [(1000, 10), (10000, 500)]
+LOG_LINES = 50000
+WRITER_ROWS = 50000
+SINGLE_ROWS = 5000
+
+
+# -------------------------------------------------------
+# Benchmarks: each returns {name: (fn, items, extra info)}
+# -------------------------------------------------------
+def agent_discovery(sizes):
+    # the OneAgent modules live next to the installer, not in python-service
+    if AGENT_DIR not in sys.path:
+        sys.path.append(AGENT_DIR)
+    import discovery
+
+    cases = {}
+    for n_procs, n_patterns in sizes:
+        patterns = gen.agent_patterns(n_patterns)
+        procs = gen.processes(n_procs, patterns)
+        shell = FakeShell({
+            "ps ": gen.ps_output(procs).encode(),
+            "sudo lsof": b"COMMAND PID USER FD TYPE DEVICE SIZE/OFF NODE NAME\n"
+                         b"java 1 app 9u IPv6 1 0t0 TCP *:8080 (LISTEN)\n",
+            "pwdx": lambda cmd: f"{cmd.split()[1]}: /opt/app\n".encode()
+        })
+
+        def cycle(patterns=patterns, shell=shell):
+            # the ps/lsof/pwdx fallback; /proc scans depend on the host
+            discovery._run_cmd = shell.run
+            return discovery.discover_services("srv-bench", patterns, scanner="ps")
+
+        shell.calls = 0
+        cycle()
+        cases[f"agent_discovery_ps/{n_procs}x{n_patterns}"] = (cycle, n_procs, {"forks": shell.calls})
+    return cases
+
+
+def v2_discovery(sizes):
+    import discover_services_v2 as v2
+
+    cases = {}
+    for n_procs, n_patterns in sizes:
+        patterns = gen.v2_patterns(n_patterns)
+        procs = gen.processes(n_procs, patterns)
+        filters = [t for t in v2.TECH_FILTERS]
+        ssh = FakeSSH({
+            "python3 -": gen.collector_output(procs, filters).encode(),
+            "ps ": gen.ps_output(procs).encode(),
+            "sudo lsof": b"COMMAND PID USER FD TYPE DEVICE SIZE/OFF NODE NAME\n"
+                         b"java 1 app 9u IPv6 1 0t0 TCP *:8080 (LISTEN)\n",
+            "pwdx": lambda cmd: f"{cmd.split()[1]}: /opt/app\n".encode()
+        })
+        pool = FakePool(ssh)
+
+        def batch_cycle(patterns=patterns, pool=pool):
+            return v2.discover_services("bench-host", "bench", "bench.pem", patterns, batch=True, pool=pool)
+
+        ssh.calls = 0
+        batch_cycle()
+        cases[f"discovery_v2_batch/{n_procs}x{n_patterns}"] = (batch_cycle, n_procs, {"round_trips": ssh.calls})
+
+        if n_procs <= 1000:
+            def per_pid_cycle(patterns=patterns, pool=pool):
+                return v2.discover_services("bench-host", "bench", "bench.pem", patterns, batch=False, pool=pool)
+
+            ssh.calls = 0
+            per_pid_cycle()
+            cases[f"discovery_v2_per_pid/{n_procs}x{n_patterns}"] = (per_pid_cycle, n_procs, {"round_trips": ssh.calls})
+    return cases
+
+
+def log_parsing(n):
+    from log_monitor_agent_v1 import detect_log_level
+    from log_parser import LogParser, detect_format
+
+    cases = {}
+    for fmt in gen.LOG_FORMATS:
+        lines = gen.log_lines(n, fmt)
+
+        def detect(lines=lines):
+            for line in lines:
+                detect_log_level(line)
+
+        def parse(lines=lines):
+            parser = LogParser()
+            for i in range(0, len(lines), 1000):
+                parser.parse_batch(lines[i:i + 1000])
+
+        cases[f"detect_log_level/{fmt}"] = (detect, n, {})
+        cases[f"log_parser/{fmt}"] = (parse, n, {"format": detect_format(lines[:50])})
+
+    # SSH channel -> lines, as the tail loop reads them
+    from channel_reader import RECV_SIZE, LineSplitter
+    data = gen.log_bytes(gen.log_lines(n, "logback"))
+
+    def split(data=data):
+        channel = FakeChannel(data)
+        splitter = LineSplitter()
+        count = 0
+        while True:
+            chunk = channel.recv(RECV_SIZE)
+            if not chunk:
+                break
+            count += len(splitter.feed(chunk))
+        return count
+
+    cases["channel_lines/logback"] = (split, n, {"bytes": len(data)})
+    return cases
+
+
+def log_ingest(n_single, n_batched):
+    from log_monitor_agent_v1 import build_log_entry, save_log_to_db
+    from log_writer import BatchedLogWriter
+
+    single = [build_log_entry(line, 1) for line in gen.log_lines(n_single, "logback")]
+    entries = [build_log_entry(line, 1) for line in gen.log_lines(n_batched, "logback")]
+
+    def per_row(single=single):
+        conn = FakeConnection()
+        for entry in single:
+            save_log_to_db(conn, entry)
+        return conn
+
+    def batched(entries=entries):
+        conn = FakeConnection()
+        writer = BatchedLogWriter(lambda: conn, max_batch=2000, report_every=3600)
+        for entry in entries:
+            writer.put(entry)
+        writer.close(timeout=60)
+        return conn
+
+    # the stand-in DB answers instantly: db_round_trips is what a real one would add
+    conn_single, conn_batched = per_row(), batched()
+    return {
+        "save_log_to_db": (per_row, n_single, {"db_round_trips": conn_single.statements + conn_single.commits}),
+        "batched_log_writer": (batched, n_batched, {"db_round_trips": conn_batched.statements + conn_batched.commits})
+    }
+
+
+def suites(quick):
+    sizes = QUICK_DISCOVERY_SIZES if quick else DISCOVERY_SIZES
+    scale = 5 if quick else 1
+    return {
+        "agent_discovery": lambda: agent_discovery(sizes),
+        "v2_discovery": lambda: v2_discovery(sizes),
+        "log_parsing": lambda: log_parsing(LOG_LINES // scale),
+        "log_ingest": lambda: log_ingest(SINGLE_ROWS // scale, WRITER_ROWS // scale)
+    }
+
+
+# -------------------------------------------------------
+# Baselines, kept per mode ("full" / "quick"): inputs and repeats differ
+# -------------------------------------------------------
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_baselines(mode, path=BASELINES_PATH):
+    return _load(path).get("modes", {}).get(mode, {}).get("results", {})
+
+
+def save_baselines(results, mode, repeat, path=BASELINES_PATH):
+    data = _load(path)
+    modes = data.get("modes", {})
+    modes[mode] = {
+        "saved_at": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "repeat": repeat,
+        "results": dict(sorted({**modes.get(mode, {}).get("results", {}), **results}.items()))
+    }
+    with open(path, "w") as f:
+        json.dump({"modes": dict(sorted(modes.items()))}, f, indent=2)
+        f.write("\n")
+
+
+# -------------------------------------------------------
+# CLI
+# -------------------------------------------------------
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m bench",
+                                 description="Hot-path micro-benchmarks with baseline comparison")
+    ap.add_argument("suite", nargs="*", help="suites to run (default: all)")
+    ap.add_argument("--quick", action="store_true", help="smaller inputs (compared to the quick baselines)")
+    ap.add_argument("--repeat", type=int, default=None)
+    ap.add_argument("--tolerance", type=float, default=0.3,
+                    help="allowed throughput drop vs baseline (default 0.3 = 30%%)")
+    ap.add_argument("--recheck", type=int, default=2,
+                    help="re-measure a benchmark below tolerance up to N times before failing")
+    ap.add_argument("--save", action="store_true", help="store these results as the baseline")
+    ap.add_argument("--json", help="also write the results to this file")
+    args = ap.parse_args(argv)
+
+    available = suites(args.quick)
+    names = args.suite or list(available)
+    unknown = [n for n in names if n not in available]
+    if unknown:
+        ap.error(f"unknown suite(s) {unknown}, choose from {list(available)}")
+    repeat = args.repeat or 5
+    mode = "quick" if args.quick else "full"
+
+    results = {}
+    all_cases = {}
+    for suite in names:
+        try:
+            cases = available[suite]()
+        except ImportError as e:
+            print(f"[WARN] suite {suite} skipped: {e}")
+            continue
+        all_cases.update(cases)
+        for name, (fn, items, info) in cases.items():
+            result = measure(fn, items, repeat=repeat)
+            result.update({"items": items, **info})
+            results[name] = result
+            print(f"[STATS] {name:<40} {result['ms']:>10.2f} ms {result['per_s']:>14,.0f} /s "
+                  f"{result['peak_kb']:>10,.0f} KiB peak  {info or ''}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.save:
+        save_baselines(results, mode, repeat)
+        print(f"[INFO] saved {len(results)} {mode} baselines to {BASELINES_PATH}")
+        return 0
+
+    baselines = load_baselines(mode)
+    if not baselines:
+        print(f"[WARN] no {mode} baselines in {BASELINES_PATH}, run with --save{' --quick' if args.quick else ''}")
+        return 0
+
+    # a slow sample on a busy machine is not a regression until it repeats
+    for _ in range(args.recheck):
+        slow = [r[0] for r in compare(results, baselines, args.tolerance) if not r[4]]
+        if not slow:
+            break
+        for name in slow:
+            fn, items, _ = all_cases[name]
+            again = measure(fn, items, repeat=repeat, memory=False)
+            if again["per_s"] > results[name]["per_s"]:
+                results[name].update(again)
+
+    rows = compare(results, baselines, args.tolerance)
+    failed = [r for r in rows if not r[4]]
+    for name, current, base, ratio, ok in rows:
+        print(f"[{'OK' if ok else 'FAIL'}] {name:<40} {current:>14,.0f} /s vs baseline {base:>14,.0f} /s ({ratio:.2f}x)")
+    if failed:
+        print(f"[ERROR] {len(failed)} benchmark(s) regressed more than {args.tolerance:.0%}")
+        return 1
+    return 0
@@ -0,0 +1,85 @@
+import select
+
+RECV_SIZE = 1 << 20          # bytes per recv() call
+WINDOW_SIZE = 16 << 20       # SSH channel window, lets the server keep streaming
+MAX_LINE = 1 << 20           # a "line" longer than this is emitted in pieces
+
+
+# -------------------------------------------------------
+# Incremental line splitter over a bytearray
+# -------------------------------------------------------
+class LineSplitter:
+    """
+    Feed raw bytes, get back complete decoded lines.
+
+    Only the bytes appended since the last call are scanned for a newline and
+    only complete lines are decoded, so long lines arriving in many chunks
+    cost O(n) instead of re-splitting the whole buffer on every recv.
+    """
+
+    def __init__(self, encoding="utf-8", max_line=MAX_LINE):
+        self.encoding = encoding
+        self.max_line = max_line
+        self._buf = bytearray()
+
+    def feed(self, data):
+        start = len(self._buf)
+        self._buf += data
+
+        end = self._buf.rfind(b"\n", start)
+        if end < 0:
+            if len(self._buf) < self.max_line:
+                return []
+            end = len(self._buf)
+
+        with memoryview(self._buf) as view:
+            chunk = view[:end].tobytes()
+        del self._buf[:end + 1]
+
+        return [line.rstrip("\r") for line in chunk.decode(self.encoding, errors="ignore").split("\n")]
+
+    def flush(self):
+        """Return whatever partial line is left (e.g. at EOF)."""
+        if not self._buf:
+            return []
+        rest = self._buf.decode(self.encoding, errors="ignore").rstrip("\r")
+        self._buf.clear()
+        return [rest]
+
+    def pending(self):
+        return len(self._buf)
+
+
+# -------------------------------------------------------
+# Blocking, select()-driven line iterator for a paramiko channel
+# -------------------------------------------------------
+def open_stream(transport, cmd, window_size=WINDOW_SIZE):
+    """Open a session with a large receive window and start `cmd` on it."""
+    channel = transport.open_session(window_size=window_size)
+    channel.exec_command(cmd)
+    return channel
+
+
+def iter_channel_lines(channel, recv_size=RECV_SIZE, idle_timeout=1.0):
+    """
+    Yield lines from channel stdout as soon as they arrive.
+
+    Blocks in select() on the channel instead of polling, so there is no fixed
+    sleep between reads; returns when the remote command exits and the
+    channel is drained.
+    """
+    splitter = LineSplitter()
+    while True:
+        if not channel.recv_ready():
+            readable, _, _ = select.select([channel], [], [], idle_timeout)
+            if not readable:
+                if channel.exit_status_ready() and not channel.recv_ready():
+                    break
+                continue
+
+        data = channel.recv(recv_size)
+        if not data:
+            break
+        yield from splitter.feed(data)
+
+    yield from splitter.flush()
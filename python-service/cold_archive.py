@@ -0,0 +1,513 @@
+import glob
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from datetime import date, datetime, timedelta, timezone
+
+import numpy as np
+import psycopg2
+
+
+# -------------------------------------------------------
+# Hardcoded DB config (TEST MODE)
+# -------------------------------------------------------
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "postgres",
+    "password": "admin",
+    "database": "aiops",
+    "port": 5432
+}
+
+ARCHIVE_DIR = "cold_archive"
+COLD_AFTER_DAYS = 7
+
+MAGIC = b"AIOSEG01"
+TRAILER = struct.Struct("<Q8s")          # footer length, MAGIC
+BLOCK_ROWS = 65536
+COMPRESS_LEVEL = 6
+EPOCH = datetime(1970, 1, 1)
+
+# table -> time column, [(column, encoding)]
+#   dict: per-segment dictionary, uint16 codes (block stats keep the codes present)
+#   str:  int32 lengths (-1 = NULL) + concatenated UTF-8
+#   f32:  float32, NULL = NaN
+TABLES = {
+    "log_entry": ("timestamp", [
+        ("log_level", "dict"),
+        ("message", "str"),
+        ("raw_line", "str"),
+    ]),
+    "service_metrics": ("collected_at", [
+        ("status", "dict"),
+        ("cpu_usage", "f32"),
+        ("memory_usage", "f32"),
+        ("samples", "f32"),
+        ("cpu_min", "f32"),
+        ("cpu_max", "f32"),
+        ("cpu_p95", "f32"),
+        ("mem_min", "f32"),
+        ("mem_max", "f32"),
+        ("mem_p95", "f32"),
+    ]),
+}
+
+
+# -------------------------------------------------------
+# Connect to PostgreSQL
+# -------------------------------------------------------
+def get_db_connection():
+    return psycopg2.connect(
+        host=DB_CONFIG["host"],
+        user=DB_CONFIG["user"],
+        password=DB_CONFIG["password"],
+        dbname=DB_CONFIG["database"],
+        port=DB_CONFIG["port"]
+    )
+
+
+def _to_us(ts):
+    """datetime -> int microseconds; naive values are taken as UTC wall time."""
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = ts - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+# -------------------------------------------------------
+# Segment writer
+# -------------------------------------------------------
+class SegmentWriter:
+    """
+    One immutable columnar segment: the rows of one table, service and day.
+
+    Layout: MAGIC, then per block of up to BLOCK_ROWS rows one zlib-compressed
+    chunk per column, then a zlib-compressed JSON footer and the trailer
+    (footer length, MAGIC). The time column is delta-encoded int64
+    microseconds (rows arrive in time order, so the deltas are small and
+    compress well). The footer holds the dictionaries and, per block, the row
+    count, the time range, the dictionary codes present and each chunk's
+    offset/length. Readers use these to skip blocks without decompressing
+    them.
+
+    Written to <path>.tmp and renamed on close().
+    """
+
+    def __init__(self, path, table, service_id, day):
+        self.path = path
+        self.table = table
+        self.service_id = service_id
+        self.day = str(day)
+        self.time_column, self.schema = TABLES[table]
+        self.rows = 0
+        self.raw_bytes = 0
+        self._dicts = {name: {} for name, kind in self.schema if kind == "dict"}
+        self._blocks = []
+        self._tz = None
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._f = open(f"{path}.tmp", "wb")
+        self._f.write(MAGIC)
+
+    def _chunk(self, data):
+        comp = zlib.compress(data, COMPRESS_LEVEL)
+        offset = self._f.tell()
+        self._f.write(comp)
+        self.raw_bytes += len(data)
+        return [offset, len(comp), len(data)]
+
+    def write_block(self, times, columns):
+        """times: datetimes in ascending order; columns: {name: values} of the same length."""
+        n = len(times)
+        if n == 0:
+            return
+        if self._tz is None:
+            self._tz = "utc" if times[0].tzinfo is not None else "naive"
+
+        ts = np.fromiter((_to_us(t) for t in times), dtype=np.int64, count=n)
+        deltas = np.empty_like(ts)
+        deltas[0] = ts[0]
+        deltas[1:] = np.diff(ts)
+        block = {"rows": n, "ts_min": int(ts.min()), "ts_max": int(ts.max()),
+                 "codes": {}, "columns": {"__time__": self._chunk(deltas.tobytes())}}
+
+        for name, kind in self.schema:
+            values = columns[name]
+            if kind == "dict":
+                d = self._dicts[name]
+                codes = np.fromiter((d.setdefault(v, len(d)) for v in values), dtype=np.uint16, count=n)
+                block["codes"][name] = np.unique(codes).tolist()
+                data = codes.tobytes()
+            elif kind == "str":
+                encoded = [None if v is None else v.encode("utf-8") for v in values]
+                lengths = np.fromiter((-1 if b is None else len(b) for b in encoded), dtype=np.int32, count=n)
+                data = lengths.tobytes() + b"".join(b for b in encoded if b)
+            else:
+                data = np.array([np.nan if v is None else v for v in values], dtype=np.float32).tobytes()
+            block["columns"][name] = self._chunk(data)
+
+        self._blocks.append(block)
+        self.rows += n
+
+    def close(self):
+        footer = zlib.compress(json.dumps({
+            "version": 1,
+            "table": self.table,
+            "service_id": self.service_id,
+            "day": self.day,
+            "tz": self._tz or "naive",
+            "rows": self.rows,
+            "schema": self.schema,
+            "dicts": {name: list(d) for name, d in self._dicts.items()},
+            "blocks": self._blocks
+        }, separators=(",", ":"), default=str).encode("utf-8"))
+        self._f.write(footer)
+        self._f.write(TRAILER.pack(len(footer), MAGIC))
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        os.replace(f"{self.path}.tmp", self.path)
+        return self.path
+
+    def abort(self):
+        self._f.close()
+        try:
+            os.remove(f"{self.path}.tmp")
+        except OSError:
+            pass
+
+
+# -------------------------------------------------------
+# Segment reader
+# -------------------------------------------------------
+class Segment:
+    """
+    Memory-mapped segment. scan() decodes block by block and pushes filters
+    down: blocks outside [start, end) or without any of the wanted
+    dictionary values are skipped unread, and only requested columns are
+    decompressed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        length, magic = TRAILER.unpack_from(self._mm, len(self._mm) - TRAILER.size)
+        if self._mm[:len(MAGIC)] != MAGIC or magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: not a segment file")
+        start = len(self._mm) - TRAILER.size - length
+        self.meta = json.loads(zlib.decompress(self._mm[start:start + length]))
+        self.kinds = dict((name, kind) for name, kind in self.meta["schema"])
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _raw(self, block, name):
+        offset, clen, rlen = block["columns"][name]
+        with memoryview(self._mm) as view:
+            return zlib.decompress(view[offset:offset + clen], bufsize=rlen)
+
+    def _time_us(self, value):
+        if value is None or isinstance(value, (int, np.integer)):
+            return value
+        if isinstance(value, date) and not isinstance(value, datetime):
+            value = datetime(value.year, value.month, value.day)
+        if self.meta["tz"] == "utc" and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return _to_us(value)
+
+    def scan(self, start=None, end=None, where=None, columns=None):
+        """
+        Yield {"time": datetime64[us] array, column: values} per block with
+        matching rows. where: {dict column: allowed values}. Strings come back
+        as lists, dictionary columns as arrays of values, floats as float32.
+        """
+        start, end = self._time_us(start), self._time_us(end)
+        columns = [c for c, _ in self.meta["schema"]] if columns is None else list(columns)
+
+        allowed = {}
+        for name, values in (where or {}).items():
+            lookup = {v: i for i, v in enumerate(self.meta["dicts"][name])}
+            allowed[name] = {lookup[v] for v in values if v in lookup}
+
+        for block in self.meta["blocks"]:
+            if start is not None and block["ts_max"] < start:
+                continue
+            if end is not None and block["ts_min"] >= end:
+                continue
+            if any(not codes.intersection(block["codes"][name]) for name, codes in allowed.items()):
+                continue
+
+            n = block["rows"]
+            ts = np.cumsum(np.frombuffer(self._raw(block, "__time__"), dtype=np.int64))
+            mask = np.ones(n, dtype=bool)
+            if start is not None:
+                mask &= ts >= start
+            if end is not None:
+                mask &= ts < end
+            decoded = {}
+            for name, codes in allowed.items():
+                decoded[name] = np.frombuffer(self._raw(block, name), dtype=np.uint16)
+                mask &= np.isin(decoded[name], list(codes))
+            rows = np.flatnonzero(mask)
+            if not len(rows):
+                continue
+
+            out = {"time": ts[rows].astype("datetime64[us]")}
+            for name in columns:
+                kind = self.kinds[name]
+                if kind == "dict":
+                    codes = decoded.get(name)
+                    if codes is None:
+                        codes = np.frombuffer(self._raw(block, name), dtype=np.uint16)
+                    out[name] = np.array(self.meta["dicts"][name], dtype=object)[codes[rows]]
+                elif kind == "str":
+                    out[name] = self._strings(self._raw(block, name), n, rows)
+                else:
+                    out[name] = np.frombuffer(self._raw(block, name), dtype=np.float32)[rows]
+            yield out
+
+    @staticmethod
+    def _strings(data, n, rows):
+        lengths = np.frombuffer(data, dtype=np.int32, count=n)
+        ends = np.cumsum(np.maximum(lengths, 0)) + 4 * n
+        starts = ends - np.maximum(lengths, 0)
+        return [
+            None if lengths[i] < 0 else data[starts[i]:ends[i]].decode("utf-8", errors="replace")
+            for i in rows.tolist()
+        ]
+
+
+# -------------------------------------------------------
+# Archive directory: <root>/<table>/<service_id>/<day>-<part>.seg
+# -------------------------------------------------------
+class ColdArchive:
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+
+    def new_segment_path(self, table, service_id, day):
+        """Segments are never overwritten: a later export of the same day adds a part."""
+        directory = os.path.join(self.root, table, str(service_id))
+        part = len(glob.glob(os.path.join(directory, f"{day}-*.seg")))
+        return os.path.join(directory, f"{day}-{part:03d}.seg")
+
+    def segments(self, table, service_ids=None, start=None, end=None):
+        first = None if start is None else (start.date() if isinstance(start, datetime) else start)
+        last = None if end is None else (end.date() if isinstance(end, datetime) else end)
+        paths = []
+        for path in sorted(glob.glob(os.path.join(self.root, table, "*", "*.seg"))):
+            service = os.path.basename(os.path.dirname(path))
+            if service_ids is not None and service not in {str(s) for s in service_ids}:
+                continue
+            day = date.fromisoformat(os.path.basename(path)[:10])
+            if (first is not None and day < first) or (last is not None and day > last):
+                continue
+            paths.append(path)
+        return paths
+
+    def query(self, table, service_ids=None, start=None, end=None, where=None, columns=None):
+        """Yield matching blocks (see Segment.scan) with their "service_id"."""
+        for path in self.segments(table, service_ids, start, end):
+            with Segment(path) as seg:
+                for block in seg.scan(start, end, where, columns):
+                    block["service_id"] = seg.meta["service_id"]
+                    yield block
+
+
+# -------------------------------------------------------
+# Export: DB rows older than N days -> segments, then delete them
+# -------------------------------------------------------
+def export_cold(conn, archive, table, older_than_days=COLD_AFTER_DAYS, delete=True):
+    """
+    Archive every whole (UTC) day older than `older_than_days`, one segment
+    per service and day, streamed from a server-side cursor in BLOCK_ROWS
+    blocks.
+
+    Each service/day is read and deleted in one REPEATABLE READ
+    transaction: the DELETE sees the same snapshot as the read, so rows
+    committed meanwhile for that day (a backlog tail, replayed metrics) are
+    left for the next run instead of being deleted unarchived. The segment
+    is renamed into place before the commit and removed again if the commit
+    fails; only a crash between the two leaves an extra part duplicating
+    rows still in the DB.
+
+    A service/day that fails (e.g. the DELETE would not remove exactly the
+    rows read) is rolled back, logged and skipped; the rest go on. A lost
+    connection stops the export.
+    Returns (segments written, rows archived, [(service_id, day, error)]).
+    """
+    time_column, schema = TABLES[table]
+    names = [c for c, _ in schema]
+    written = rows_total = 0
+    failures = []
+
+    with conn.cursor() as cur:
+        cur.execute("SET TIME ZONE 'UTC'")
+        cur.execute(f"""
+            SELECT service_id, date_trunc('day', {time_column})::date AS day
+            FROM {table}
+            WHERE {time_column} < date_trunc('day', NOW()) - %s * INTERVAL '1 day'
+              AND service_id IS NOT NULL
+            GROUP BY 1, 2
+            ORDER BY 2, 1
+        """, (older_than_days,))
+        days = cur.fetchall()
+    conn.commit()
+
+    for service_id, day in days:
+        start = time.time()
+        path = archive.new_segment_path(table, service_id, day)
+        writer = SegmentWriter(path, table, service_id, day)
+        bounds = (service_id, day, day + timedelta(days=1))
+        renamed = False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            with conn.cursor(name=f"cold_export_{table}") as cur:
+                cur.itersize = BLOCK_ROWS
+                cur.execute(f"""
+                    SELECT {time_column}, {", ".join(names)}
+                    FROM {table}
+                    WHERE service_id = %s AND {time_column} >= %s AND {time_column} < %s
+                    ORDER BY {time_column}
+                """, bounds)
+                while True:
+                    rows = cur.fetchmany(BLOCK_ROWS)
+                    if not rows:
+                        break
+                    cols = list(zip(*rows))
+                    writer.write_block(cols[0], dict(zip(names, cols[1:])))
+            if writer.rows == 0:
+                writer.abort()
+                conn.rollback()
+                continue
+
+            if delete:
+                with conn.cursor() as cur:
+                    cur.execute(f"""
+                        DELETE FROM {table}
+                        WHERE service_id = %s AND {time_column} >= %s AND {time_column} < %s
+                    """, bounds)
+                    if cur.rowcount != writer.rows:
+                        raise RuntimeError(f"{table} service {service_id} {day}: read {writer.rows} rows "
+                                           f"but would delete {cur.rowcount}")
+            writer.close()
+            renamed = True
+            conn.commit()
+        except Exception as e:
+            if renamed:
+                os.remove(path)
+            else:
+                writer.abort()
+            if conn.closed:
+                raise
+            conn.rollback()
+            print(f"[DB ERROR] {table} service {service_id} {day} not archived: {e}".strip())
+            failures.append((service_id, day, str(e).strip()))
+            continue
+
+        size = os.path.getsize(path)
+        written += 1
+        rows_total += writer.rows
+        print(f"[INFO] archived {table} service {service_id} {day}: {writer.rows} rows, "
+              f"{writer.raw_bytes / 1e6:.1f} MB -> {size / 1e6:.1f} MB in {time.time() - start:.1f}s")
+    return written, rows_total, failures
+
+
+# -------------------------------------------------------
+# Benchmark on synthetic logs (no DB)
+# -------------------------------------------------------
+def benchmark(rows=500000, root="/tmp/cold_archive_bench"):
+    from bench.generators import log_lines
+    from log_monitor_agent_v1 import detect_log_level
+
+    lines = log_lines(rows, "logback")
+    day = datetime(2024, 5, 1)
+    times = [day + timedelta(microseconds=i * 86400 * 1000000 // rows) for i in range(rows)]
+    levels = [detect_log_level(line) for line in lines]
+    raw = sum(len(line.encode()) for line in lines) * 2   # message + raw_line
+
+    archive = ColdArchive(root)
+    path = archive.new_segment_path("log_entry", 1, day.date())
+    start = time.perf_counter()
+    writer = SegmentWriter(path, "log_entry", 1, day.date())
+    for i in range(0, rows, BLOCK_ROWS):
+        writer.write_block(times[i:i + BLOCK_ROWS], {
+            "log_level": levels[i:i + BLOCK_ROWS],
+            "message": lines[i:i + BLOCK_ROWS],
+            "raw_line": lines[i:i + BLOCK_ROWS]
+        })
+    writer.close()
+    write_s = time.perf_counter() - start
+    size = os.path.getsize(path)
+    print(f"[STATS] wrote {rows} rows in {write_s:.2f}s, {raw / 1e6:.1f} MB text -> {size / 1e6:.1f} MB "
+          f"({raw / size:.1f}x)")
+
+    def run(label, **kwargs):
+        start = time.perf_counter()
+        found = sum(len(b["time"]) for b in archive.query("log_entry", **kwargs))
+        elapsed = time.perf_counter() - start
+        print(f"[STATS] {label:<34} {found:>8} rows in {elapsed * 1000:8.1f} ms")
+
+    run("full scan, all columns")
+    run("time column only", columns=[])
+    run("ERROR only, messages", where={"log_level": {"ERROR"}}, columns=["message"])
+    run("1 hour window, all columns", start=day + timedelta(hours=12), end=day + timedelta(hours=13))
+    run("1 hour window, ERROR only", start=day + timedelta(hours=12), end=day + timedelta(hours=13),
+        where={"log_level": {"ERROR"}}, columns=["message"])
+    os.remove(path)
+
+
+# -------------------------------------------------------
+# CLI
+# -------------------------------------------------------
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "bench":
+        benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 500000)
+        sys.exit(0)
+
+    if len(sys.argv) >= 2 and sys.argv[1] == "export":
+        days = int(sys.argv[2]) if len(sys.argv) > 2 else COLD_AFTER_DAYS
+        root = sys.argv[3] if len(sys.argv) > 3 else ARCHIVE_DIR
+        conn = get_db_connection()
+        failed = []
+        try:
+            for table in TABLES:
+                segments, rows, failures = export_cold(conn, ColdArchive(root), table, days)
+                print(f"[INFO] {table}: {segments} segments, {rows} rows archived, {len(failures)} failed")
+                failed.extend((table, *f) for f in failures)
+        finally:
+            conn.close()
+        for table, service_id, day, error in failed:
+            print(f"[ERROR] not archived: {table} service {service_id} {day}: {error}")
+        sys.exit(1 if failed else 0)
+
+    if len(sys.argv) >= 5 and sys.argv[1] == "query":
+        table, service_id = sys.argv[2], sys.argv[3]
+        start = datetime.fromisoformat(sys.argv[4])
+        end = datetime.fromisoformat(sys.argv[5]) if len(sys.argv) > 5 else start + timedelta(days=1)
+        where = {"log_level": set(sys.argv[6].split(","))} if len(sys.argv) > 6 else None
+        for block in ColdArchive(ARCHIVE_DIR).query(table, [service_id], start, end, where):
+            for i, ts in enumerate(block["time"]):
+                print(json.dumps({k: (v[i].item() if hasattr(v[i], "item") else v[i])
+                                  for k, v in block.items() if k not in ("time", "service_id")},
+                                 default=str), ts)
+        sys.exit(0)
+
+    print("\nUsage:")
+    print("python cold_archive.py export [older_than_days] [archive_dir]")
+    print("python cold_archive.py query <table> <service_id> <start> [end] [LEVEL,LEVEL]")
+    print("python cold_archive.py bench [rows]\n")
+    sys.exit(1)
@@ -1,9 +1,20 @@
-import paramiko
 import json
+import os
 import sys
 import re
 import time
 from datetime import datetime
+from remote_collector import try_batch_collect
+from ssh_pool import default_pool
+
+# matcher.py is the OneAgent's copy, served to hosts by the installer
+AGENT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                          "..", "backend", "static", "agent"))
+if AGENT_DIR not in sys.path:
+    sys.path.append(AGENT_DIR)
+from matcher import GATED_TECHNOLOGIES, cached_index
+
+TECH_FILTERS = list(GATED_TECHNOLOGIES)
 
 # -----------------------------
 # DB connection function (commented for testing)
@@ -29,16 +40,10 @@ from datetime import datetime
 #     return rows
 
 # -----------------------------
-# Discover services on server
+# Per-PID helpers (non-batch mode)
 # -----------------------------
-def discover_services(host, username, pem_path, service_patterns):
-    services = []
-    found_ids = set()
-
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(hostname=host, username=username, key_filename=pem_path)
-
+def _ps_rows(ssh):
+    rows = []
     stdin, stdout, stderr = ssh.exec_command("ps -eo pid,user,comm,args --no-heading")
     output = stdout.read().decode().splitlines()
 
@@ -53,47 +58,94 @@ def discover_services(host, username, pem_path, service_patterns):
         pid_str, user, comm, command = parts
         if not pid_str.isdigit():
             continue
-        pid = int(pid_str)
+        rows.append((int(pid_str), user, command))
+    return rows
+
+
+def _remote_ports(ssh, pid):
+    ports = []
+    try:
+        cmd_ports = f"sudo lsof -Pan -p {pid} -iTCP -sTCP:LISTEN"
+        stdin_p, stdout_p, stderr_p = ssh.exec_command(cmd_ports)
+        port_output = stdout_p.read().decode().splitlines()
+        for po in port_output[1:]:
+            po_parts = po.split()
+            if len(po_parts) >= 9:
+                ports.append(po_parts[8].split(':')[-1])
+    except:
+        ports = []
+    return ports
+
+
+def _remote_cwd(ssh, pid):
+    cwd = None
+    try:
+        stdin_c, stdout_c, stderr_c = ssh.exec_command(f"pwdx {pid}")
+        cwd_out = stdout_c.read().decode().strip()
+        if cwd_out and ":" in cwd_out:
+            cwd = cwd_out.split(":", 1)[1].strip()
+    except:
+        cwd = None
+    return cwd
+
+def _build_entries(service_patterns):
+    # only java/node/python patterns can match, and need their keyword too
+    entries = []
+    for pattern in service_patterns:
+        tech = pattern['technology'].lower()
+        if tech in GATED_TECHNOLOGIES:
+            entries.append(([pattern['command_pattern'].lower(), tech], pattern))
+    return entries
+
+# -----------------------------
+# Discover services on server
+# -----------------------------
+def discover_services(host, username, pem_path, service_patterns, batch=True, pool=None, port=None,
+                      collected=None):
+    """
+    batch=True collects the process table, listening ports and cwd for every
+    candidate PID in one SSH round trip (see remote_collector); batch=False
+    keeps the original per-PID `lsof`/`pwdx` exec_command calls, which are
+    also the fallback on hosts that cannot run the collector. A
+    batch_collect result for TECH_FILTERS passed as `collected` is used
+    instead of collecting again.
+    The SSH connection comes from `pool` (ssh_pool.default_pool) and is reused;
+    `port` is the server's SSH port (the pool's default, 22, when None).
+    """
+    services = []
+    found_ids = set()
+
+    pool = pool or default_pool
+    ssh = pool.get(host, username, pem_path, port=port)
+
+    try:
+        if batch and collected is None:
+            collected = try_batch_collect(ssh, f"{host}:{port or 22}", TECH_FILTERS)
+            batch = collected is not None
+        if batch:
+            rows = [(p["pid"], p["user"], p["command"]) for p in collected["processes"]]
+        else:
+            rows = _ps_rows(ssh)
+    except Exception:
+        pool.invalidate(host, username, pem_path, port=port)
+        raise
+
+    index = cached_index(service_patterns, lambda: _build_entries(service_patterns))
+
+    for pid, user, command in rows:
         cmd_lower = command.lower()
 
-        for pattern in service_patterns:
+        for pattern in index.match(cmd_lower):
             service_id = pattern['service_id']
             tech = pattern['technology'].lower()
-            command_pattern = pattern['command_pattern'].lower()
-
-            match_service = False
-            if tech == "java" and "java" in cmd_lower and command_pattern in cmd_lower:
-                match_service = True
-            elif tech == "node" and "node" in cmd_lower and command_pattern in cmd_lower:
-                match_service = True
-            elif tech == "python" and "python" in cmd_lower and command_pattern in cmd_lower:
-                match_service = True
-
-            if not match_service:
-                continue
-
-            # Ports
-            ports = []
-            try:
-                cmd_ports = f"sudo lsof -Pan -p {pid} -iTCP -sTCP:LISTEN"
-                stdin_p, stdout_p, stderr_p = ssh.exec_command(cmd_ports)
-                port_output = stdout_p.read().decode().splitlines()
-                for po in port_output[1:]:
-                    po_parts = po.split()
-                    if len(po_parts) >= 9:
-                        ports.append(po_parts[8].split(':')[-1])
-            except:
-                ports = []
-
-            # Current working directory
-            cwd = None
-            try:
-                stdin_c, stdout_c, stderr_c = ssh.exec_command(f"pwdx {pid}")
-                cwd_out = stdout_c.read().decode().strip()
-                if cwd_out and ":" in cwd_out:
-                    cwd = cwd_out.split(":", 1)[1].strip()
-            except:
-                cwd = None
+
+            if batch:
+                details = collected["candidates"].get(str(pid), {})
+                ports = details.get("ports", [])
+                cwd = details.get("cwd")
+            else:
+                ports = _remote_ports(ssh, pid)
+                cwd = _remote_cwd(ssh, pid)
 
             services.append({
                 "service_id": service_id,
@@ -121,7 +173,6 @@ def discover_services(host, username, pem_path, service_patterns):
                 "status": "stopped"
             })
 
-    ssh.close()
     return services
 
 # -----------------------------
@@ -0,0 +1,174 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+import psycopg2
+import psycopg2.extras
+
+from anomaly_engine import AnomalyEngine
+from discover_services_v2 import TECH_FILTERS, discover_services
+from remote_collector import try_batch_collect
+from service_metrics_agent_v1 import fetch_metrics
+from ssh_pool import SSHPool
+
+
+# -------------------------------------------------------
+# Hardcoded DB config (TEST MODE)
+# -------------------------------------------------------
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "postgres",
+    "password": "admin",
+    "database": "aiops",
+    "port": 5432
+}
+
+# PEM files are uploaded by the backend as uploads/server_<id>.pem
+PEM_DIR = os.environ.get(
+    "PEM_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend", "uploads")
+)
+
+
+# -------------------------------------------------------
+# Load servers + their service patterns
+# -------------------------------------------------------
+def load_fleet():
+    conn = psycopg2.connect(
+        host=DB_CONFIG["host"],
+        user=DB_CONFIG["user"],
+        password=DB_CONFIG["password"],
+        dbname=DB_CONFIG["database"],
+        port=DB_CONFIG["port"]
+    )
+    try:
+        cursor = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+        cursor.execute("SELECT server_id, ip_address, username, ssh_port FROM servers")
+        servers = cursor.fetchall()
+
+        cursor.execute("""
+            SELECT server_id, service_id, technology, command_pattern
+            FROM services
+            WHERE command_pattern IS NOT NULL AND technology IS NOT NULL
+        """)
+        patterns = {}
+        for row in cursor.fetchall():
+            patterns.setdefault(row["server_id"], []).append({
+                "service_id": row["service_id"],
+                "technology": row["technology"],
+                "command_pattern": row["command_pattern"]
+            })
+        cursor.close()
+    finally:
+        conn.close()
+
+    for server in servers:
+        server["pem_path"] = os.path.join(PEM_DIR, f"server_{server['server_id']}.pem")
+        server["service_patterns"] = patterns.get(server["server_id"], [])
+    return servers
+
+
+# -------------------------------------------------------
+# One host: discovery + metrics over its pooled connection
+# -------------------------------------------------------
+def scan_host(pool, server):
+    host = server["ip_address"]
+    username = server["username"]
+    pem_path = server["pem_path"]
+    patterns = server["service_patterns"]
+    port = server.get("ssh_port") or 22
+
+    # one collector round trip per host: every pattern that can match needs
+    # its technology keyword in the command line, so the TECH_FILTERS
+    # candidates carry cpu/mem/ports/cwd for discovery and metrics alike
+    # (None: the host cannot run it, both fall back to per-PID commands)
+    ssh = pool.get(host, username, pem_path, port=port)
+    try:
+        collected = try_batch_collect(ssh, f"{host}:{port or 22}", TECH_FILTERS)
+    except Exception:
+        pool.invalidate(host, username, pem_path, port=port)
+        raise
+
+    batch = collected is not None
+    services = discover_services(host, username, pem_path, patterns, batch=batch, pool=pool, port=port,
+                                 collected=collected)
+    metrics = []
+    for pattern in patterns:
+        metrics.extend(fetch_metrics(host, username, pem_path, pattern, batch=batch, pool=pool, port=port,
+                                     collected=collected))
+
+    return {
+        "server_id": server["server_id"],
+        "services": services,
+        "metrics": metrics
+    }
+
+
+def run_fleet(pool, servers, concurrency=32):
+    """
+    Scan every server with at most `concurrency` hosts in flight.
+    Returns (results, errors) where errors maps server_id -> message.
+    """
+    results, errors = [], {}
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(scan_host, pool, s): s["server_id"] for s in servers}
+        for future in as_completed(futures):
+            server_id = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors[server_id] = str(e)
+    return results, errors
+
+
+# -------------------------------------------------------
+# Feed per-service cpu/mem into the anomaly engine
+# -------------------------------------------------------
+def score_results(engine, results, ts=None):
+    """
+    One sample per (service_id, "cpu"|"mem") per scan: the sum over the
+    service's matched pids. Returns the anomaly events.
+    """
+    totals = {}
+    for result in results:
+        for m in result["metrics"]:
+            cpu_key, mem_key = (m["service_id"], "cpu"), (m["service_id"], "mem")
+            totals[cpu_key] = totals.get(cpu_key, 0.0) + float(m["cpu_percent"] or 0)
+            totals[mem_key] = totals.get(mem_key, 0.0) + float(m["memory_percent"] or 0)
+    if not totals:
+        return []
+    return engine.observe_batch(engine.series_ids(list(totals)), list(totals.values()), ts)
+
+
+# -------------------------------------------------------
+# Main loop
+# -------------------------------------------------------
+if __name__ == "__main__":
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    interval = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+
+    pool = SSHPool()
+    engine = AnomalyEngine()
+
+    while True:
+        started = time.time()
+        try:
+            servers = load_fleet()
+            results, errors = run_fleet(pool, servers, concurrency)
+
+            print(f"[{datetime.now()}] Scanned {len(results)}/{len(servers)} hosts "
+                  f"in {time.time() - started:.1f}s")
+            for result in results:
+                print(json.dumps(result, indent=4))
+            for server_id, err in errors.items():
+                print(f"[ERROR] server_id {server_id}: {err}")
+            for event in score_results(engine, results):
+                print(f"[ANOMALY] {json.dumps(event)}")
+
+            pool.prune()
+        except Exception as e:
+            print(f"Error during fleet scan: {e}")
+
+        time.sleep(max(0, interval - (time.time() - started)))
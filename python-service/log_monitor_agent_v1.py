@@ -1,9 +1,39 @@
-import paramiko
+import os
 import sys
-import time
 import json
+import selectors
+import signal
+import socket
+import time
 from datetime import datetime
 import psycopg2
+from log_writer import BatchedLogWriter, TemplateLogWriter
+from log_parser import LogParser, plain_level
+from log_rates import LogRateMonitor
+from template_miner import TemplateMiner
+from channel_reader import RECV_SIZE, open_stream
+from resumable_tail import CheckpointStore, TailSession, stat_files
+from ssh_pool import SSHPool
+
+# profiler, spool and telemetry are the OneAgent's copies, served to hosts
+# by the installer
+AGENT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                          "..", "backend", "static", "agent"))
+if AGENT_DIR not in sys.path:
+    sys.path.append(AGENT_DIR)
+from profiler import StackSampler
+from spool import Spool
+from telemetry import REGISTRY, serve
+
+
+# -------------------------------------------------------
+# Self-telemetry (exposed with --metrics-port)
+# -------------------------------------------------------
+LINES = REGISTRY.counter("log_monitor_lines_total", "Log lines read", ("service_id",))
+BYTES = REGISTRY.counter("log_monitor_bytes_total", "Log bytes read", ("service_id",))
+LAG_BYTES = REGISTRY.gauge("log_monitor_lag_bytes", "File size minus bytes read, per followed file", ("file",))
+STREAMS = REGISTRY.gauge("log_monitor_open_streams", "Tail channels currently open")
+ERRORS = REGISTRY.counter("log_monitor_errors_total", "Stream errors by kind", ("kind",))
 
 
 # -------------------------------------------------------
@@ -17,6 +47,12 @@ DB_CONFIG = {
     "port": 5432
 }
 
+CHECKPOINT_PATH = "log_checkpoints.json"
+SPOOL_DIR = "log_spool"
+DEAD_LETTER_PATH = "log_dead_letter.jsonl"
+PROFILE_DIR = "profiles"
+PROFILE_SECONDS = 30
+
 
 # -------------------------------------------------------
 # Connect to PostgreSQL
@@ -32,7 +68,7 @@ def get_db_connection():
 
 
 # -------------------------------------------------------
-# Save log entry to DB
+# Save log entry to DB (single row; stream_logs uses BatchedLogWriter)
 # -------------------------------------------------------
 def save_log_to_db(conn, log_entry):
     try:
@@ -58,89 +94,312 @@ def save_log_to_db(conn, log_entry):
 # Detect log level
 # -------------------------------------------------------
 def detect_log_level(line):
-    lvl = line.upper()
-    if "ERROR" in lvl:
-        return "ERROR"
-    if "WARN" in lvl or "WARNING" in lvl:
-        return "WARN"
-    if "INFO" in lvl:
-        return "INFO"
-    if "DEBUG" in lvl:
-        return "DEBUG"
-    return "UNKNOWN"
+    # same whole-word matching LogParser falls back to, so both agree on a
+    # line: "no error found" or "INFORMATION" carry no level
+    return plain_level(line)
+
+
+# -------------------------------------------------------
+# Build / print one log entry
+# -------------------------------------------------------
+def build_log_entry(line, service_id, parsed=None):
+    """
+    parsed: (level, timestamp, logger, message) from LogParser; without it
+    the level comes from detect_log_level and the time is the arrival time.
+    """
+    if parsed is None:
+        return {
+            "service_id": service_id,
+            "log_level": detect_log_level(line),
+            "message": line.strip(),
+            "raw_line": line,
+            "timestamp": datetime.now()
+        }
+
+    level, timestamp, logger, _ = parsed
+    return {
+        "service_id": service_id,
+        "log_level": level,
+        "message": line.strip(),
+        "raw_line": line,
+        "timestamp": timestamp or datetime.now(),
+        "logger": logger
+    }
+
+
+def print_log_entry(log_entry):
+    print(json.dumps({
+        **log_entry,
+        "timestamp": log_entry["timestamp"].isoformat()
+    }))
 
 
 # -------------------------------------------------------
 # Real-time log streaming from server
 # -------------------------------------------------------
-def stream_logs(host, username, pem_path, log_path, service_id):
-    print("[INFO] Connecting to DB...")
-    conn = get_db_connection()
-    print("[INFO] DB connected.")
+def stream_logs(host, username, pem_path, log_path, service_id, echo=True,
+                checkpoint_path=CHECKPOINT_PATH, templates=False, metrics_port=0):
+    stream_many([{
+        "host": host,
+        "username": username,
+        "pem_path": pem_path,
+        "log_path": log_path,
+        "service_id": service_id
+    }], echo=echo, checkpoint_path=checkpoint_path, templates=templates, metrics_port=metrics_port)
+
+
+# -------------------------------------------------------
+# Multi-stream mode: many (host, log_path, service_id) in one process
+# -------------------------------------------------------
+def stream_many(targets, echo=False, reopen_delay=5.0, check_every=5.0,
+                checkpoint_path=CHECKPOINT_PATH, templates=False, spool_dir=SPOOL_DIR,
+                rates_every=60.0, metrics_port=0):
+    """
+    targets: [{"host", "username", "pem_path", "log_path", "service_id"}, ...]
+             (optionally "port" for SSH on a port other than 22)
+
+    One SSH transport per host (SSHPool) with one `tail` channel per file, all
+    driven from a single selector loop and feeding one BatchedLogWriter.
+
+    Lines are parsed per file by a LogParser (level, event timestamp, logger).
+    Each file is a resumable TailSession: its (inode, offset, last-line hash)
+    checkpoint is written to `checkpoint_path` once the rows up to it are
+    committed, and a restart resumes from exactly there (draining a rotated
+    file first). Files are stat'ed every `check_every` seconds, one exec per
+    host, to detect rotation and truncation. Channels that exit or fail are
+    reopened after `reopen_delay`.
 
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    With `templates=True` each message is mined into a per-service template
+    (TemplateMiner) and stored as compact log_event rows plus one log_template
+    row per template instead of full log_entry rows.
 
-    print(f"[INFO] Connecting to {host} via SSH...")
-    ssh.connect(hostname=host, username=username, key_filename=pem_path)
-    print("[INFO] SSH connected.")
+    While the DB is unreachable, batches are spooled to `spool_dir` and
+    replayed in order once it is back (see BatchedLogWriter). Rows the DB
+    rejects for their content go to DEAD_LETTER_PATH.
 
-    cmd = f"tail -Fn0 {log_path}"
+    Every line is also counted per service and level by a LogRateMonitor:
+    rate spikes, error-ratio jumps and services gone silent are printed as
+    [LOG ALERT] events as buckets close, and the per-service window
+    aggregates are printed every `rates_every` seconds.
 
-    transport = ssh.get_transport()
-    channel = transport.open_session()
-    channel.exec_command(cmd)
+    With `metrics_port`, lines/bytes read, writer queue depth and per-file
+    lag are served as Prometheus text on 127.0.0.1:<metrics_port>/metrics.
+    """
+    print(f"[INFO] Multi-stream mode: {len(targets)} log files")
+    store = CheckpointStore(checkpoint_path)
+    writer_class = TemplateLogWriter if templates else BatchedLogWriter
+    writer = writer_class(get_db_connection, on_commit=store.commit, spool=Spool(spool_dir),
+                          dead_letter=DEAD_LETTER_PATH)
+    pool = SSHPool()
+    sel = selectors.DefaultSelector()
 
-    print(f"[INFO] Monitoring log file: {log_path}")
+    REGISTRY.gauge("log_monitor_writer_queue_depth", "Rows queued or in flight in the DB writer",
+                   fn=lambda: writer.stats()["queue_depth"])
+    REGISTRY.gauge("log_monitor_rows_written", "Rows committed by the DB writer",
+                   fn=lambda: writer.rows_written)
+    REGISTRY.gauge("log_monitor_rows_spooled", "Rows spooled to disk during DB outages",
+                   fn=lambda: writer.rows_spooled)
+    STREAMS.fn = lambda: len(sel.get_map())
+    if metrics_port:
+        serve(metrics_port)
+        print(f"[INFO] Metrics on http://127.0.0.1:{metrics_port}/metrics")
 
-    buffer = ""
+    sessions = [(t, TailSession(t["host"], t["log_path"], store)) for t in targets]
+    # one LogParser per file: format detected once, then cached
+    parsers = {}
+    # one TemplateMiner per service: templates are shared by its files
+    miners = {}
 
-    while True:
-        if channel.recv_ready():
-            data = channel.recv(4096).decode(errors="ignore")
+    rates = LogRateMonitor(on_event=lambda e: print(f"[LOG ALERT] {json.dumps(e)}"))
+    for t in targets:
+        rates.track(t["service_id"])
 
-            buffer += data
-            lines = buffer.split("\n")
-            buffer = lines[-1]
+    # (due time, (target, session)) waiting to be (re)opened
+    pending = [(0.0, ts) for ts in sessions]
+    last_check = last_rates = time.monotonic()
 
-            for line in lines[:-1]:
-                if not line.strip():
+    def open_target(target, session):
+        ssh = pool.get(target["host"], target["username"], target["pem_path"], target.get("port"))
+        channel = open_stream(ssh.get_transport(), session.next_command(ssh))
+        channel.settimeout(0.0)
+        sel.register(channel, selectors.EVENT_READ, (target, session))
+        print(f"[INFO] Monitoring {session.key} from offset {session.offset}")
+
+    def drop(channel, reason, delay=reopen_delay):
+        target, session = sel.get_key(channel).data
+        sel.unregister(channel)
+        channel.close()
+        print(f"[WARN] {session.key} {reason}, reopening in {delay}s")
+        pending.append((time.monotonic() + delay, (target, session)))
+
+    def check_files():
+        by_host = {}
+        for key in sel.get_map().values():
+            target, session = key.data
+            conn = (target["host"], target["username"], target["pem_path"], target.get("port"))
+            by_host.setdefault(conn, []).append((key.fileobj, session))
+
+        for conn, streams in by_host.items():
+            try:
+                stats = stat_files(pool.get(*conn), [s.log_path for _, s in streams])
+            except Exception as e:
+                print(f"[ERROR] stat on {conn[0]} failed: {e}")
+                ERRORS.inc(kind="stat")
+                continue
+            for channel, session in streams:
+                stat = stats.get(session.log_path)
+                if stat is not None and stat[0] == session.inode:
+                    LAG_BYTES.set(max(0, stat[1] - session.offset), file=session.key)
+                reason = session.check(stat)
+                if reason:
+                    drop(channel, reason, delay=0.0)
+
+    try:
+        while True:
+            now = time.monotonic()
+            due = [p for p in pending if p[0] <= now]
+            pending[:] = [p for p in pending if p[0] > now]
+            for _, (target, session) in due:
+                try:
+                    open_target(target, session)
+                except Exception as e:
+                    print(f"[ERROR] {session.key}: {e}")
+                    ERRORS.inc(kind="open")
+                    pool.invalidate(target["host"], target["username"], target["pem_path"], target.get("port"))
+                    pending.append((now + reopen_delay, (target, session)))
+
+            if now - last_check >= check_every:
+                last_check = now
+                check_files()
+
+            rates.advance()
+            if now - last_rates >= rates_every:
+                last_rates = now
+                for service_id, agg in rates.aggregates().items():
+                    print(f"[STATS] service {service_id} logs: {json.dumps(agg)}")
+
+            if not sel.get_map():
+                time.sleep(max(0.0, min(p[0] for p in pending) - now) if pending else reopen_delay)
+                continue
+
+            for key, _ in sel.select(timeout=1.0):
+                channel = key.fileobj
+                target, session = key.data
+                try:
+                    data = channel.recv(RECV_SIZE)
+                except socket.timeout:
+                    continue
+                except Exception as e:
+                    ERRORS.inc(kind="read")
+                    drop(channel, f"read failed ({e})")
                     continue
 
-                log_entry = {
-                    "service_id": service_id,
-                    "log_level": detect_log_level(line),
-                    "message": line.strip(),
-                    "raw_line": line,
-                    "timestamp": datetime.now()
-                }
+                if not data:
+                    # a drained rotated file moves straight on to the new one
+                    if session.has_next():
+                        drop(channel, "caught up", delay=0.0)
+                    else:
+                        drop(channel, "tail exited")
+                    continue
 
-                print(json.dumps({
-                    **log_entry,
-                    "timestamp": log_entry["timestamp"].isoformat()
-                }))
+                lines, checkpoint = session.feed(data)
+                lines = [line for line in lines if line.strip()]
+                BYTES.inc(len(data), service_id=target["service_id"])
+                LINES.inc(len(lines), service_id=target["service_id"])
+                parser = parsers.setdefault(session.key, LogParser())
+                miner = None
+                if templates:
+                    miner = miners.get(target["service_id"])
+                    if miner is None:
+                        miner = miners[target["service_id"]] = TemplateMiner(target["service_id"])
 
-                # Save to DB
-                save_log_to_db(conn, log_entry)
+                last_entry = None
+                level_counts = {}
+                for line, parsed in zip(lines, parser.parse_batch(lines)):
+                    if last_entry is not None:
+                        writer.put(last_entry)
+                    last_entry = build_log_entry(line, target["service_id"], parsed)
+                    level = last_entry["log_level"]
+                    level_counts[level] = level_counts.get(level, 0) + 1
+                    if echo:
+                        print_log_entry(last_entry)
+                    if miner is not None:
+                        message = (parsed[3].strip() if parsed is not None else "") or last_entry["message"]
+                        template, params, _ = miner.add(message, last_entry["log_level"])
+                        last_entry["template_id"] = template.template_id
+                        last_entry["template"] = template.template
+                        last_entry["params"] = params
 
-        if channel.exit_status_ready():
-            print("[WARN] tail -F exited")
-            break
+                for level, count in level_counts.items():
+                    rates.observe(target["service_id"], level, count)
 
-        time.sleep(0.2)
+                # the feed's last row carries the offset its batch advances to
+                if last_entry is not None:
+                    last_entry["checkpoint"] = checkpoint
+                    writer.put(last_entry)
+    finally:
+        for key in list(sel.get_map().values()):
+            key.fileobj.close()
+        sel.close()
+        pool.close_all()
+        writer.close(timeout=30)
+        print(f"[INFO] Closed SSH and DB connections. Writer stats: {writer.stats()}")
+        print(f"[STATS] log rates: {rates.stats()}")
+        for service_id, miner in miners.items():
+            print(f"[STATS] service {service_id}: {len(miner.templates)} templates, "
+                  f"top {miner.top(5)}")
 
-    ssh.close()
-    conn.close()
-    print("[INFO] Closed SSH and DB connections.")
+
+# -------------------------------------------------------
+# On-demand profiling: --profile N at start, `kill -USR2 <pid>` any time
+# -------------------------------------------------------
+def enable_profiling(seconds=0, directory=PROFILE_DIR):
+    profiler = StackSampler()
+
+    def done(p):
+        print(f"[INFO] Profile written to {p.write(directory, 'log-monitor')} ({p.samples} samples)")
+
+    def start(secs):
+        if profiler.start(secs, on_done=done):
+            print(f"[INFO] Profiling for {profiler.seconds:.0f}s")
+
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, lambda *_: start(PROFILE_SECONDS))
+    if seconds:
+        start(seconds)
+    return profiler
 
 
 # -------------------------------------------------------
 # CLI
 # -------------------------------------------------------
 if __name__ == "__main__":
+    templates = "--templates" in sys.argv
+    if templates:
+        sys.argv.remove("--templates")
+
+    metrics_port = 0
+    if "--metrics-port" in sys.argv:
+        i = sys.argv.index("--metrics-port")
+        metrics_port = int(sys.argv[i + 1])
+        del sys.argv[i:i + 2]
+
+    profile_seconds = 0
+    if "--profile" in sys.argv:
+        i = sys.argv.index("--profile")
+        profile_seconds = int(sys.argv[i + 1])
+        del sys.argv[i:i + 2]
+    enable_profiling(profile_seconds)
+
+    if len(sys.argv) == 3 and sys.argv[1] == "--targets":
+        with open(sys.argv[2]) as f:
+            stream_many(json.load(f), templates=templates, metrics_port=metrics_port)
+        sys.exit(0)
+
     if len(sys.argv) != 6:
         print("\nUsage:")
-        print("python log_monitor_agent.py <host> <username> <pem_path> <log_path> <service_id>\n")
+        print("python log_monitor_agent.py [--templates] [--metrics-port N] [--profile SECONDS] <host> <username> <pem_path> <log_path> <service_id>")
+        print("python log_monitor_agent.py [--templates] [--metrics-port N] [--profile SECONDS] --targets <targets.json>\n")
         sys.exit(1)
 
     host = sys.argv[1]
@@ -149,4 +408,4 @@ if __name__ == "__main__":
     log_path = sys.argv[4]
     service_id = int(sys.argv[5])
 
-    stream_logs(host, username, pem_path, log_path, service_id)
+    stream_logs(host, username, pem_path, log_path, service_id, templates=templates, metrics_port=metrics_port)
@@ -0,0 +1,333 @@
+import json
+import re
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+
+# -------------------------------------------------------
+# Level normalisation (detect_log_level uses plain_level below)
+# -------------------------------------------------------
+LEVELS = {
+    "TRACE": "DEBUG", "DEBUG": "DEBUG", "FINE": "DEBUG",
+    "INFO": "INFO", "NOTICE": "INFO", "INFORMATION": "INFO",
+    "WARN": "WARN", "WARNING": "WARN",
+    "ERROR": "ERROR", "ERR": "ERROR", "SEVERE": "ERROR",
+    "FATAL": "ERROR", "CRITICAL": "ERROR", "CRIT": "ERROR",
+    "ALERT": "ERROR", "EMERG": "ERROR", "PANIC": "ERROR",
+}
+
+# syslog severity (PRI % 8) -> level
+SYSLOG_SEVERITY = ("ERROR", "ERROR", "ERROR", "ERROR", "WARN", "INFO", "INFO", "DEBUG")
+
+MONTHS = {m: i for i, m in enumerate(
+    ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"), 1)}
+
+_LEVEL_ALT = "TRACE|DEBUG|INFO|NOTICE|WARN|WARNING|ERROR|SEVERE|FATAL|CRITICAL"
+_ISO_TS = r"(?:\d{4}-\d{2}-\d{2}[ T])?\d{2}:\d{2}:\d{2}(?:[.,]\d{1,9})?(?:Z|[+-]\d{2}:?\d{2})?"
+
+# level as a standalone upper-case token near the start of an unknown line
+_PLAIN_LEVEL = re.compile(r"(?:^|[\s\[|<(\"])(" + _LEVEL_ALT + r")(?=[\s\]|:>)\"-]|$)")
+_PLAIN_TS = re.compile(r"\[?(\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}(?:[.,]\d{1,9})?(?:Z|[+-]\d{2}:?\d{2})?)")
+PLAIN_SCAN = 120
+# level word leading a message that has no level field (syslog); a whole
+# word only, so "error-free" or "info_url" are not levels
+_MSG_LEVEL = re.compile(r"(error|err|warning|warn|fatal|critical|crit|notice|info|debug)(?![\w-])", re.I)
+
+
+# -------------------------------------------------------
+# Timestamp parsers (no strptime on the hot path)
+# -------------------------------------------------------
+def _tz_to_local(dt, tz):
+    if not tz:
+        return dt
+    if tz == "Z":
+        offset = timedelta(0)
+    else:
+        sign = -1 if tz[0] == "-" else 1
+        tz = tz[1:].replace(":", "")
+        offset = sign * timedelta(hours=int(tz[:2]), minutes=int(tz[2:4]))
+    return dt.replace(tzinfo=timezone(offset)).astimezone().replace(tzinfo=None)
+
+
+_iso_cache = {}
+
+
+def parse_iso(ts):
+    """'2024-01-02 03:04:05,123+02:00' / '03:04:05.123' -> naive local datetime."""
+    if ts[2:3] == ":":
+        ts = f"{date.today().isoformat()} {ts}"
+
+    # lines share seconds: cache per "second + zone", add the fraction after
+    micro = 0
+    key = ts
+    if ts[19:20] in (".", ","):
+        end = 20
+        while end < len(ts) and ts[end].isdigit():
+            end += 1
+        micro = int(ts[20:end][:6].ljust(6, "0"))
+        key = ts[:19] + ts[end:]
+
+    base = _iso_cache.get(key)
+    if base is None:
+        try:
+            base = _tz_to_local(datetime(int(ts[0:4]), int(ts[5:7]), int(ts[8:10]),
+                                         int(ts[11:13]), int(ts[14:16]), int(ts[17:19])), key[19:])
+        except (ValueError, IndexError):
+            return None
+        if len(_iso_cache) > 4096:
+            _iso_cache.clear()
+        _iso_cache[key] = base
+    return base.replace(microsecond=micro) if micro else base
+
+
+def parse_clf(ts):
+    """nginx/apache access '10/Oct/2000:13:55:36 -0700'."""
+    try:
+        base = datetime(int(ts[7:11]), MONTHS[ts[3:6]], int(ts[0:2]),
+                        int(ts[12:14]), int(ts[15:17]), int(ts[18:20]))
+        return _tz_to_local(base, ts[21:].strip())
+    except (ValueError, IndexError, KeyError):
+        return None
+
+
+def parse_slash(ts):
+    """nginx error '2024/01/02 03:04:05'."""
+    try:
+        return datetime(int(ts[0:4]), int(ts[5:7]), int(ts[8:10]),
+                        int(ts[11:13]), int(ts[14:16]), int(ts[17:19]))
+    except (ValueError, IndexError):
+        return None
+
+
+def parse_syslog(ts):
+    """RFC3164 'Jan  2 03:04:05' (no year: assume the most recent one)."""
+    try:
+        now = datetime.now()
+        dt = datetime(now.year, MONTHS[ts[0:3]], int(ts[4:6]),
+                      int(ts[7:9]), int(ts[10:12]), int(ts[13:15]))
+        return dt.replace(year=now.year - 1) if dt > now + timedelta(days=1) else dt
+    except (ValueError, IndexError, KeyError):
+        return None
+
+
+def parse_json_ts(value):
+    if isinstance(value, (int, float)):
+        secs = value / 1000 if value > 1e11 else value
+        try:
+            return datetime.fromtimestamp(secs)
+        except (OverflowError, OSError, ValueError):
+            return None
+    if isinstance(value, str):
+        dt = parse_iso(value)
+        if dt is None:
+            try:
+                dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+                if dt.tzinfo:
+                    dt = dt.astimezone().replace(tzinfo=None)
+            except ValueError:
+                return None
+        return dt
+    return None
+
+
+# -------------------------------------------------------
+# Formats: name -> (anchored regex, timestamp parser)
+# each regex exposes some of: ts, level, logger, msg, pri, status
+# -------------------------------------------------------
+REGEX_FORMATS = {
+    # logback / log4j / spring boot:
+    #   2024-01-02 03:04:05.123 [main] INFO  com.acme.App - started
+    #   2024-01-02 03:04:05.123  INFO 42 --- [main] c.a.App : started
+    "logback": (re.compile(
+        r"(?P<ts>" + _ISO_TS + r")\s+(?:\[(?P<thread>[^\]]*)\]\s+)?"
+        r"(?P<level>" + _LEVEL_ALT + r")\s+(?:\d+\s+---\s+\[[^\]]*\]\s+)?"
+        r"(?:\[[^\]]*\]\s+)?(?P<logger>[\w.$/-]+)\s*[-:]\s?(?P<msg>.*)"), parse_iso),
+    # python logging: asctime - name - levelname - message
+    "python": (re.compile(
+        r"(?P<ts>" + _ISO_TS + r") - (?P<logger>\S+) - (?P<level>[A-Z]+) - (?P<msg>.*)"), parse_iso),
+    # python basicConfig default: LEVEL:name:message
+    "python_basic": (re.compile(
+        r"(?P<level>DEBUG|INFO|WARNING|ERROR|CRITICAL):(?P<logger>[^:]*):(?P<msg>.*)"), None),
+    # asctime [LEVEL] message (our own agents' format)
+    "bracketed": (re.compile(
+        r"(?P<ts>" + _ISO_TS + r")\s+\[(?P<level>" + _LEVEL_ALT + r")\]\s+(?P<msg>.*)"), parse_iso),
+    # RFC5424: <PRI>1 TIMESTAMP HOST APP PROCID MSGID SD MSG
+    "syslog5424": (re.compile(
+        r"<(?P<pri>\d{1,3})>1 (?P<ts>\S+) \S+ (?P<logger>\S+) \S+ \S+ (?:-|\[.*?\]) ?(?P<msg>.*)"), parse_iso),
+    # RFC3164: Jan  2 03:04:05 host prog[pid]: message
+    "syslog": (re.compile(
+        r"(?P<ts>[A-Z][a-z]{2} [ \d]\d \d{2}:\d{2}:\d{2}) \S+ (?P<logger>[^:\[\s]+)(?:\[\d+\])?: (?P<msg>.*)"), parse_syslog),
+    # nginx / apache combined access log
+    "nginx_access": (re.compile(
+        r"\S+ \S+ \S+ \[(?P<ts>[^\]]+)\] \"(?P<msg>[^\"]*)\" (?P<status>\d{3}) "), parse_clf),
+    # nginx error log: 2024/01/02 03:04:05 [error] 12#0: *1 message
+    "nginx_error": (re.compile(
+        r"(?P<ts>\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}) \[(?P<level>\w+)\] (?P<msg>.*)"), parse_slash),
+}
+
+JSON_LEVEL_KEYS = ("level", "levelname", "severity", "lvl", "log.level")
+JSON_TS_KEYS = ("@timestamp", "timestamp", "time", "ts", "asctime")
+JSON_LOGGER_KEYS = ("logger", "logger_name", "name", "log.logger")
+JSON_MSG_KEYS = ("message", "msg", "event")
+
+DETECT_SAMPLE = 50
+REDETECT_AFTER = 200
+
+
+def plain_level(line):
+    """Whole-word, upper-case level near the start of a line, else UNKNOWN."""
+    m = _PLAIN_LEVEL.search(line[:PLAIN_SCAN])
+    return LEVELS[m.group(1)] if m else "UNKNOWN"
+
+
+def _plain(line):
+    """Fallback for unrecognised lines: plain_level and a leading ISO timestamp."""
+    t = _PLAIN_TS.match(line[:PLAIN_SCAN])
+    return plain_level(line), parse_iso(t.group(1)) if t else None, None, line
+
+
+def _parse_json(line):
+    try:
+        doc = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(doc, dict):
+        return None
+
+    level = next((doc[k] for k in JSON_LEVEL_KEYS if k in doc), None)
+    ts = next((doc[k] for k in JSON_TS_KEYS if k in doc), None)
+    logger = next((doc[k] for k in JSON_LOGGER_KEYS if k in doc), None)
+    msg = next((doc[k] for k in JSON_MSG_KEYS if k in doc), line)
+    level = LEVELS.get(str(level).upper(), "UNKNOWN") if level is not None else "UNKNOWN"
+    return level, parse_json_ts(ts), logger, str(msg)
+
+
+def _level_kind(regex):
+    for kind in ("pri", "status", "level"):
+        if kind in regex.groupindex:
+            return kind
+    return "msg"
+
+
+# how each format yields its level, resolved once at import
+LEVEL_KIND = {fmt: _level_kind(regex) for fmt, (regex, _) in REGEX_FORMATS.items()}
+
+
+def _msg_level(msg):
+    m = _MSG_LEVEL.match(msg)
+    return LEVELS[m.group(1).upper()] if m else _plain(msg)[0]
+
+
+def _parse_regex(fmt, line):
+    regex, ts_parser = REGEX_FORMATS[fmt]
+    m = regex.match(line)
+    if m is None:
+        return None
+    g = m.groupdict()
+
+    kind = LEVEL_KIND[fmt]
+    if kind == "level":
+        level = LEVELS.get(g["level"].upper(), "UNKNOWN")
+    elif kind == "pri":
+        level = SYSLOG_SEVERITY[int(g["pri"]) % 8]
+    elif kind == "status":
+        status = int(g["status"])
+        level = "ERROR" if status >= 500 else "WARN" if status >= 400 else "INFO"
+    else:
+        level = _msg_level(g["msg"])
+
+    ts = ts_parser(g["ts"]) if ts_parser else None
+    return level, ts, g.get("logger"), g["msg"] or line
+
+
+def parse_with(fmt, line):
+    """-> (level, timestamp | None, logger | None, message) or None if fmt does not match."""
+    if fmt == "json":
+        return _parse_json(line) if line[:1] == "{" else None
+    return _parse_regex(fmt, line)
+
+
+def detect_format(lines):
+    """Pick the format matching most of the sample; None when nothing fits."""
+    sample = [l for l in lines if l.strip()][:DETECT_SAMPLE]
+    best, best_hits = None, 0
+    for fmt in ("json", *REGEX_FORMATS):
+        hits = sum(1 for l in sample if parse_with(fmt, l) is not None)
+        if hits > best_hits:
+            best, best_hits = fmt, hits
+    return best
+
+
+# -------------------------------------------------------
+# Per-file parser with a cached format
+# -------------------------------------------------------
+class LogParser:
+    """
+    Detects the file's format from its first lines, then parses every line
+    with that one anchored regex (or JSON). Lines the format does not match
+    (stack traces, continuation lines) go through the plain fallback; after
+    REDETECT_AFTER misses in a row the format is detected again.
+    """
+
+    def __init__(self, fmt=None):
+        self.format = fmt
+        self._misses = 0
+
+    def parse(self, line):
+        return self.parse_batch([line])[0]
+
+    def parse_batch(self, lines):
+        if self.format is None or self._misses >= REDETECT_AFTER:
+            detected = detect_format(lines)
+            if detected is not None:
+                self.format = detected
+                self._misses = 0
+
+        fmt = self.format
+        out = []
+        for line in lines:
+            parsed = parse_with(fmt, line) if fmt else None
+            if parsed is None:
+                self._misses += 1
+                parsed = _plain(line)
+            else:
+                self._misses = 0
+            out.append(parsed)
+        return out
+
+
+# -------------------------------------------------------
+# Throughput comparison against detect_log_level
+# -------------------------------------------------------
+SAMPLE_LINES = {
+    "logback": "2024-05-01 10:15:30.123 [http-nio-8080-exec-1] INFO  com.acme.payment.PaymentService - payment {} accepted for order 42",
+    "python": "2024-05-01 10:15:30,123 - payments.worker - WARNING - retrying job 42 after timeout",
+    "json": '{"@timestamp":"2024-05-01T10:15:30.123Z","level":"ERROR","logger":"api","message":"no error budget left"}',
+    "syslog": "May  1 10:15:30 web-1 sshd[4242]: Accepted publickey for ubuntu from 10.0.0.1 port 50022",
+    "nginx_access": '10.0.0.1 - - [01/May/2024:10:15:30 +0000] "GET /api/v1/orders HTTP/1.1" 502 157 "-" "curl/8.0"',
+}
+
+
+def benchmark(n=200000):
+    from log_monitor_agent_v1 import detect_log_level
+
+    for name, line in SAMPLE_LINES.items():
+        lines = [line] * n
+
+        start = time.perf_counter()
+        for l in lines:
+            detect_log_level(l)
+        base = n / (time.perf_counter() - start)
+
+        parser = LogParser()
+        start = time.perf_counter()
+        for i in range(0, n, 1000):
+            parser.parse_batch(lines[i:i + 1000])
+        rate = n / (time.perf_counter() - start)
+
+        print(f"{name:<13} format={parser.format:<13} detect_log_level {base:>12,.0f} lines/s"
+              f"   LogParser {rate:>12,.0f} lines/s   {parser.parse(line)[:3]}")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
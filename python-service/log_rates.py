@@ -0,0 +1,192 @@
+import time
+
+import numpy as np
+
+LEVELS = ("ERROR", "WARN", "INFO", "DEBUG", "UNKNOWN")
+LEVEL_INDEX = {level: i for i, level in enumerate(LEVELS)}
+ERROR = LEVEL_INDEX["ERROR"]
+
+
+# -------------------------------------------------------
+# Per-service log rate / error-ratio windows
+# -------------------------------------------------------
+class LogRateMonitor:
+    """
+    Counts log lines per service and level in fixed `bucket_seconds` buckets
+    and keeps the last `window` closed buckets per service in a ring
+    (services x window x levels int32 array). Window sums are updated
+    incrementally as buckets close, so the cost of each close is
+    O(services x levels) no matter how long the window is.
+
+    When a bucket closes, every service is checked against its window:
+      rate_spike  - lines > mean + spike_factor * max(std, sqrt(mean), 1)
+      error_ratio - ERROR share of the bucket exceeds the window's by
+                    `ratio_jump` (e.g. 0.02 -> 0.25)
+      silent      - a service that averaged at least `min_rate` lines per
+                    bucket logged nothing for `silent_buckets` buckets
+                    (reported once per silence)
+    Spike and ratio checks need `min_lines` in the bucket and `warmup`
+    buckets of history. Events are returned by advance() and passed to
+    `on_event`; aggregates() gives the current window per service.
+
+    Buckets follow arrival time: replayed backlogs are counted when read.
+    """
+
+    def __init__(self, bucket_seconds=10, window=60, spike_factor=4.0, min_lines=20,
+                 ratio_jump=0.2, silent_buckets=6, min_rate=1.0, warmup=12,
+                 capacity=64, on_event=None):
+        self.bucket_seconds = bucket_seconds
+        self.window = window
+        self.spike_factor = spike_factor
+        self.min_lines = min_lines
+        self.ratio_jump = ratio_jump
+        self.silent_buckets = silent_buckets
+        self.min_rate = min_rate
+        self.warmup = warmup
+        self.on_event = on_event
+
+        self.keys = []
+        self._ids = {}
+        self._alloc(capacity)
+        self.bucket = None
+
+        self.lines = 0
+        self.events = 0
+
+    # ---------------- services ----------------
+    def _alloc(self, capacity):
+        self.ring = np.zeros((capacity, self.window, len(LEVELS)), dtype=np.int32)
+        self.current = np.zeros((capacity, len(LEVELS)), dtype=np.int64)
+        self.win_sum = np.zeros((capacity, len(LEVELS)), dtype=np.int64)
+        self.win_sq = np.zeros(capacity, dtype=np.float64)
+        self.filled = np.zeros(capacity, dtype=np.int64)
+        self.silent_run = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self):
+        old = (self.ring, self.current, self.win_sum, self.win_sq, self.filled, self.silent_run)
+        self._alloc(len(self.filled) * 2)
+        for new, prev in zip((self.ring, self.current, self.win_sum, self.win_sq,
+                              self.filled, self.silent_run), old):
+            new[:len(prev)] = prev
+
+    def track(self, service_id):
+        """Register a service up front, so it can go silent before its first line."""
+        sid = self._ids.get(service_id)
+        if sid is None:
+            sid = len(self.keys)
+            if sid == len(self.filled):
+                self._grow()
+            self._ids[service_id] = sid
+            self.keys.append(service_id)
+        return sid
+
+    # ---------------- ingest ----------------
+    def observe(self, service_id, level, count=1, ts=None):
+        """Count `count` lines of `level`; returns events of buckets closed on the way."""
+        events = self.advance(ts)
+        sid = self.track(service_id)
+        self.current[sid, LEVEL_INDEX.get(level, LEVEL_INDEX["UNKNOWN"])] += count
+        self.lines += count
+        return events
+
+    def advance(self, ts=None):
+        """Close every bucket that ended before `ts` (default: now)."""
+        bucket = int((time.time() if ts is None else ts) // self.bucket_seconds)
+        if self.bucket is None:
+            self.bucket = bucket
+        if bucket <= self.bucket:
+            return []
+
+        events = []
+        # after `window` empty buckets the ring is all zeros: skip the rest
+        for _ in range(min(bucket - self.bucket, self.window + self.silent_buckets)):
+            events.extend(self._close())
+            self.bucket += 1
+        self.bucket = bucket
+        return events
+
+    def _close(self):
+        n = len(self.keys)
+        if n == 0:
+            return []
+
+        cur = self.current[:n]
+        totals = cur.sum(axis=1)
+        errors = cur[:, ERROR]
+        win_tot = self.win_sum[:n].sum(axis=1)
+        hist = np.maximum(np.minimum(self.filled[:n], self.window), 1)
+
+        mean = win_tot / hist
+        std = np.sqrt(np.maximum(self.win_sq[:n] / hist - mean * mean, 0.0))
+        base_ratio = self.win_sum[:n, ERROR] / np.maximum(win_tot, 1)
+        ratio = errors / np.maximum(totals, 1)
+
+        ready = (self.filled[:n] >= self.warmup) & (totals >= self.min_lines)
+        limit = mean + self.spike_factor * np.maximum(np.maximum(std, np.sqrt(mean)), 1.0)
+        spike = ready & (totals > limit)
+        jump = ready & (ratio - base_ratio >= self.ratio_jump)
+
+        quiet = (totals == 0) & (mean >= self.min_rate)
+        self.silent_run[:n] = np.where(quiet, self.silent_run[:n] + 1, 0)
+        silent = self.silent_run[:n] == self.silent_buckets
+
+        start = self.bucket * self.bucket_seconds
+        events = []
+        for kind, mask in (("rate_spike", spike), ("error_ratio", jump), ("silent", silent)):
+            for i in np.flatnonzero(mask):
+                events.append(self._event(kind, i, start, totals, errors, mean, ratio, base_ratio))
+
+        # push the closed bucket into the ring, replacing the oldest
+        slot = self.bucket % self.window
+        old = self.ring[:n, slot]
+        old_tot = old.sum(axis=1)
+        self.win_sum[:n] += cur - old
+        self.win_sq[:n] += totals.astype(np.float64) ** 2 - old_tot.astype(np.float64) ** 2
+        self.ring[:n, slot] = cur
+        self.current[:n] = 0
+        self.filled[:n] += 1
+        return events
+
+    def _event(self, kind, i, start, totals, errors, mean, ratio, base_ratio):
+        event = {
+            "service_id": self.keys[i],
+            "type": kind,
+            "bucket_start": start,
+            "bucket_seconds": self.bucket_seconds,
+            "lines": int(totals[i]),
+            "errors": int(errors[i]),
+            "expected_lines": round(float(mean[i]), 2),
+            "error_ratio": round(float(ratio[i]), 4),
+            "baseline_error_ratio": round(float(base_ratio[i]), 4)
+        }
+        self.events += 1
+        if self.on_event is not None:
+            self.on_event(event)
+        return event
+
+    # ---------------- read ----------------
+    def aggregates(self):
+        """{service_id: counts and rates over the closed buckets of the window}"""
+        result = {}
+        for i, service_id in enumerate(self.keys):
+            counts = self.win_sum[i]
+            total = int(counts.sum())
+            seconds = int(min(self.filled[i], self.window)) * self.bucket_seconds
+            result[service_id] = {
+                "window_seconds": seconds,
+                "lines": total,
+                "levels": {level: int(c) for level, c in zip(LEVELS, counts) if c},
+                "lines_per_sec": round(total / seconds, 3) if seconds else 0.0,
+                "error_ratio": round(int(counts[ERROR]) / total, 4) if total else 0.0,
+                "silent_buckets": int(self.silent_run[i])
+            }
+        return result
+
+    def stats(self):
+        return {
+            "services": len(self.keys),
+            "lines": self.lines,
+            "events": self.events,
+            "state_bytes": sum(a.nbytes for a in (self.ring, self.current, self.win_sum,
+                                                  self.win_sq, self.filled, self.silent_run))
+        }
@@ -0,0 +1,473 @@
+import csv
+import io
+import json
+import threading
+import time
+from collections import deque
+
+
+LOG_ENTRY_COLUMNS = ("service_id", "log_level", "message", "raw_line", "timestamp")
+LOG_EVENT_COLUMNS = ("service_id", "template_id", "log_level", "params", "timestamp")
+
+
+def _data_error(e):
+    """True when the rows themselves were rejected, so retrying them cannot help."""
+    pgcode = getattr(e, "pgcode", None)
+    if pgcode:
+        # 22: data exception (bad encoding, value too long), 23: constraint violation
+        return pgcode[:2] in ("22", "23")
+    # raised while building the rows (bad value in an entry)
+    return isinstance(e, (ValueError, TypeError, KeyError, AttributeError))
+
+
+# -------------------------------------------------------
+# Buffered, batched writer for log_entry rows
+# -------------------------------------------------------
+class BatchedLogWriter:
+    """
+    Collects log_entry dicts in memory and writes them with one COPY per batch
+    from a background thread. A batch is flushed when it reaches `max_batch`
+    rows or the oldest queued row is `max_wait` seconds old.
+
+    A batch that fails on the connection (DB down, connection lost) is
+    rolled back and put back at the head of the queue (the connection is
+    re-opened if it died) and retried with backoff, so rows are never
+    dropped. A batch the DB rejects for its data (bad encoding, value too
+    long) is bisected instead: the parts that go in are committed and each
+    row that does not is appended to `dead_letter` (a JSON-lines file, or
+    only logged without one), so one bad row cannot stall ingest.
+
+    When `max_queue` rows are pending, put() blocks the caller, which
+    pushes back on the tail reader instead of growing without bound.
+
+    `on_commit(batch)` is called after each batch is committed (e.g. to
+    persist tail checkpoints only once their rows are durable).
+
+    With a `spool` (spool.Spool), a failed batch goes to disk instead of
+    being retried in memory, and so do all later batches while the spool is
+    not empty (keeping their order); the DB is re-tried with backoff and,
+    once it answers, the spool is drained oldest first at up to
+    `replay_rate` batches per second. A spooled batch that fails
+    `max_replay_attempts` times in a row while the DB is reachable is moved
+    to `dead_letter` so it cannot block the batches behind it. Spooled rows
+    count as durable for on_commit, so an outage survives a restart of the
+    monitor.
+    """
+
+    def __init__(self, connect, max_batch=2000, max_wait=1.0, max_queue=200000,
+                 max_backoff=30.0, report_every=60.0, on_commit=None,
+                 spool=None, replay_rate=20.0, dead_letter=None, max_replay_attempts=5):
+        self.connect = connect
+        self.dead_letter = dead_letter
+        self.on_commit = on_commit
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self.max_replay_attempts = max_replay_attempts
+        self._replay_failures = (None, 0)   # (spool position, consecutive failures)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.max_backoff = max_backoff
+        self.report_every = report_every
+
+        self._queue = deque()
+        self._oldest = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._force = False
+        self._inflight = 0
+        self._conn = None
+
+        self.rows_written = 0
+        self.batches_written = 0
+        self.failed_flushes = 0
+        self.rows_spooled = 0
+        self.rows_replayed = 0
+        self.rows_dead_lettered = 0
+        self.last_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+        self._last_report = time.monotonic()
+
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    # ---------------- producer side ----------------
+    def put(self, log_entry):
+        with self._cond:
+            while len(self._queue) >= self.max_queue and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                raise RuntimeError("writer is closed")
+            if not self._queue:
+                self._oldest = time.monotonic()
+                self._cond.notify_all()
+            self._queue.append(log_entry)
+            if len(self._queue) >= self.max_batch:
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far has been written."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._force = True
+            self._cond.notify_all()
+            while self._queue or self._inflight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=None):
+        self.flush(timeout)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        # the writer thread closes its connection on the way out
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "queue_depth": len(self._queue) + self._inflight,
+            "rows_written": self.rows_written,
+            "batches_written": self.batches_written,
+            "failed_flushes": self.failed_flushes,
+            "rows_spooled": self.rows_spooled,
+            "rows_replayed": self.rows_replayed,
+            "rows_dead_lettered": self.rows_dead_lettered,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self.total_flush_ms / self.batches_written, 2) if self.batches_written else 0.0
+        }
+
+    # ---------------- writer thread ----------------
+    def _take_batch(self, idle=None):
+        """Next batch; None once closed; [] after `idle` seconds with nothing queued."""
+        with self._cond:
+            while True:
+                if self._queue:
+                    due = self._oldest + self.max_wait - time.monotonic()
+                    if len(self._queue) >= self.max_batch or due <= 0 or self._force or self._closed:
+                        break
+                    self._cond.wait(due if idle is None else min(due, idle))
+                elif self._closed:
+                    return None
+                elif idle is not None:
+                    self._cond.wait(idle)
+                    if not self._queue:
+                        return []
+                else:
+                    self._cond.wait(self.report_every)
+                    self._maybe_report()
+
+            n = min(self.max_batch, len(self._queue))
+            batch = [self._queue.popleft() for _ in range(n)]
+            self._inflight = n
+            self._cond.notify_all()
+            if self._queue:
+                self._oldest = time.monotonic()
+            else:
+                self._oldest = None
+                self._force = False
+            return batch
+
+    def _requeue(self, batch):
+        with self._cond:
+            self._queue.extendleft(reversed(batch))
+            self._inflight = 0
+            self._oldest = time.monotonic()
+
+    def _spooling(self):
+        return self.spool is not None and self.spool.pending()
+
+    def _run(self):
+        try:
+            self._loop()
+        finally:
+            if self._conn is not None:
+                try:
+                    self._conn.close()
+                except Exception:
+                    pass
+                self._conn = None
+
+    def _loop(self):
+        backoff = min(0.5, self.max_backoff)
+        next_try = 0.0      # earliest DB attempt while the spool holds rows
+        while True:
+            spooling = self._spooling()
+            batch = self._take_batch(idle=max(0.05, next_try - time.monotonic()) if spooling else None)
+            if batch is None:
+                return
+
+            if spooling:
+                if batch:
+                    self._spool_batch(batch)
+                if time.monotonic() >= next_try:
+                    if self._replay_one():
+                        backoff = min(0.5, self.max_backoff)
+                        next_try = time.monotonic() + 1.0 / self.replay_rate
+                    else:
+                        next_try = time.monotonic() + backoff
+                        backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            start = time.perf_counter()
+            try:
+                rows = self._rows(batch)
+                self._write_rows(self._db(), rows)
+                self._conn.commit()
+            except Exception as e:
+                self.failed_flushes += 1
+                self._rollback()
+                if _data_error(e):
+                    print(f"[DB ERROR] flush of {len(batch)} rows rejected, isolating bad rows: {e}")
+                    batch, e = self._salvage(batch)
+                    if not batch:
+                        backoff = min(0.5, self.max_backoff)
+                        with self._cond:
+                            self._inflight = 0
+                            self._cond.notify_all()
+                        continue
+                if self.spool is not None:
+                    print(f"[DB ERROR] flush of {len(batch)} rows failed, spooling to disk: {e}")
+                    self._spool_batch(batch)
+                    next_try = time.monotonic() + backoff
+                    backoff = min(backoff * 2, self.max_backoff)
+                    continue
+                print(f"[DB ERROR] flush of {len(batch)} rows failed, retrying in {backoff:.1f}s: {e}")
+                self._requeue(batch)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            backoff = min(0.5, self.max_backoff)
+            self.last_flush_ms = (time.perf_counter() - start) * 1000
+            self.total_flush_ms += self.last_flush_ms
+            self.rows_written += len(batch)
+            self.batches_written += 1
+            self._done(batch)
+
+    def _db(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = self.connect()
+        return self._conn
+
+    def _committed(self, batch):
+        if self.on_commit is not None:
+            try:
+                self.on_commit(batch)
+            except Exception as e:
+                print(f"[ERROR] on_commit hook failed: {e}")
+
+    def _done(self, batch):
+        self._committed(batch)
+        with self._cond:
+            self._inflight = 0
+            self._cond.notify_all()
+        self._maybe_report()
+
+    def _salvage(self, batch):
+        """
+        Write a batch the DB rejected for its data, bisecting it: parts that
+        go in are committed, single rows that do not are dead-lettered.
+        Parts are handled left to right, so what is done is always a prefix
+        of the batch and on_commit sees it in order. Returns (rows left,
+        error) when the DB fails for another reason, ([], None) when done.
+        """
+        pending = [batch]
+        handled = []
+        while pending:
+            part = pending.pop()
+            try:
+                self._write_rows(self._db(), self._rows(part))
+                self._conn.commit()
+                self.rows_written += len(part)
+                self.batches_written += 1
+            except Exception as e:
+                self._rollback()
+                if not _data_error(e):
+                    self._committed(handled)
+                    return part + [entry for rest in reversed(pending) for entry in rest], e
+                if len(part) == 1:
+                    self._reject(part, e)
+                else:
+                    mid = len(part) // 2
+                    pending.append(part[mid:])
+                    pending.append(part[:mid])
+                    continue
+            handled.extend(part)
+        self._committed(handled)
+        self._maybe_report()
+        return [], None
+
+    def _reject(self, batch, error):
+        """Dead-letter entries the DB will never accept."""
+        try:
+            rows = self._rows(batch)
+        except Exception:
+            rows = [repr(entry) for entry in batch]
+        self._dead_letter_rows(rows, error)
+
+    def _dead_letter_rows(self, rows, error):
+        self.rows_dead_lettered += len(rows)
+        if self.dead_letter is None:
+            for row in rows:
+                print(f"[ERROR] dropped log row ({error}): {str(row)[:500]}")
+            return
+        try:
+            with open(self.dead_letter, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps({
+                        "failed_at": time.time(), "error": str(error).strip(), "row": row
+                    }, default=str) + "\n")
+            print(f"[ERROR] {len(rows)} rejected log rows moved to {self.dead_letter}: {error}".strip())
+        except OSError as e:
+            print(f"[ERROR] writing dead letters failed ({e}), dropped {len(rows)} rows")
+
+    def _spool_batch(self, batch):
+        try:
+            self.spool.append(self._rows(batch))
+        except Exception as e:
+            # disk full/unwritable: keep the rows in memory and retry later
+            print(f"[ERROR] spooling {len(batch)} rows failed: {e}")
+            self._requeue(batch)
+            time.sleep(min(1.0, self.max_backoff))
+            return
+        self.rows_spooled += len(batch)
+        self._done(batch)
+
+    def _replay_one(self):
+        records, position = self.spool.peek(1)
+        try:
+            for rows in records:
+                self._write_rows(self._db(), rows)
+            self._conn.commit()
+        except Exception as e:
+            print(f"[DB ERROR] spool replay failed: {e}")
+            self._rollback()
+            if self._conn is None or self._conn.closed:
+                return False        # DB unreachable: not the batch's fault
+            failed_at, attempts = self._replay_failures
+            attempts = attempts + 1 if failed_at == position else 1
+            self._replay_failures = (position, attempts)
+            if attempts < self.max_replay_attempts:
+                return False
+            for rows in records:
+                self._dead_letter_rows(rows, e)
+            self.spool.ack(position)
+            self._replay_failures = (None, 0)
+            return True
+        self._replay_failures = (None, 0)
+        self.spool.ack(position)
+        self.rows_replayed += sum(len(rows) for rows in records)
+        if not self.spool.pending():
+            print(f"[INFO] spool drained, {self.rows_replayed} rows replayed so far")
+        return True
+
+    def _rollback(self):
+        if self._conn is None:
+            return
+        try:
+            self._conn.rollback()
+        except Exception:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _maybe_report(self):
+        now = time.monotonic()
+        if now - self._last_report >= self.report_every:
+            self._last_report = now
+            print(f"[STATS] log writer {self.stats()}")
+
+    def _rows(self, batch):
+        """Entries -> plain (JSON-able) rows, as written and as spooled."""
+        return [
+            [
+                entry["service_id"],
+                entry["log_level"],
+                entry["message"],
+                entry["raw_line"],
+                entry["timestamp"].isoformat()
+            ]
+            for entry in batch
+        ]
+
+    def _write_rows(self, conn, rows):
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        buf.seek(0)
+
+        cursor = conn.cursor()
+        cursor.copy_expert(
+            f"COPY log_entry ({', '.join(LOG_ENTRY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buf
+        )
+        cursor.close()
+
+
+# -------------------------------------------------------
+# Same writer for template-mined logs (log_template + log_event)
+# -------------------------------------------------------
+class TemplateLogWriter(BatchedLogWriter):
+    """
+    Writes entries annotated by a TemplateMiner ("template_id", "template"
+    text and "params" as of when the line was mined) as compact log_event
+    rows. The templates seen in a batch are upserted once per batch, in the
+    same transaction, with how many rows the batch added. A template id
+    always names the same text, so a stored template is never rewritten.
+    """
+
+    def _rows(self, batch):
+        return [
+            [
+                entry["service_id"],
+                entry["template_id"],
+                entry["log_level"],
+                json.dumps(entry["params"]),
+                entry["timestamp"].isoformat(),
+                entry["template"]
+            ]
+            for entry in batch
+        ]
+
+    def _write_rows(self, conn, rows):
+        # rows: [service_id, template_id, level, params json, timestamp, template text]
+        templates = {}
+        for service_id, template_id, _, _, ts, text in rows:
+            seen = templates.get(template_id)
+            if seen is None:
+                templates[template_id] = [service_id, text, 1, ts, ts]
+            else:
+                seen[2] += 1
+                seen[3] = min(seen[3], ts)
+                seen[4] = max(seen[4], ts)
+
+        cursor = conn.cursor()
+        values = ",".join(
+            cursor.mogrify("(%s, %s, %s, %s, %s, %s)", (
+                template_id, service_id, text, count, first_seen, last_seen
+            )).decode("utf-8")
+            for template_id, (service_id, text, count, first_seen, last_seen)
+            in sorted(templates.items())
+        )
+        cursor.execute(f"""
+            INSERT INTO log_template (template_id, service_id, template, occurrences, first_seen, last_seen)
+            VALUES {values}
+            ON CONFLICT (template_id) DO UPDATE SET
+                occurrences = log_template.occurrences + EXCLUDED.occurrences,
+                first_seen = LEAST(log_template.first_seen, EXCLUDED.first_seen),
+                last_seen = GREATEST(log_template.last_seen, EXCLUDED.last_seen)
+        """)
+
+        buf = io.StringIO()
+        csv.writer(buf).writerows(row[:5] for row in rows)
+        buf.seek(0)
+
+        cursor.copy_expert(
+            f"COPY log_event ({', '.join(LOG_EVENT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buf
+        )
+        cursor.close()
@@ -0,0 +1,255 @@
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import psycopg2
+
+
+# -------------------------------------------------------
+# Hardcoded DB config (TEST MODE)
+# -------------------------------------------------------
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "postgres",
+    "password": "admin",
+    "database": "aiops",
+    "port": 5432
+}
+
+STATE_NAME = "service_metrics"
+PARTITION_PREFIX = "service_metrics_p"
+PARTITIONS_AHEAD = 3            # daily partitions created in advance
+RAW_RETENTION_DAYS = 14         # raw partitions dropped after this
+MAX_WINDOW = 100000             # ingest_txid range folded per transaction
+
+# rollup table -> (date_trunc unit, retention in days or None)
+ROLLUPS = {
+    "service_metrics_1m": ("minute", 30),
+    "service_metrics_1h": ("hour", 400),
+    "service_metrics_1d": ("day", None),
+}
+
+
+# -------------------------------------------------------
+# Connect to PostgreSQL
+# -------------------------------------------------------
+def get_db_connection():
+    return psycopg2.connect(
+        host=DB_CONFIG["host"],
+        user=DB_CONFIG["user"],
+        password=DB_CONFIG["password"],
+        dbname=DB_CONFIG["database"],
+        port=DB_CONFIG["port"]
+    )
+
+
+# -------------------------------------------------------
+# Daily raw partitions
+# -------------------------------------------------------
+def _partitions(cur):
+    """[(name, upper bound or None for DEFAULT)] of service_metrics."""
+    cur.execute(r"""
+        SELECT c.relname,
+               substring(pg_get_expr(c.relpartbound, c.oid) FROM 'TO \(''([^'']+)''\)')::timestamptz
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'service_metrics'::regclass
+    """)
+    return cur.fetchall()
+
+
+def ensure_partitions(conn, days_ahead=PARTITIONS_AHEAD):
+    """
+    Create daily (UTC) partitions from the end of the last one up to
+    `days_ahead` days from today. Returns the names created.
+
+    A day whose rows already went to the default partition (the job was
+    down) cannot be created; it is skipped with a warning and its rows
+    expire from the default partition.
+    """
+    created = []
+    today = datetime.now(timezone.utc).date()
+    with conn.cursor() as cur:
+        uppers = [upper for _, upper in _partitions(cur) if upper is not None]
+    conn.commit()
+
+    day = max(today, max(uppers).astimezone(timezone.utc).date()) if uppers else today
+    while day <= today + timedelta(days=days_ahead):
+        name = f"{PARTITION_PREFIX}{day:%Y%m%d}"
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF service_metrics "
+                    f"FOR VALUES FROM (%s) TO (%s)",
+                    (f"{day} 00:00:00+00", f"{day + timedelta(days=1)} 00:00:00+00")
+                )
+            conn.commit()
+            created.append(name)
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"[WARN] partition {name} not created: {e}".strip())
+        day += timedelta(days=1)
+    return created
+
+
+def drop_expired_partitions(conn, retention_days=RAW_RETENTION_DAYS):
+    """
+    Drop every raw partition whose upper bound is older than the retention
+    (the legacy partition from the migration included), and delete expired
+    rows from the default partition. Rollups are kept.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=retention_days)
+    dropped = []
+    with conn.cursor() as cur:
+        for name, upper in _partitions(cur):
+            if upper is not None and upper <= cutoff:
+                cur.execute(f"DROP TABLE {name}")
+                dropped.append(name)
+
+        cur.execute("DELETE FROM service_metrics_default WHERE collected_at < %s", (cutoff,))
+    conn.commit()
+    return dropped
+
+
+def expire_rollups(conn):
+    with conn.cursor() as cur:
+        for table, (_, days) in ROLLUPS.items():
+            if days is not None:
+                cur.execute(f"DELETE FROM {table} WHERE bucket < NOW() - %s * INTERVAL '1 day'", (days,))
+    conn.commit()
+
+
+# -------------------------------------------------------
+# Incremental fold of raw rows into the rollups
+# -------------------------------------------------------
+def _merge_sql(table, unit, source):
+    return f"""
+        INSERT INTO {table} AS r (service_id, bucket, count, cpu_min, cpu_max, cpu_sum, cpu_sumsq,
+                                  mem_min, mem_max, mem_sum, mem_sumsq)
+        SELECT service_id, date_trunc('{unit}', bucket), SUM(count),
+               MIN(cpu_min), MAX(cpu_max), SUM(cpu_sum), SUM(cpu_sumsq),
+               MIN(mem_min), MAX(mem_max), SUM(mem_sum), SUM(mem_sumsq)
+        FROM {source}
+        GROUP BY 1, 2
+        ON CONFLICT (service_id, bucket) DO UPDATE SET
+            count = r.count + EXCLUDED.count,
+            cpu_min = LEAST(r.cpu_min, EXCLUDED.cpu_min),
+            cpu_max = GREATEST(r.cpu_max, EXCLUDED.cpu_max),
+            cpu_sum = r.cpu_sum + EXCLUDED.cpu_sum,
+            cpu_sumsq = r.cpu_sumsq + EXCLUDED.cpu_sumsq,
+            mem_min = LEAST(r.mem_min, EXCLUDED.mem_min),
+            mem_max = GREATEST(r.mem_max, EXCLUDED.mem_max),
+            mem_sum = r.mem_sum + EXCLUDED.mem_sum,
+            mem_sumsq = r.mem_sumsq + EXCLUDED.mem_sumsq
+    """
+
+
+def fold_window(conn, max_window=MAX_WINDOW):
+    """
+    Fold raw rows with ingest_txid in [high water, upper) into every rollup
+    in one transaction, and advance the high-water mark to `upper`.
+    upper = min(oldest running transaction id, high water + max_window).
+    Returns (rows folded, caught up?).
+
+    Every transaction below the oldest running one has committed or
+    aborted, so no row can appear below the mark after it has moved past,
+    however long its insert took to commit. A transaction left open
+    elsewhere in the database holds the fold back until it ends.
+
+    Rows are bucketed by collected_at, so late (replayed) rows land in their
+    original buckets; all rollup columns are sums / mins / maxes and merge
+    with what is already there. Rows of stopped services are skipped. The
+    minute aggregates of the window are computed once and coarsened for the
+    hour and day tables.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO metrics_rollup_state (name, high_water) VALUES (%s, 0)
+            ON CONFLICT (name) DO NOTHING
+        """, (STATE_NAME,))
+        cur.execute("SELECT high_water FROM metrics_rollup_state WHERE name = %s FOR UPDATE", (STATE_NAME,))
+        high_water = cur.fetchone()[0]
+
+        cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        horizon = cur.fetchone()[0]
+        upper = min(horizon, high_water + max_window)
+        if upper <= high_water:
+            conn.rollback()
+            return 0, True
+
+        cur.execute("""
+            CREATE TEMP TABLE rollup_batch ON COMMIT DROP AS
+            SELECT service_id,
+                   date_trunc('minute', collected_at) AS bucket,
+                   COUNT(*) AS count,
+                   MIN(COALESCE(cpu_min, cpu_usage)) AS cpu_min,
+                   MAX(COALESCE(cpu_max, cpu_usage)) AS cpu_max,
+                   SUM(cpu_usage) AS cpu_sum,
+                   SUM(cpu_usage::float8 * cpu_usage) AS cpu_sumsq,
+                   MIN(COALESCE(mem_min, memory_usage)) AS mem_min,
+                   MAX(COALESCE(mem_max, memory_usage)) AS mem_max,
+                   SUM(memory_usage) AS mem_sum,
+                   SUM(memory_usage::float8 * memory_usage) AS mem_sumsq
+            FROM service_metrics
+            WHERE ingest_txid >= %s AND ingest_txid < %s
+              AND service_id IS NOT NULL
+              AND status IS DISTINCT FROM 'stopped'
+            GROUP BY 1, 2
+        """, (high_water, upper))
+        cur.execute("SELECT COALESCE(SUM(count), 0) FROM rollup_batch")
+        folded = int(cur.fetchone()[0])
+
+        if folded:
+            for table, (unit, _) in ROLLUPS.items():
+                cur.execute(_merge_sql(table, unit, "rollup_batch"))
+
+        cur.execute("""
+            UPDATE metrics_rollup_state SET high_water = %s, updated_at = NOW()
+            WHERE name = %s
+        """, (upper, STATE_NAME))
+    conn.commit()
+    return folded, upper >= horizon
+
+
+def fold_pending(conn, **kwargs):
+    """Fold windows until caught up with the oldest running transaction; returns rows folded."""
+    total = 0
+    while True:
+        folded, caught_up = fold_window(conn, **kwargs)
+        total += folded
+        if caught_up:
+            return total
+
+
+def run_once(conn, retention_days=RAW_RETENTION_DAYS):
+    started = time.time()
+    created = ensure_partitions(conn)
+    folded = fold_pending(conn)
+    dropped = drop_expired_partitions(conn, retention_days)
+    expire_rollups(conn)
+    print(f"[INFO] rollup: {folded} rows folded, partitions +{created} -{dropped} "
+          f"in {time.time() - started:.2f}s")
+
+
+# -------------------------------------------------------
+# Main loop
+# -------------------------------------------------------
+if __name__ == "__main__":
+    interval = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    retention = int(sys.argv[2]) if len(sys.argv) > 2 else RAW_RETENTION_DAYS
+
+    conn = None
+    while True:
+        try:
+            if conn is None or conn.closed:
+                conn = get_db_connection()
+            run_once(conn, retention)
+        except Exception as e:
+            print(f"[DB ERROR] rollup failed: {e}")
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except Exception:
+                    conn.close()
+                    conn = None
+        time.sleep(interval)
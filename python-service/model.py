@@ -0,0 +1,14 @@
+import time
+
+BATCH_LATENCY = 1.0          # simulated cost of one model call, whatever the batch size
+
+
+# -------------------------------------------------------
+# The model: one call scores a whole batch of inputs
+# -------------------------------------------------------
+def run_batch(inputs):
+    """list of input dicts -> list of result dicts, same order."""
+    # simulate work
+    time.sleep(BATCH_LATENCY)
+    processed_at = time.time()
+    return [{"echo": item, "processed_at": processed_at} for item in inputs]
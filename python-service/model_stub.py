@@ -1,7 +1,83 @@
 #!/usr/bin/env python
-import sys, json, time
-input_data = {}
-if len(sys.argv) > 1:
-    input_data['args'] = sys.argv[1:]
-time.sleep(1)
-print(json.dumps({"ok": True, "result": {"echo": input_data}}))
+"""
+One-shot:  python model_stub.py [args...]
+    prints {"ok": true, "result": {"echo": {"args": [...]}}} and exits.
+
+Worker:    python model_stub.py --worker [--max-requests N] [--heartbeat SEC]
+    reads newline-delimited JSON requests on stdin and answers each on stdout,
+    tagged with its id, in arrival order (callers may pipeline):
+      {"id": 1, "type": "run", "input": {...}} -> {"id": 1, "ok": true, "result": {...}}
+      {"id": 2, "type": "ping"}                -> {"id": 2, "type": "pong", "served": n}
+    It also writes {"type": "ready"} at start, {"type": "heartbeat"} every
+    --heartbeat seconds and {"type": "recycle"} once N requests were served;
+    after that it keeps answering what it already got and exits on stdin EOF.
+"""
+import sys, json, time, os, threading
+from model import run_batch
+
+_out_lock = threading.Lock()
+
+
+def _send(message):
+    line = json.dumps(message, separators=(",", ":"), default=str)
+    with _out_lock:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+
+def _heartbeat(interval, state):
+    while True:
+        time.sleep(interval)
+        _send({"type": "heartbeat", "pid": os.getpid(), "served": state["served"], "ts": time.time()})
+
+
+def worker(max_requests=1000, heartbeat=5.0):
+    state = {"served": 0}
+    threading.Thread(target=_heartbeat, args=(heartbeat, state), daemon=True).start()
+    _send({"type": "ready", "pid": os.getpid()})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            _send({"id": None, "ok": False, "error": f"bad request: {e}"})
+            continue
+
+        request_id = request.get("id")
+        kind = request.get("type", "run")
+        if kind == "ping":
+            _send({"id": request_id, "type": "pong", "served": state["served"]})
+            continue
+
+        try:
+            result = run_batch([request.get("input", {})])[0]
+            _send({"id": request_id, "ok": True, "result": result})
+        except Exception as e:
+            _send({"id": request_id, "ok": False, "error": str(e)})
+
+        state["served"] += 1
+        if state["served"] == max_requests:
+            _send({"type": "recycle", "pid": os.getpid(), "served": state["served"]})
+
+
+def _flag(name, default, cast):
+    if name in sys.argv:
+        return cast(sys.argv[sys.argv.index(name) + 1])
+    return default
+
+
+if __name__ == "__main__":
+    if "--worker" in sys.argv:
+        worker(
+            max_requests=_flag("--max-requests", 1000, int),
+            heartbeat=_flag("--heartbeat", 5.0, float)
+        )
+        sys.exit(0)
+
+    input_data = {}
+    if len(sys.argv) > 1:
+        input_data['args'] = sys.argv[1:]
+    time.sleep(1)
+    print(json.dumps({"ok": True, "result": {"echo": input_data}}))
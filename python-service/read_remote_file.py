@@ -1,37 +1,178 @@
-import paramiko
+import os
+import shlex
 import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from channel_reader import LineSplitter, open_stream
+from ssh_pool import default_pool
 
-def read_remote_file(host, username, pem_path, log_path):
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(hostname=host, username=username, key_filename=pem_path)
+CHUNK_SIZE = 1 << 20         # bytes per recv() / yielded chunk
 
-    print(f"[INFO] Reading file: {log_path}")
 
-    cmd = f"cat {log_path}"
-    stdin, stdout, stderr = ssh.exec_command(cmd)
+# -------------------------------------------------------
+# Build the remote command for a byte range
+# -------------------------------------------------------
+def _range_command(path, offset=0, length=None, tail=None, compress=False):
+    """
+    offset/length: bytes [offset, offset + length) (length=None: to EOF)
+    tail: the last `tail` bytes instead (offset/length ignored)
+    compress: gzip -1 on the remote side, inflated locally as it arrives
+    """
+    quoted = shlex.quote(path)
+    if tail is not None:
+        cmd = f"tail -c {int(tail)} {quoted}"
+    elif offset:
+        cmd = f"tail -c +{int(offset) + 1} {quoted}"
+    else:
+        cmd = f"cat {quoted}"
+    if length is not None and tail is None:
+        cmd += f" | head -c {int(length)}"
+    if compress:
+        cmd += " | gzip -1 -c"
+    # a missing/unreadable file fails fast with its own exit status
+    error = shlex.quote(f"cannot read {path}")
+    return f"[ -r {quoted} ] || {{ echo {error} >&2; exit 2; }}; {cmd}"
 
-    output = stdout.read().decode(errors="ignore")
-    error = stderr.read().decode(errors="ignore")
 
-    if error:
-        print("[ERROR]")
-        print(error)
-    else:
-        print("[FILE CONTENT]")
-        print(output)
+# -------------------------------------------------------
+# Streaming readers (bounded memory)
+# -------------------------------------------------------
+def iter_chunks(ssh, path, offset=0, length=None, tail=None, compress=False,
+                chunk_size=CHUNK_SIZE):
+    """
+    Yield the requested byte range of a remote file as bytes chunks of at most
+    `chunk_size`, over a dedicated channel on the existing transport. Nothing
+    beyond one chunk (plus the gzip window) is held in memory.
+    Raises IOError when the remote side reports an error.
+    """
+    channel = open_stream(ssh.get_transport(), _range_command(path, offset, length, tail, compress))
+    inflater = zlib.decompressobj(16 + zlib.MAX_WBITS) if compress else None
+    try:
+        while True:
+            data = channel.recv(chunk_size)
+            if not data:
+                break
+            if inflater is None:
+                yield data
+                continue
+            while data:
+                out = inflater.decompress(data, chunk_size)
+                data = inflater.unconsumed_tail
+                if out:
+                    yield out
+        if inflater is not None:
+            out = inflater.flush()
+            if out:
+                yield out
+
+        status = channel.recv_exit_status()
+        error = b""
+        while channel.recv_stderr_ready():
+            error += channel.recv_stderr(4096)
+        if status != 0 or error:
+            raise IOError(f"{path}: {error.decode(errors='ignore').strip() or f'exit status {status}'}")
+    finally:
+        channel.close()
+
+
+def iter_lines(ssh, path, offset=0, length=None, tail=None, compress=False,
+               chunk_size=CHUNK_SIZE):
+    """Same range as iter_chunks, yielded as decoded lines (without newline)."""
+    splitter = LineSplitter()
+    for chunk in iter_chunks(ssh, path, offset, length, tail, compress, chunk_size):
+        yield from splitter.feed(chunk)
+    yield from splitter.flush()
+
+
+# -------------------------------------------------------
+# Several files in parallel over one transport
+# -------------------------------------------------------
+def _download(ssh, path, dest_dir, **range_args):
+    local_path = os.path.join(dest_dir, path.strip("/").replace("/", "_"))
+    tmp = f"{local_path}.part"
+    size = 0
+    try:
+        with open(tmp, "wb") as f:
+            for chunk in iter_chunks(ssh, path, **range_args):
+                f.write(chunk)
+                size += len(chunk)
+    except Exception:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, local_path)
+    return local_path, size
 
-    ssh.close()
+
+def fetch_many(ssh, paths, dest_dir, max_parallel=4, **range_args):
+    """
+    Stream several remote files (same range options as iter_chunks) into
+    dest_dir at once, one channel each, all multiplexed over the transport of
+    `ssh`. Returns {path: (local_path, bytes) | Exception}.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        futures = {p: executor.submit(_download, ssh, p, dest_dir, **range_args) for p in paths}
+        for path, future in futures.items():
+            try:
+                results[path] = future.result()
+            except Exception as e:
+                print(f"[ERROR] {path}: {e}")
+                results[path] = e
+    return results
+
+
+# -------------------------------------------------------
+# Print a remote file (or a range of it)
+# -------------------------------------------------------
+def read_remote_file(host, username, pem_path, log_path, pool=None, **range_args):
+    pool = pool or default_pool
+    ssh = pool.get(host, username, pem_path)
+
+    print(f"[INFO] Reading file: {log_path}")
+
+    try:
+        lines = iter_lines(ssh, log_path, **range_args)
+        first = next(lines, None)
+        print("[FILE CONTENT]")
+        if first is not None:
+            print(first)
+        for line in lines:
+            print(line)
+    except IOError as e:
+        print("[ERROR]")
+        print(e)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 5:
-        print("Usage: python read_remote_file.py <host> <username> <pem_path> <log_path>")
+    args = sys.argv[1:]
+    options = {}
+    flags = {"--offset": "offset", "--length": "length", "--head": "length", "--tail": "tail"}
+    fetch_dir = None
+    while args and args[0].startswith("--"):
+        flag = args.pop(0)
+        if flag == "--gzip":
+            options["compress"] = True
+        elif flag == "--fetch" and args:
+            fetch_dir = args.pop(0)
+        elif flag in flags and args:
+            options[flags[flag]] = int(args.pop(0))
+        else:
+            args = []
+            break
+
+    if len(args) < 4 or (fetch_dir is None and len(args) != 4):
+        print("Usage: python read_remote_file.py [options] <host> <username> <pem_path> <log_path>")
+        print("       python read_remote_file.py [options] --fetch <dir> <host> <username> <pem_path> <path>...")
+        print("Options: --head N | --tail N | --offset N [--length N], --gzip")
         sys.exit(1)
 
-    host = sys.argv[1]
-    username = sys.argv[2]
-    pem_path = sys.argv[3]
-    log_path = sys.argv[4]
+    host = args[0]
+    username = args[1]
+    pem_path = args[2]
 
-    read_remote_file(host, username, pem_path, log_path)
+    if fetch_dir is not None:
+        fetch_many(default_pool.get(host, username, pem_path), args[3:], fetch_dir, **options)
+    else:
+        read_remote_file(host, username, pem_path, args[3], **options)
+    default_pool.close_all()
@@ -0,0 +1,116 @@
+import json
+import shlex
+import time
+
+# hosts that cannot run the collector (no python3) -> monotonic time to retry
+COLLECTOR_RETRY = 3600
+_unavailable = {}
+
+
+class CollectorUnavailable(RuntimeError):
+    """The collector produced no output (no python3 on the host)."""
+
+# -------------------------------------------------------
+# Collector script executed on the remote host
+# (python3 stdlib only, read from stdin: `python3 - <filters>`)
+# -------------------------------------------------------
+COLLECTOR_SCRIPT = r'''
+import json, os, re, subprocess, sys, time
+
+def run(cmd):
+    try:
+        return subprocess.check_output(cmd, shell=True, stderr=subprocess.DEVNULL).decode("utf-8", "ignore")
+    except Exception:
+        return ""
+
+filters = [f.lower() for f in json.loads(sys.argv[1])] if len(sys.argv) > 1 else []
+
+processes = []
+for line in run("ps -eo pid,user,comm,%cpu,%mem,args --no-heading").splitlines():
+    parts = line.split(None, 5)
+    if len(parts) < 6 or not parts[0].isdigit():
+        continue
+    try:
+        cpu, mem = float(parts[3]), float(parts[4])
+    except ValueError:
+        cpu, mem = 0.0, 0.0
+    processes.append({"pid": int(parts[0]), "user": parts[1], "comm": parts[2],
+                      "cpu": cpu, "mem": mem, "command": parts[5]})
+
+sockets = []
+ss = run("sudo -n ss -ltnp") or run("ss -ltnp")
+for line in ss.splitlines():
+    cols = line.split()
+    if len(cols) < 4 or cols[0] == "State" or ":" not in cols[3]:
+        continue
+    port = cols[3].rsplit(":", 1)[1]
+    for pid in re.findall(r"pid=(\d+)", line):
+        sockets.append({"pid": int(pid), "port": port})
+
+ports = {}
+for s in sockets:
+    lst = ports.setdefault(s["pid"], [])
+    if s["port"] not in lst:
+        lst.append(s["port"])
+
+candidates = {}
+for p in processes:
+    cmd_low = p["command"].lower()
+    if filters and not any(f in cmd_low for f in filters):
+        continue
+    try:
+        cwd = os.readlink("/proc/%d/cwd" % p["pid"])
+    except OSError:
+        out = run("sudo -n pwdx %d" % p["pid"])
+        cwd = out.split(":", 1)[1].strip() if ":" in out else None
+    candidates[str(p["pid"])] = {"cwd": cwd, "cpu": p["cpu"], "mem": p["mem"],
+                                 "ports": ports.get(p["pid"], [])}
+
+json.dump({"collected_at": time.time(), "processes": processes,
+           "sockets": sockets, "candidates": candidates}, sys.stdout)
+'''
+
+
+# -------------------------------------------------------
+# Run the collector over a single SSH channel
+# -------------------------------------------------------
+def batch_collect(ssh, filters=None, timeout=60):
+    """
+    One round trip: push COLLECTOR_SCRIPT on stdin and read back one JSON doc
+
+        {
+            "collected_at": 1700000000.0,
+            "processes": [{"pid", "user", "comm", "cpu", "mem", "command"}, ...],
+            "sockets": [{"pid": 1234, "port": "8080"}, ...],
+            "candidates": {"1234": {"cwd", "cpu", "mem", "ports"}, ...}
+        }
+
+    `filters` are lower-case substrings; a process is a candidate (gets cwd and
+    ports resolved) when its command line contains any of them.
+    """
+    cmd = "python3 - " + shlex.quote(json.dumps(filters or []))
+    stdin, stdout, stderr = ssh.exec_command(cmd, timeout=timeout)
+    stdin.write(COLLECTOR_SCRIPT)
+    stdin.channel.shutdown_write()
+
+    output = stdout.read().decode(errors="ignore")
+    if not output.strip():
+        raise CollectorUnavailable(f"collector returned nothing: {stderr.read().decode(errors='ignore').strip()}")
+    return json.loads(output)
+
+
+def try_batch_collect(ssh, host, filters=None, timeout=60):
+    """
+    batch_collect, or None when `host` cannot run the collector: callers then
+    use their per-PID commands. A failing host is remembered for
+    COLLECTOR_RETRY seconds so it is not retried on every scan. Connection
+    errors are raised as usual.
+    """
+    if _unavailable.get(host, 0) > time.monotonic():
+        return None
+    try:
+        return batch_collect(ssh, filters, timeout)
+    except CollectorUnavailable as e:
+        print(f"[WARN] {host}: {e}; using per-PID commands for {COLLECTOR_RETRY}s")
+        _unavailable[host] = time.monotonic() + COLLECTOR_RETRY
+        return None
@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+
+def payload_key(payload):
+    """Canonical content hash: same dict (any key order) -> same key."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# -------------------------------------------------------
+# LRU + TTL + memory-bounded result cache with request coalescing
+# -------------------------------------------------------
+class ResultCache:
+    """
+    Results keyed by payload_key(). Entries expire `ttl` seconds after they
+    were stored; beyond `max_entries` or `max_bytes` (size estimated from the
+    result's JSON) the least recently used ones are evicted.
+
+    get_or_compute() coalesces: while a key is being computed, identical
+    requests await the same task instead of starting their own. Failures are
+    not cached. Must be used from one event loop.
+    """
+
+    def __init__(self, ttl=30.0, max_entries=10000, max_bytes=64 << 20):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()    # key -> (expires_at, size, value)
+        self._inflight = {}
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, value):
+        size = len(json.dumps(value, separators=(",", ":"), default=str))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    async def get_or_compute(self, key, compute):
+        """
+        -> (value, "hit" | "coalesced" | "miss")
+        compute: zero-argument coroutine function producing the value.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[2], "hit"
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task), "coalesced"
+
+        self.misses += 1
+        task = asyncio.ensure_future(compute())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        # shield: one caller timing out must not cancel the shared computation
+        return await asyncio.shield(task), "miss"
+
+    def _done(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def stats(self):
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import shlex
+import threading
+import time
+from collections import deque
+
+from channel_reader import LineSplitter
+
+VERIFY_WINDOW = 64 << 10     # bytes read back to verify the last-line hash
+ROTATION_GRACE = 2.0         # seconds of silence before leaving a rotated file
+COMPRESSED = (".gz", ".bz2", ".xz", ".zst")
+
+
+def line_hash(line):
+    return hashlib.sha1(line.encode("utf-8", errors="ignore")).hexdigest()
+
+
+# -------------------------------------------------------
+# Local checkpoint file: key -> {inode, offset, line_hash}
+# -------------------------------------------------------
+class CheckpointStore:
+    """
+    Per-file tail positions persisted as one JSON document, rewritten
+    atomically (tmp file + rename) whenever a committed batch advances them.
+    """
+
+    def __init__(self, path="log_checkpoints.json"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self._data = json.load(f)
+
+    def get(self, key):
+        with self._lock:
+            return dict(self._data[key]) if key in self._data else None
+
+    def commit(self, batch):
+        """BatchedLogWriter on_commit hook: persist the newest checkpoint per file."""
+        changed = False
+        with self._lock:
+            for entry in batch:
+                ckpt = entry.get("checkpoint")
+                if ckpt is None:
+                    continue
+                key, inode, offset, digest = ckpt
+                self._data[key] = {"inode": inode, "offset": offset, "line_hash": digest}
+                changed = True
+            if changed:
+                self._save()
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self._data, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+# -------------------------------------------------------
+# One remote file followed across restarts, rotation and truncation
+# -------------------------------------------------------
+def _exec(ssh, cmd):
+    stdin, stdout, stderr = ssh.exec_command(cmd)
+    return stdout.read()
+
+
+def stat_files(ssh, paths):
+    """{path: (inode, size) | None} for several files in one exec."""
+    script = "; ".join(
+        f"stat -Lc '%i %s' {shlex.quote(p)} 2>/dev/null || echo '- -'" for p in paths
+    )
+    lines = _exec(ssh, script).decode(errors="ignore").splitlines()
+    result = {}
+    for path, line in zip(paths, lines):
+        parts = line.split()
+        result[path] = (int(parts[0]), int(parts[1])) if len(parts) == 2 and parts[0].isdigit() else None
+    return result
+
+
+class TailSession:
+    """
+    Tracks the (inode, byte offset, last-line hash) of one followed file.
+
+    next_command() plans what to run from the current position:
+      - no checkpoint: follow from the current end (like `tail -Fn0`)
+      - same inode, verified: `tail -c +offset -f` (catch-up then live)
+      - same inode, shorter or hash mismatch: truncated, start from 0
+      - new inode: drain the rotated file (found by inode next to it)
+        from the offset, then follow the new file from 0
+    feed() turns raw bytes into lines and the checkpoint they advance to.
+    check() inspects a fresh stat and asks for a restart on rotation or
+    truncation.
+    """
+
+    def __init__(self, host, log_path, store):
+        self.host = host
+        self.log_path = log_path
+        self.key = f"{host}:{log_path}"
+        self.store = store
+
+        ckpt = store.get(self.key) or {}
+        self.inode = ckpt.get("inode")
+        self.offset = ckpt.get("offset", 0)
+        self.last_hash = ckpt.get("line_hash")
+
+        self._segments = deque()
+        self._following = False
+        self._splitter = LineSplitter()
+        self._fed = 0
+        self.last_data = time.monotonic()
+
+    # ---------------- planning ----------------
+    def _verify(self, ssh, path):
+        if not self.offset or not self.last_hash:
+            return True
+        size = min(self.offset, VERIFY_WINDOW)
+        raw = _exec(ssh, f"tail -c +{self.offset - size + 1} {shlex.quote(path)} | head -c {size}")
+        text = raw.decode("utf-8", errors="ignore")
+        if not text.endswith("\n"):
+            return False
+        head, sep, last = text[:-1].rpartition("\n")
+        if not sep and size < self.offset:
+            return True  # last line longer than the window, can't tell
+        return line_hash(last.rstrip("\r")) == self.last_hash
+
+    def _find_rotated(self, ssh, current_inode):
+        """
+        Rotated siblings still to be read, oldest first: the file holding the
+        checkpointed inode, then any later rotations (several may have
+        happened while the monitor was down). Compressed files are skipped.
+        """
+        directory = os.path.dirname(self.log_path) or "."
+        base = os.path.basename(self.log_path)
+        out = _exec(ssh, f"find {shlex.quote(directory)} -maxdepth 1 -type f "
+                         f"-name {shlex.quote(base + '*')} -printf '%i %T@ %p\\n'")
+
+        files = []
+        for line in out.decode(errors="ignore").splitlines():
+            parts = line.split(" ", 2)
+            if len(parts) == 3 and parts[0].isdigit() and not parts[2].endswith(COMPRESSED):
+                files.append((int(parts[0]), float(parts[1]), parts[2]))
+
+        old = next((f for f in files if f[0] == self.inode), None)
+        if old is None:
+            return None, []
+        later = sorted(
+            (f for f in files if f[1] >= old[1] and f[0] not in (self.inode, current_inode)),
+            key=lambda f: f[1]
+        )
+        return old[2], [(path, inode) for inode, _, path in later]
+
+    def _plan(self, ssh):
+        current = stat_files(ssh, [self.log_path])[self.log_path]
+        if current is None:
+            raise FileNotFoundError(self.log_path)
+        inode, size = current
+
+        if self.inode is None:
+            print(f"[INFO] {self.key}: no checkpoint, following from end ({size} bytes)")
+            self._segments.append((self.log_path, inode, size, True))
+        elif inode == self.inode:
+            if size < self.offset or not self._verify(ssh, self.log_path):
+                print(f"[WARN] {self.key}: truncated or replaced, restarting from 0")
+                self._segments.append((self.log_path, inode, 0, True))
+            else:
+                self._segments.append((self.log_path, inode, self.offset, True))
+        else:
+            rotated, later = self._find_rotated(ssh, inode)
+            if rotated:
+                print(f"[INFO] {self.key}: rotated to {rotated}, draining from {self.offset}")
+                self._segments.append((rotated, self.inode, self.offset, False))
+                for path, rotated_inode in later:
+                    print(f"[INFO] {self.key}: also draining {path}")
+                    self._segments.append((path, rotated_inode, 0, False))
+            else:
+                print(f"[WARN] {self.key}: rotated file with inode {self.inode} not found")
+            self._segments.append((self.log_path, inode, 0, True))
+
+    def next_command(self, ssh):
+        if not self._segments:
+            self._plan(ssh)
+        path, inode, offset, follow = self._segments.popleft()
+
+        if inode != self.inode or offset != self.offset:
+            self.last_hash = None
+        self.inode, self.offset = inode, offset
+        self._following = follow
+        self._splitter = LineSplitter()
+        self._fed = 0
+        self.last_data = time.monotonic()
+
+        # -f follows the descriptor, so rotation is detected by check()
+        return f"tail -c +{offset + 1} {'-f ' if follow else ''}{shlex.quote(path)}"
+
+    def has_next(self):
+        return bool(self._segments)
+
+    # ---------------- streaming ----------------
+    def feed(self, data):
+        """-> (lines, checkpoint tuple or None)"""
+        self.last_data = time.monotonic()
+        self._fed += len(data)
+        lines = self._splitter.feed(data)
+        if not lines:
+            return lines, None
+
+        self.offset += self._fed - self._splitter.pending()
+        self._fed = self._splitter.pending()
+        self.last_hash = line_hash(lines[-1])
+        return lines, (self.key, self.inode, self.offset, self.last_hash)
+
+    def check(self, stat):
+        """Return a restart reason when the followed file was rotated or truncated."""
+        if stat is None or not self._following:
+            return None
+        inode, size = stat
+        if inode != self.inode and time.monotonic() - self.last_data > ROTATION_GRACE:
+            return "rotated"
+        if inode == self.inode and size < self.offset:
+            return "truncated"
+        return None
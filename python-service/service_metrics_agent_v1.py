@@ -1,9 +1,10 @@
-import paramiko
 import sys
 import time
 import json
 from datetime import datetime
 import re
+from remote_collector import try_batch_collect
+from ssh_pool import default_pool
 
 # -----------------------------
 # Uncomment for actual DB usage
@@ -38,16 +39,10 @@ import re
 #     conn.close()
 
 # -----------------------------
-# Fetch metrics for a service
+# Per-PID helpers (non-batch mode)
 # -----------------------------
-def fetch_metrics(host, username, pem_path, service_info):
-    metrics_list = []
-
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(hostname=host, username=username, key_filename=pem_path)
-
-    # Get all processes
+def _ps_rows(ssh):
+    rows = []
     stdin, stdout, stderr = ssh.exec_command("ps -eo pid,comm,args --no-heading")
     output = stdout.read().decode().splitlines()
 
@@ -61,12 +56,73 @@ def fetch_metrics(host, username, pem_path, service_info):
         pid_str, comm, command = parts
         if not pid_str.isdigit():
             continue
-        pid = int(pid_str)
+        rows.append((int(pid_str), command))
+    return rows
+
+
+def _remote_cpu_mem(ssh, pid):
+    try:
+        stdin_m, stdout_m, stderr_m = ssh.exec_command(f"ps -p {pid} -o %cpu,%mem --no-heading")
+        cpu_mem = stdout_m.read().decode().strip().split()
+        return float(cpu_mem[0]), float(cpu_mem[1])
+    except:
+        return 0.0, 0.0
+
+
+def _remote_ports(ssh, pid):
+    ports = []
+    try:
+        cmd_ports = f"sudo lsof -Pan -p {pid} -iTCP -sTCP:LISTEN"
+        stdin_p, stdout_p, stderr_p = ssh.exec_command(cmd_ports)
+        port_output = stdout_p.read().decode().splitlines()
+        for po in port_output[1:]:
+            po_parts = po.split()
+            if len(po_parts) >= 9:
+                ports.append(po_parts[8].split(':')[-1])
+    except:
+        ports = []
+    return ports
+
+# -----------------------------
+# Fetch metrics for a service
+# -----------------------------
+def fetch_metrics(host, username, pem_path, service_info, batch=True, pool=None, port=None,
+                  collected=None):
+    """
+    batch=True gets CPU/mem and ports for every matching PID from a single
+    remote_collector round trip; batch=False runs `ps -p` and `lsof` per PID,
+    as do hosts that cannot run the collector.
+    A batch_collect result whose filters cover this service (its command
+    pattern or technology) can be passed as `collected` to share one round
+    trip between several services of a host.
+    The SSH connection comes from `pool` (ssh_pool.default_pool) and is reused;
+    `port` is the server's SSH port (the pool's default, 22, when None).
+    """
+    metrics_list = []
+
+    pool = pool or default_pool
+    ssh = pool.get(host, username, pem_path, port=port)
+
+    tech = service_info['technology'].lower()
+    cmd_pattern = service_info['command_pattern'].lower()
+
+    # Get all processes
+    try:
+        if batch and collected is None:
+            collected = try_batch_collect(ssh, f"{host}:{port or 22}", [cmd_pattern])
+            batch = collected is not None
+        if batch:
+            rows = [(p["pid"], p["command"]) for p in collected["processes"]]
+        else:
+            rows = _ps_rows(ssh)
+    except Exception:
+        pool.invalidate(host, username, pem_path, port=port)
+        raise
+
+    for pid, command in rows:
         cmd_lower = command.lower()
 
         # Match the service pattern
-        tech = service_info['technology'].lower()
-        cmd_pattern = service_info['command_pattern'].lower()
         match_service = False
         if tech == "java" and "java" in cmd_lower and cmd_pattern in cmd_lower:
             match_service = True
@@ -78,28 +134,15 @@ def fetch_metrics(host, username, pem_path, service_info):
         if not match_service:
             continue
 
-        # CPU & Memory
-        try:
-            stdin_m, stdout_m, stderr_m = ssh.exec_command(f"ps -p {pid} -o %cpu,%mem --no-heading")
-            cpu_mem = stdout_m.read().decode().strip().split()
-            cpu_percent = float(cpu_mem[0])
-            mem_percent = float(cpu_mem[1])
-        except:
-            cpu_percent = 0.0
-            mem_percent = 0.0
-
-        # Ports
-        ports = []
-        try:
-            cmd_ports = f"sudo lsof -Pan -p {pid} -iTCP -sTCP:LISTEN"
-            stdin_p, stdout_p, stderr_p = ssh.exec_command(cmd_ports)
-            port_output = stdout_p.read().decode().splitlines()
-            for po in port_output[1:]:
-                po_parts = po.split()
-                if len(po_parts) >= 9:
-                    ports.append(po_parts[8].split(':')[-1])
-        except:
-            ports = []
+        # CPU & Memory, Ports
+        if batch:
+            details = collected["candidates"].get(str(pid), {})
+            cpu_percent = details.get("cpu", 0.0)
+            mem_percent = details.get("mem", 0.0)
+            ports = details.get("ports", [])
+        else:
+            cpu_percent, mem_percent = _remote_cpu_mem(ssh, pid)
+            ports = _remote_ports(ssh, pid)
 
         metrics_list.append({
             "service_id": service_info['service_id'],
@@ -112,7 +155,6 @@ def fetch_metrics(host, username, pem_path, service_info):
             "timestamp": str(datetime.now())
         })
 
-    ssh.close()
     return metrics_list
 
 # -----------------------------
@@ -0,0 +1,108 @@
+import threading
+import time
+import paramiko
+
+
+# -------------------------------------------------------
+# Persistent SSH connections keyed by (host, port, user, key)
+# -------------------------------------------------------
+class SSHPool:
+    """
+    Keeps one authenticated SSHClient per (host, port, username, key_filename)
+    alive across cycles, so callers pay the handshake + key exchange once instead of
+    on every loop. Connections are health-checked on checkout and reconnected
+    when the transport died; idle ones are closed by prune(). A port of None
+    means the pool's default `port`; reconnects use the port of the key.
+    """
+
+    def __init__(self, keepalive=30, max_idle=600, connect_timeout=15, port=22):
+        self.keepalive = keepalive
+        self.max_idle = max_idle
+        self.connect_timeout = connect_timeout
+        self.port = port
+        self._clients = {}
+        self._last_used = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _healthy(ssh):
+        transport = ssh.get_transport()
+        if transport is None or not transport.is_active() or not transport.is_authenticated():
+            return False
+        try:
+            transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def _connect(self, host, username, key_filename, port):
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect(
+            hostname=host,
+            port=port,
+            username=username,
+            key_filename=key_filename,
+            timeout=self.connect_timeout,
+            banner_timeout=self.connect_timeout,
+            auth_timeout=self.connect_timeout
+        )
+        ssh.get_transport().set_keepalive(self.keepalive)
+        return ssh
+
+    def _key(self, host, username, key_filename, port):
+        return (host, port or self.port, username, key_filename)
+
+    def get(self, host, username, key_filename, port=None):
+        """
+        Return a live SSHClient for the key, reconnecting if needed.
+        The client stays owned by the pool: do not close() it.
+        """
+        key = self._key(host, username, key_filename, port)
+        with self._key_lock(key):
+            ssh = self._clients.get(key)
+            if ssh is not None and not self._healthy(ssh):
+                print(f"[WARN] SSH connection to {host} is dead, reconnecting")
+                ssh.close()
+                ssh = None
+
+            if ssh is None:
+                ssh = self._connect(host, username, key_filename, key[1])
+                self._clients[key] = ssh
+
+            self._last_used[key] = time.monotonic()
+            return ssh
+
+    def invalidate(self, host, username, key_filename, port=None):
+        """Drop a connection after a failure so the next get() reconnects."""
+        self._drop(self._key(host, username, key_filename, port))
+
+    def _drop(self, key):
+        with self._key_lock(key):
+            ssh = self._clients.pop(key, None)
+            self._last_used.pop(key, None)
+        if ssh is not None:
+            ssh.close()
+
+    def prune(self):
+        """Close connections idle for longer than max_idle seconds."""
+        now = time.monotonic()
+        with self._lock:
+            stale = [k for k, t in self._last_used.items() if now - t > self.max_idle]
+        for key in stale:
+            self._drop(key)
+        return len(stale)
+
+    def close_all(self):
+        with self._lock:
+            keys = list(self._clients)
+        for key in keys:
+            self._drop(key)
+
+
+default_pool = SSHPool()
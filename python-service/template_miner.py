@@ -0,0 +1,142 @@
+import hashlib
+import re
+
+WILDCARD = "<*>"
+
+# tokens that are clearly variable: numbers, hex ids, IPs, UUIDs, paths with digits
+_VARIABLE = re.compile(
+    r"^(?:[-+]?\d+(?:[.,:]\d+)*[a-z%]*"
+    r"|0x[0-9a-f]+"
+    r"|[0-9a-f]{8,}"
+    r"|\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?"
+    r"|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+    r"|\S*\d\S*[/=]\S*\d\S*)$",
+    re.I
+)
+
+
+def _mask(token):
+    return WILDCARD if _VARIABLE.match(token) else token
+
+
+def _stable_id(service_id, template):
+    digest = hashlib.sha1(f"{service_id}:{template}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") >> 1  # fits a signed BIGINT
+
+
+# -------------------------------------------------------
+# One template (cluster) of log messages
+# -------------------------------------------------------
+class LogTemplate:
+    __slots__ = ("template_id", "tokens", "count", "levels")
+
+    def __init__(self, template_id, tokens):
+        self.template_id = template_id
+        self.tokens = tokens
+        self.count = 0
+        self.levels = {}
+
+    @property
+    def template(self):
+        return " ".join(self.tokens)
+
+
+# -------------------------------------------------------
+# Streaming Drain-style template miner
+# -------------------------------------------------------
+class TemplateMiner:
+    """
+    Online log template mining with a fixed-depth parse tree (Drain).
+
+    Messages are split on whitespace and obviously variable tokens are masked
+    to <*>. Below the root the tree routes on token count, then on the
+    first `depth - 3` tokens (tokens containing digits, or past
+    `max_children` siblings, share the <*> branch); a leaf holds candidate
+    templates and the message joins the most similar one when at least
+    `sim_threshold` of the positions agree, turning the positions that
+    differ into <*>. Otherwise it starts a new template.
+
+    add() returns (template, params, changed): params are the original tokens
+    at <*> positions and `changed` is True when the template is new or was
+    generalised. Template ids are stable hashes of (service_id, template
+    text), so a generalisation gives the template a new id: lines mined
+    before it keep the old id, whose text and params still rebuild them, and
+    a restarted miner that generalises to the same text reuses the same id.
+    Callers that keep the template past the next add() should copy its
+    template_id and template text.
+    """
+
+    def __init__(self, service_id, depth=4, sim_threshold=0.4, max_children=100):
+        self.service_id = service_id
+        self.depth = max(depth, 3)
+        self.sim_threshold = sim_threshold
+        self.max_children = max_children
+        self.root = {}
+        self.templates = {}
+
+    def _leaf(self, masked):
+        node = self.root.setdefault(len(masked), {})
+        for token in masked[:self.depth - 3]:
+            if any(ch.isdigit() for ch in token):
+                token = WILDCARD
+            child = node.get(token)
+            if child is None:
+                if len(node) >= self.max_children:
+                    token = WILDCARD
+                child = node.setdefault(token, {})
+            node = child
+        return node.setdefault(None, [])
+
+    @staticmethod
+    def _similarity(template_tokens, masked):
+        same = params = 0
+        for t, m in zip(template_tokens, masked):
+            if t == WILDCARD:
+                params += 1
+            elif t == m:
+                same += 1
+        return same / len(masked), params
+
+    def add(self, message, level=None):
+        tokens = message.split()
+        if not tokens:
+            return None, [], False
+        masked = [_mask(t) for t in tokens]
+        leaf = self._leaf(masked)
+
+        best, best_key = None, (-1.0, -1)
+        for candidate in leaf:
+            key = self._similarity(candidate.tokens, masked)
+            if key > best_key:
+                best, best_key = candidate, key
+
+        changed = False
+        if best is None or best_key[0] < self.sim_threshold:
+            best = LogTemplate(_stable_id(self.service_id, " ".join(masked)), masked)
+            leaf.append(best)
+            self.templates[best.template_id] = best
+            changed = True
+        else:
+            merged = [t if t == m else WILDCARD for t, m in zip(best.tokens, masked)]
+            if merged != best.tokens:
+                del self.templates[best.template_id]
+                best.tokens = merged
+                best.template_id = _stable_id(self.service_id, best.template)
+                self.templates[best.template_id] = best
+                changed = True
+
+        best.count += 1
+        if level is not None:
+            best.levels[level] = best.levels.get(level, 0) + 1
+
+        params = [tok for tok, t in zip(tokens, best.tokens) if t == WILDCARD]
+        return best, params, changed
+
+    def top(self, n=10, level=None):
+        """Most frequent templates (optionally for one level) from the in-memory counters."""
+        if level is None:
+            key = lambda t: t.count
+        else:
+            key = lambda t: t.levels.get(level, 0)
+        ranked = sorted(self.templates.values(), key=key, reverse=True)[:n]
+        return [(t.template_id, t.template, key(t)) for t in ranked if key(t)]